@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+LCTC Pipeline — benchmark
+Cách dùng:
+  python bench_lctc.py session [--runs N] [URL ...]
+      So sánh chi phí mỗi video: tạo YoutubeDL mới cho từng URL (cách cũ)
+      vs. dùng lại một YDLSession. Không có URL => chỉ đo khởi tạo YoutubeDL + extractor.
+      --captions-only: phiên dùng lại chạy ở chế độ "chỉ phụ đề" (extract_metadata).
+  python bench_lctc.py clean [--cues N] [--repeat R] [FILE.vtt]
+      So sánh tốc độ (dòng/giây) và số dòng đầu ra của clean_subtitles mới với bản cũ
+      trên file VTT lớn (mặc định: sinh VTT kiểu auto-caption YouTube với N cue).
+  python bench_lctc.py startup [--runs N] [--entry cli|gui ...] [--eager]
+      Thời gian khởi động (tiến trình mới tới lúc CLI/GUI dùng được), cold (chưa có bytecode .pyc)
+      và warm (đã có .pyc). --eager: đo thêm kiểu cũ (import yt_dlp + docx ngay lúc nạp) để so sánh.
+"""
+
+import argparse
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from lctc_pipeline_core import DEFAULT_YDL_OPTS, YDLSession, clean_subtitles
+
+
+def _fmt(samples):
+    if not samples:
+        return "n/a"
+    return (f"median {statistics.median(samples) * 1000:8.1f} ms | "
+            f"mean {statistics.fmean(samples) * 1000:8.1f} ms | n={len(samples)}")
+
+
+# ====== session: YoutubeDL mới mỗi URL vs. phiên dùng lại =====
+def bench_session(args):
+    try:
+        import yt_dlp
+    except ImportError:
+        print("Cần cài yt-dlp để chạy benchmark này.", file=sys.stderr)
+        return 1
+
+    urls = list(args.urls)
+    per_url, reused = [], []
+
+    if not urls:
+        # Chỉ đo phần chi phí cố định: YoutubeDL(opts) + khởi tạo extractor YouTube
+        for _ in range(args.runs):
+            t = time.perf_counter()
+            with yt_dlp.YoutubeDL(dict(DEFAULT_YDL_OPTS)) as ydl:
+                ydl.get_info_extractor('Youtube')
+            per_url.append(time.perf_counter() - t)
+        with YDLSession() as session:
+            session.get().get_info_extractor('Youtube')
+            for _ in range(args.runs):
+                t = time.perf_counter()
+                session.get().get_info_extractor('Youtube')
+                reused.append(time.perf_counter() - t)
+    else:
+        for _ in range(args.runs):
+            for url in urls:
+                t = time.perf_counter()
+                with yt_dlp.YoutubeDL(dict(DEFAULT_YDL_OPTS)) as ydl:
+                    ydl.extract_info(url, download=False)
+                per_url.append(time.perf_counter() - t)
+        with YDLSession() as session:
+            for _ in range(args.runs):
+                for url in urls:
+                    t = time.perf_counter()
+                    if args.captions_only:
+                        session.extract_metadata(url, captions_only=True)
+                    else:
+                        session.extract_info(url)
+                    reused.append(time.perf_counter() - t)
+
+    print("YoutubeDL mới mỗi URL :", _fmt(per_url))
+    print("YDLSession dùng lại   :", _fmt(reused), "(chỉ phụ đề)" if args.captions_only else "")
+    if per_url and reused:
+        saved = statistics.median(per_url) - statistics.median(reused)
+        print(f"Tiết kiệm mỗi video   : {saved * 1000:.1f} ms")
+    return 0
+
+
+# ====== clean: clean_subtitles mới vs. bản cũ (5 regex mỗi dòng) =====
+def legacy_clean_subtitles(subtitle_content):
+    """Bản clean_subtitles trước khi viết lại — giữ nguyên để làm mốc so sánh."""
+    if not subtitle_content: return "Không có nội dung phụ đề"
+    out = []
+    for line in subtitle_content.splitlines():
+        line = line.strip()
+        if (not re.match(r'^\d+$', line)
+            and not re.match(r'^\d{2}:\d{2}:\d{2}', line)
+            and not re.match(r'^(WEBVTT|NOTE)', line)
+            and line and line != '--'):
+            line = re.sub(r'<[^>]+>', '', line)
+            line = re.sub(r'&[a-zA-Z]+;', '', line)
+            if line and (not out or out[-1] != line):
+                out.append(line)
+    return "\n".join(out) or "Không thể trích xuất nội dung phụ đề"
+
+
+def _ts(ms):
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}"
+
+
+def make_auto_vtt(cues: int, seed: int = 1) -> str:
+    """
+    VTT giống auto-caption YouTube: mỗi cue hiện lại dòng trước (có khi chỉ phần đuôi, khoảng trắng lệch)
+    + dòng mới có timestamp từng từ, kèm cue chuyển tiếp 10 ms lặp lại dòng vừa xong.
+    """
+    rng = random.Random(seed)
+    vocab = ("xin chào các bạn hôm nay chúng ta sẽ cùng nhau tìm hiểu về lịch sử "
+             "văn hóa &amp; con người việt nam rất thú vị").split()
+    out = ["WEBVTT", "Kind: captions", "Language: vi", ""]
+    prev, t = "", 0
+    for _ in range(cues):
+        words = [rng.choice(vocab) for _ in range(rng.randint(4, 9))]
+        timed = "".join(f"<{_ts(t + 200 * i)}><c> {w}</c>" for i, w in enumerate(words[1:], 1))
+        shown = prev
+        if prev and rng.random() < 0.5:
+            shown = " ".join(prev.split()[-rng.randint(2, 3):]) + "  "  # chỉ còn đuôi dòng trước
+        out += [f"{_ts(t)} --> {_ts(t + 2000)} align:start position:0%", shown, words[0] + timed, ""]
+        out += [f"{_ts(t + 2000)} --> {_ts(t + 2010)} align:start position:0%", " ".join(words) + " ", " ", ""]
+        prev, t = " ".join(words), t + 2010
+    return "\n".join(out)
+
+
+def bench_clean(args):
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            text = f.read()
+    else:
+        text = make_auto_vtt(args.cues)
+    n_lines = text.count("\n") + 1
+    print(f"Đầu vào: {n_lines} dòng, {len(text) / 1e6:.1f} MB")
+
+    for name, func in (("cũ ", legacy_clean_subtitles), ("mới", clean_subtitles)):
+        samples = []
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            out = func(text) if func is legacy_clean_subtitles else func(text, auto=True)
+            samples.append(time.perf_counter() - t)
+        best = min(samples)
+        print(f"clean_subtitles {name}: {n_lines / best:12,.0f} dòng/giây | "
+              f"{best * 1000:8.1f} ms | đầu ra {out.count(chr(10)) + 1} dòng, {len(out) / 1e3:.0f} KB")
+    return 0
+
+
+# ====== startup: thời gian tới lúc CLI/GUI dùng được (tiến trình mới) =====
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+STARTUP_ENTRIES = {
+    # CLI: nạp module là hiện được menu/banner
+    'cli': "import lctc_pipeline_cli",
+    # GUI: dựng xong cửa sổ và vẽ lần đầu
+    'gui': "import lctc_pipeline_gui as g; app = g.LCTCPipelineGUI(); app.root.update(); app.root.destroy()",
+}
+EAGER_IMPORTS = "import yt_dlp, yt_dlp.extractor.youtube, docx; "
+
+
+def _time_process(code, pycache_prefix):
+    # PYTHONPYCACHEPREFIX riêng: thư mục trống = cold (biên dịch lại mọi .py), thư mục đã chạy = warm
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=pycache_prefix,
+               PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get('PYTHONPATH')])))
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    t = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - t
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"exit {proc.returncode}")
+    return elapsed
+
+
+def bench_startup(args):
+    variants = [("lazy", "")]
+    if args.eager:
+        variants.append(("eager", EAGER_IMPORTS))
+    for entry in args.entry:
+        for label, prefix in variants:
+            code = prefix + STARTUP_ENTRIES[entry]
+            cold, warm = [], []
+            try:
+                with tempfile.TemporaryDirectory() as warm_cache:
+                    _time_process(code, warm_cache)  # tạo sẵn .pyc cho warm
+                    for _ in range(args.runs):
+                        with tempfile.TemporaryDirectory() as cold_cache:
+                            cold.append(_time_process(code, cold_cache))
+                        warm.append(_time_process(code, warm_cache))
+            except RuntimeError as e:
+                print(f"{entry:3s} {label:5s}: không đo được ({e})")
+                continue
+            print(f"{entry:3s} {label:5s} cold: {_fmt(cold)}")
+            print(f"{entry:3s} {label:5s} warm: {_fmt(warm)}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LCTC Pipeline benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("session", help="YoutubeDL mới mỗi URL vs. phiên dùng lại")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--captions-only", action="store_true")
+    p.add_argument("urls", nargs="*")
+    p.set_defaults(func=bench_session)
+
+    p = sub.add_parser("clean", help="clean_subtitles mới vs. bản cũ trên VTT lớn")
+    p.add_argument("--cues", type=int, default=50000)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("file", nargs="?")
+    p.set_defaults(func=bench_clean)
+
+    p = sub.add_parser("startup", help="thời gian khởi động cold/warm của CLI và GUI")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--entry", action="append", choices=sorted(STARTUP_ENTRIES))
+    p.add_argument("--eager", action="store_true", help="so sánh với import yt_dlp + docx ngay lúc nạp")
+    p.set_defaults(func=bench_startup)
+
+    args = parser.parse_args(argv)
+    if args.command == "startup" and not args.entry:
+        args.entry = list(STARTUP_ENTRIES)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -28,6 +28,7 @@ pyinstaller ^
   --hidden-import pythoncom ^
   --hidden-import win32com.client ^
   --collect-all yt_dlp ^
+  --collect-all docx ^
   --collect-data certifi ^
   %MAIN%
 
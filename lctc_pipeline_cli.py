@@ -11,19 +11,44 @@ Main features:
 2) Enter start number -> tool automatically calculates end number based on link number
 3) Ask for prefix and zero-padding length (e.g. 3 => <PREFIX>-001)
 4) Generate series <PREFIX>-[start - end] + subfolders + docx file from template (if any)
-5) Extract YouTube subtitles (yt-dlp), merge youtube_results.json (no overwriting)
+   (after extraction the docx files are filled from template.docx: {{title}} {{url}} {{duration}} {{transcript}}...)
+5) Extract YouTube subtitles (yt-dlp, concurrent workers, order preserved), merge youtube_results.json (no overwriting)
 6) Save sub.txt & info.txt into <PREFIX>-<n>/<safe_title>_<videoid>/
+   (subtitle language priority is configurable, e.g. 'vi,vi-VN,en,auto-translated vi'; optionally every
+   language found is saved as sub.<lang>.txt, the tracks of one video being fetched concurrently)
+7) Asyncio API (aprocess_urls / aprocess_urls_keep_order) to embed the extraction step in a job runner
+8) Per-run journal in the destination folder: every result is checkpointed as it completes;
+   an interrupted run can be resumed (prompt, or --resume) and only unfinished work is redone
+9) Headless batch mode for cron/servers (--batch/--urls/--dest ...): no prompts, no tkinter,
+   progress as NDJSON events on stdout (human-readable messages go to stderr)
+10) Steps 4-6 overlap: folders, extraction and writing run as a staged pipeline with bounded queues,
+    so each <PREFIX>-<n> is filled as soon as its video is done
 """
 
+import argparse
+import contextlib
+import functools
 import json
 import os
-import random
 import re
 import shutil
 import subprocess
 import sys
+import threading
 import time
 
+from lctc_pipeline_core import (CAPTION_LANGS, DEFAULT_CONCURRENCY, DOCX, RATE_CONTROLLER, WRITE_FAILED,
+                                WRITE_UNCHANGED, WRITE_WRITTEN, YT_DLP, ExtractionEngine,
+                                RateController, RunJournal, StagedPipeline, YDLSession, caption_error_result,
+                                caption_files, caption_result_matches, clamp_concurrency, deferred_caption_fields,
+                                expand_collection, extract_video_id, fetch_subtitles, fill_template_docs,
+                                find_run_journal, is_collection_url, parse_caption_langs, preload_heavy_imports,
+                                scaffold_folders,
+                                shared_results_index, shared_template, transcript_text, video_result,
+                                write_caption_files, write_text_if_changed)
+# API asyncio (nhúng vào job runner): cài đặt trong lctc_pipeline_core, giữ tên cũ ở đây
+from lctc_pipeline_core import afetch_subtitles, aprocess_urls, aprocess_urls_keep_order  # noqa: F401
+
 # ---- Chặn biến môi trường có thể gây PermissionError (sslkeys) khi tải mạng
 os.environ.pop("SSLKEYLOGFILE", None)
 
@@ -45,6 +70,12 @@ class Colors:
     ENDC = '\033[0m'
     BOLD = '\033[1m'
 
+    @classmethod
+    def disable(cls):
+        """Tắt mã màu ANSI (khi ghi ra file log / cron)."""
+        for name in ('HEADER', 'OKBLUE', 'OKCYAN', 'OKGREEN', 'WARNING', 'FAIL', 'ENDC', 'BOLD'):
+            setattr(cls, name, '')
+
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
@@ -100,8 +131,7 @@ def sanitize(name: str) -> str:
 def _try_create_template_with_word(path: str) -> bool:
     # Ưu tiên tạo chuẩn bằng python-docx; nếu có Word COM sẽ "chuẩn hóa" thêm
     try:
-        from docx import Document
-        doc = Document(); doc.add_paragraph(" "); doc.save(path + ".tmp")
+        doc = DOCX.get().Document(); doc.add_paragraph(" "); doc.save(path + ".tmp")
         try:
             import pythoncom, win32com.client as win32
             pythoncom.CoInitialize()
@@ -131,12 +161,11 @@ def ensure_template():
             print(f"{Colors.OKGREEN}✓ Đã tạo {TEMPLATE}.{Colors.ENDC}")
         else:
             print(f"{Colors.FAIL}✗ Không thể tạo {TEMPLATE}. Sẽ bỏ qua bước tạo .docx mẫu.{Colors.ENDC}")
+    shared_template(TEMPLATE, refresh=True)  # đọc template một lần cho cả lượt tạo folder
 
 def new_blank_docx(dst: str):
-    if os.path.exists(TEMPLATE):
-        shutil.copyfile(TEMPLATE, dst)
-    else:
-        open(dst, 'a', encoding='utf-8').close()
+    # template.docx đọc một lần cho cả lượt (refresh ở ensure_template), không có template => file rỗng
+    shared_template(TEMPLATE).instantiate(dst)
 
 # ====== PREFIX DYNAMIC ======
 DEFAULT_PREFIX = "LCTC"
@@ -146,177 +175,139 @@ def make_name(prefix: str, n: int, pad_width: int = 0) -> str:
         return f"{prefix}-{n:0{pad_width}d}"
     return f"{prefix}-{n}"
 
-def build_range(dest_dir: str, prefix: str, start: int, end: int, pad_width: int = 0):
-    """Tạo <prefix>-start..end + subfolders + docx"""
+def folder_docs(safe: str):
+    """Các file .docx trong mỗi <prefix>-<n>."""
+    return [f"{safe}.docx", "MO TA.docx"]
+
+def fill_folder_docs(lctc_dir: str, name: str, r, transcript: str) -> int:
+    """
+    Điền <prefix>-<n>.docx (tiêu đề, URL, thời lượng, phụ đề) và MO TA.docx (tiêu đề, URL) từ template.docx.
+    Chỉ ghi vào file còn là bản trắng; file đã có người sửa giữ nguyên.
+    """
+    safe = sanitize(name)
+    main_doc, desc_doc = folder_docs(safe)
+    values = {'name': name, 'title': r.get('title', ''), 'url': r.get('url', ''),
+              'video_id': r.get('video_id', ''), 'duration': r.get('duration', 'N/A'), 'transcript': transcript}
+    return fill_template_docs(TEMPLATE, lctc_dir, [(main_doc, 'main'), (desc_doc, 'desc')], values)
+
+def build_range(dest_dir: str, prefix: str, start: int, end: int, pad_width: int = 0, on_folder=None):
+    """
+    Tạo <prefix>-start..end + subfolders + docx (quét dest_dir một lần, tạo phần thiếu song song)
+    on_folder(i, path, created): gọi khi xong thư mục thứ i (i = n - start).
+    """
     ensure_template()
-    total = end - start + 1
-    created = skipped = 0
-    for n in range(start, end + 1):
-        name = make_name(prefix, n, pad_width)
-        safe = sanitize(name)
-        base = os.path.join(dest_dir, safe)
-        if not os.path.exists(base):
-            os.makedirs(base, exist_ok=True); created += 1
-        else:
-            skipped += 1
-        for sf in SUBFOLDERS:
-            os.makedirs(os.path.join(base, sf), exist_ok=True)
-        main_doc = os.path.join(base, f"{safe}.docx")
-        desc_doc = os.path.join(base, "MO TA.docx")
-        if not os.path.exists(main_doc): new_blank_docx(main_doc)
-        if not os.path.exists(desc_doc): new_blank_docx(desc_doc)
-    return total, created, skipped
+    names = [sanitize(make_name(prefix, n, pad_width)) for n in range(start, end + 1)]
+    return scaffold_folders(dest_dir, names, SUBFOLDERS, folder_docs, new_blank_docx, on_folder=on_folder)
 
 # ====== Phần YouTube (kế thừa transcript.py) =====
-def extract_video_id(url):
-    patterns = [
-        r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/)([a-zA-Z0-9_-]{11})',
-        r'youtube\.com\/v\/([a-zA-Z0-9_-]{11})',
-    ]
-    for p in patterns:
-        m = re.search(p, url)
-        if m: return m.group(1)
-    return None
+def expand_url(s, ln=0, on_invalid=None, on_collection=None):
+    """
+    Một dòng input -> danh sách URL video: URL video giữ nguyên; playlist/kênh được liệt kê flat
+    (một request mỗi trang, theo thứ tự playlist). on_collection(ln, url, số video, lỗi hoặc None).
+    """
+    if extract_video_id(s):
+        return [s]
+    if is_collection_url(s):
+        try:
+            found = list(expand_collection(s))
+        except Exception as e:
+            if on_collection: on_collection(ln, s, 0, e)
+            return []
+        if on_collection: on_collection(ln, s, len(found), None)
+        return found
+    if on_invalid: on_invalid(ln, s)
+    return []
+
+def print_collection(ln, url, count, err):
+    if err:
+        print(f"{Colors.FAIL}Dòng {ln}: không liệt kê được playlist/kênh {url}: {err}{Colors.ENDC}")
+    else:
+        print(f"{Colors.OKBLUE}↳ {url}: {count} video{Colors.ENDC}")
 
 def check_yt_dlp():
+    """Kiểm tra (cài nếu thiếu) yt-dlp. Đã sẵn sàng thì trả True ngay, không kiểm tra lại mỗi vòng menu."""
+    if YT_DLP.ready:
+        return True
     print(f"{Colors.OKCYAN}Đang kiểm tra yt-dlp...{Colors.ENDC}")
-    try:
-        import yt_dlp  # noqa
+    if YT_DLP.available:  # chờ luồng nạp nền (preload_heavy_imports) nếu đang chạy
         print(f"{Colors.OKGREEN}✓ yt-dlp đã sẵn sàng{Colors.ENDC}")
         return True
-    except ImportError:
-        if getattr(sys, "frozen", False):
-            print(f"{Colors.FAIL}✗ yt-dlp không được đóng gói kèm theo. Hãy rebuild với tham số PyInstaller đúng.{Colors.ENDC}")
-            return False
-        print(f"{Colors.WARNING}yt-dlp chưa có. Đang cài.{Colors.ENDC}")
-        try:
-            subprocess.check_call([sys.executable, "-m", "pip", "install", "yt-dlp"])
-            print(f"{Colors.OKGREEN}✓ Cài xong yt-dlp{Colors.ENDC}")
-            return True
-        except Exception as e:
-            print(f"{Colors.FAIL}✗ Không thể cài yt-dlp: {e}{Colors.ENDC}")
-            return False
-
-def download_subtitle_content(url):
-    try:
-        import urllib.request, json as _json
-        with urllib.request.urlopen(url) as resp:
-            raw = resp.read().decode('utf-8')
-            s = raw.strip()
-            if s.startswith('{') or s.startswith('['):
-                try:
-                    data = _json.loads(raw)
-                    if isinstance(data, dict) and "events" in data:
-                        lines = []
-                        for ev in data["events"]:
-                            if "segs" in ev:
-                                line = ''.join(seg.get("utf8", "") for seg in ev["segs"]).strip()
-                                if line: lines.append(line)
-                        return "\n".join(lines)
-                    if isinstance(data, list):
-                        lines = [it.get("text","") for it in data if it.get("text","")]
-                        return "\n".join(lines)
-                    return raw
-                except Exception:
-                    return raw
-            return raw
-    except Exception:
-        return ""
-
-def clean_subtitles(subtitle_content):
-    if not subtitle_content: return "Không có nội dung phụ đề"
-    out = []
-    for line in subtitle_content.splitlines():
-        line = line.strip()
-        if (not re.match(r'^\d+$', line)
-            and not re.match(r'^\d{2}:\d{2}:\d{2}', line)
-            and not re.match(r'^(WEBVTT|NOTE)', line)
-            and line and line != '--'):
-            line = re.sub(r'<[^>]+>', '', line)
-            line = re.sub(r'&[a-zA-Z]+;', '', line)
-            if line and (not out or out[-1] != line):
-                out.append(line)
-    return "\n".join(out) or "Không thể trích xuất nội dung phụ đề"
-
-def get_vietnamese_subtitles_direct(info):
+    if getattr(sys, "frozen", False):
+        print(f"{Colors.FAIL}✗ yt-dlp không được đóng gói kèm theo. Hãy rebuild với tham số PyInstaller đúng.{Colors.ENDC}")
+        return False
+    print(f"{Colors.WARNING}yt-dlp chưa có. Đang cài.{Colors.ENDC}")
     try:
-        subs = info.get('subtitles', {}) or {}
-        auto = info.get('automatic_captions', {}) or {}
-        urls = []
-        if 'vi' in subs: urls.append(subs['vi'][0]['url'])
-        if 'vi' in auto: urls.append(auto['vi'][0]['url'])
-        if 'vi-VN' in auto: urls.append(auto['vi-VN'][0]['url'])
-        for u in urls:
-            text = download_subtitle_content(u)
-            if text:
-                return clean_subtitles(text)
-        return "Không có phụ đề tiếng Việt"
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "yt-dlp"])
     except Exception as e:
-        return f"Lỗi khi tải phụ đề: {e}"
-
-def get_video_info(url):
+        print(f"{Colors.FAIL}✗ Không thể cài yt-dlp: {e}{Colors.ENDC}")
+        return False
+    YT_DLP.reset()
+    if not YT_DLP.available:
+        print(f"{Colors.FAIL}✗ Đã cài yt-dlp nhưng không import được: {YT_DLP.error}{Colors.ENDC}")
+        return False
+    print(f"{Colors.OKGREEN}✓ Cài xong yt-dlp{Colors.ENDC}")
+    return True
+
+def get_video_info(url, session=None, captions_only=True, langs=None, all_langs=False, stream_captions=False):
+    """
+    session: YDLSession dùng lại giữa các URL; None => tạo phiên tạm cho riêng URL này.
+    captions_only: chỉ lấy metadata + phụ đề (bỏ qua format), quay về trích xuất đầy đủ khi thiếu phụ đề.
+    langs / all_langs: xem fetch_subtitles.
+    stream_captions: chưa tải phụ đề, chỉ chọn track; write_result stream thẳng ra sub.txt (deferred_caption_fields).
+    """
+    own_session = session is None
+    if own_session:
+        session = YDLSession()
     try:
-        import yt_dlp
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extractaudio': False,
-            'extract_flat': False,
-            'sleep_interval': 20,
-            'max_sleep_interval': 25,
-            'retries': 5,
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            return {
-                'title': info.get('title','Không có tiêu đề'),
-                'video_id': info.get('id','unknown'),
-                'duration': info.get('duration',0),
-                'url': url,
-                'subtitles': get_vietnamese_subtitles_direct(info),
-                'status': 'success'
-            }
+        info, _ = session.extract_metadata(url, captions_only=captions_only)
+        if stream_captions:
+            return video_result(info, url, deferred_caption_fields(info, langs, all_langs))
+        try:
+            fields = fetch_subtitles(info, langs, all_langs)
+        except Exception as e:
+            return caption_error_result(info, url, e)
+        return video_result(info, url, fields)
     except Exception as e:
         return {'url': url, 'status': 'error', 'error': f'Lỗi khi lấy thông tin: {e}'}
+    finally:
+        if own_session:
+            session.close()
 
-def load_existing_index(results_path='youtube_results.json'):
-    if not os.path.exists(results_path): return {}, []
-    try:
-        with open(results_path,'r',encoding='utf-8') as f:
-            data = json.load(f)
-        idx, ordered = {}, []
-        for item in data:
-            vid = item.get('video_id') or extract_video_id(item.get('url','')) or ''
-            if vid and vid not in idx:
-                idx[vid] = item; ordered.append(item)
-        return idx, ordered
-    except Exception:
-        return {}, []
-
-def save_results_merge(new_results, output_file='youtube_results.json'):
-    existing_index, ordered = load_existing_index(output_file)
-    appended = 0
-    for item in new_results:
-        vid = item.get('video_id') or extract_video_id(item.get('url','')) or item.get('url')
-        if not vid:
-            ordered.append(item); appended += 1; continue
-        if vid in existing_index:
-            continue
-        existing_index[vid] = item; ordered.append(item); appended += 1
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(ordered, f, ensure_ascii=False, indent=2)
-    print(f"{Colors.OKGREEN}✓ Gộp kết quả (thêm {appended}) vào youtube_results.json{Colors.ENDC}")
+def _result_key(item):
+    return item.get('video_id') or extract_video_id(item.get('url','')) or item.get('url')
+
+def results_index(results_path='youtube_results.json'):
+    """Kho kết quả dùng chung (cache theo video_id) của tiến trình."""
+    return shared_results_index(results_path, key_func=_result_key)
+
+LEGACY_RESULTS_JSON = 'youtube_results.json'
+
+def maintain_results_store(compact=False, export_path=None, results_path='youtube_results.json'):
+    """
+    Bảo trì kho kết quả: compact = viết lại kho chỉ gồm bản ghi còn hiệu lực;
+    export_path = xuất toàn bộ ra mảng JSON kiểu youtube_results.json cũ (kho vẫn là nguồn chính).
+    Trả về số bản ghi đã xuất (None nếu không xuất).
+    """
+    index = results_index(results_path)
+    if compact:
+        index.compact()
+        print(f"{Colors.OKGREEN}✓ Đã nén {os.path.basename(index.store.path)} ({len(index)} kết quả){Colors.ENDC}")
+    if export_path:
+        count = index.export_legacy_json(export_path)
+        print(f"{Colors.OKGREEN}✓ Đã xuất {count} kết quả ra {export_path}{Colors.ENDC}")
+        return count
+    return None
 
 # ===== Đọc URL (pop-up hoặc nhập tay)
 def read_urls_from_file(file_path):
     urls = []
+    on_invalid = lambda ln, s: print(f"{Colors.WARNING}Dòng {ln}: URL không hợp lệ - {s}{Colors.ENDC}")
     try:
         with open(file_path,'r',encoding='utf-8') as f:
             for ln, line in enumerate(f,1):
                 s = line.strip()
                 if s and not s.startswith('#'):
-                    if extract_video_id(s): urls.append(s)
-                    else: print(f"{Colors.WARNING}Dòng {ln}: URL không hợp lệ - {s}{Colors.ENDC}")
+                    urls.extend(expand_url(s, ln, on_invalid, print_collection))
     except Exception as e:
         print(f"{Colors.FAIL}Lỗi đọc file: {e}{Colors.ENDC}")
         return None
@@ -352,97 +343,113 @@ def safe_title(result_title: str) -> str:
     t = re.sub(INVALID, "_", result_title or "Video").strip()
     return t[:80] if t else "Video"
 
-def process_urls_keep_order(urls):
+def _result_files(idx, r, lctc_dir, mapped):
+    """(thư mục lưu, {tên file: nội dung}) của một kết quả trong <prefix>-<n>."""
+    if r.get('status') != 'success':
+        info = f"URL: {r.get('url')}\nStatus: {r.get('status')}\nError: {r.get('error','')}\n"
+        return os.path.join(lctc_dir, f"ERR_{idx+1:02d}"), {'info.txt': info}
+    title = r.get('title','Video')
+    vid = r.get('video_id','unknown')
+    info = (f"Title: {title}\nVideo ID: {vid}\nURL: {r.get('url')}\n"
+            f"Duration: {r.get('duration','N/A')} seconds\n"
+            f"MappedTo: {mapped}\n")
+    subs = {} if r.get('caption_tracks') else {'sub.txt': r.get('subtitles') or "Không có phụ đề", **caption_files(r)}
+    return os.path.join(lctc_dir, f"{safe_title(title)}_{vid}"), {**subs, 'info.txt': info}
+
+def write_result(idx, r, lctc_dir, name, rate=None):
     """
-    - Nếu URL đã có trong youtube_results.json => lấy lại entry cũ (giữ thứ tự/mapping).
-    - Thêm sleep ngẫu nhiên giữa các video để tránh rate-limit.
+    Ghi một kết quả vào <prefix>-<n> (lctc_dir): sub.txt[, sub.<lang>.txt]/info.txt (nguyên tử, bỏ qua nếu
+    không đổi) + điền docx. Kết quả còn caption_tracks: phụ đề được tải và stream thẳng ra sub.txt ở đây.
+    Trả về (thư mục đã ghi, có thay đổi gì không, kết quả đã có trường phụ đề).
     """
-    existing_index, _ = load_existing_index('youtube_results.json')
-    results = []
-    total = len(urls)
-    print(f"\n{Colors.BOLD}Bắt đầu xử lý {total} video(s).{Colors.ENDC}\n")
-
-    min_sleep = 20
-    max_sleep = 25
-
-    for i, url in enumerate(urls, 1):
-        progress_bar(i-1, total, f"Video {i}")
-        vid = extract_video_id(url)
-        if vid and vid in existing_index:
-            r = existing_index[vid]
-            r.setdefault('url', url)
-            r.setdefault('status', 'success')
-            results.append(r)
-            print(f"\n{Colors.OKCYAN}↷ Dùng lại kết quả đã có: {url}{Colors.ENDC}")
-            time.sleep(0.05)
-        else:
-            r = get_video_info(url)
-            results.append(r)
-            print(f"\n{Colors.OKBLUE}{'OK' if r.get('status')=='success' else 'Lỗi'} - {url}{Colors.ENDC}")
-            time.sleep(0.05)
-
-        if i < total:
-            wait_time = random.randint(min_sleep, max_sleep)
-            print(f"{Colors.WARNING}⏳ Đợi {wait_time} giây trước khi xử lý video tiếp theo.{Colors.ENDC}")
-            time.sleep(wait_time)
-
-    progress_bar(total, total, "Hoàn thành"); print()
-    return results
+    folder, files = _result_files(idx, r, lctc_dir, name)
+    os.makedirs(folder, exist_ok=True)
+    written = []
+    if r.get('caption_tracks'):
+        r, changed = write_caption_files(r, folder, rate=rate)
+        written.append(changed)
+    written += [write_text_if_changed(os.path.join(folder, fn), text) for fn, text in files.items()]
+    if r.get('status') == 'success':
+        try:
+            written.append(fill_folder_docs(lctc_dir, name, r, transcript_text(r)) > 0)
+        except OSError as e:
+            print(f"{Colors.WARNING}⚠ Không điền được .docx trong {lctc_dir}: {e}{Colors.ENDC}")
+    return folder, any(written), r
 
-def assign_results_to_lctc(results, dest_dir, prefix, start_num, pad_width: int = 0):
+def run_lctc_pipeline(urls, dest_dir, prefix, start, pad_width, concurrency, journal, rate=None,
+                      on_folder=None, on_result=None, on_wait=None, on_written=None, langs=None, all_langs=False):
     """
-    Map tuần tự:
-      #1 -> <prefix>-start
-      #2 -> <prefix>-(start+1)
-      ...
-    Lưu: <prefix>-<n>/<safe_title>_<videoid>/{sub.txt, info.txt}
+    Dựng thư mục -> trích phụ đề -> ghi vào <prefix>-<n> CHỒNG LÊN NHAU (StagedPipeline):
+    mỗi video được ghi ngay khi xong, không chờ cả danh sách; kết quả đầy đủ không giữ lại trong bộ nhớ.
+    - journal (RunJournal): giai đoạn/kết quả/video đã ghi của lượt dở được bỏ qua; kết quả đã tải
+      nhưng chưa ghi được ghi trước tiên.
+    - Phụ đề được tải ở giai đoạn ghi và stream thẳng ra sub.txt; kết quả chỉ giữ phần đầu (SUBTITLE_PREVIEW_CHARS).
+    - Mỗi kết quả mới được ghi thêm vào kho youtube_results ngay khi ghi xong sub.txt.
+    - langs / all_langs: ngôn ngữ phụ đề (xem fetch_subtitles).
+    Callback (idx = vị trí trong urls): on_folder(idx, path, created), on_result(idx, url, r, cached),
+    on_wait(idx, url, delay, reason), on_written(idx, trạng thái, thư mục, lỗi).
+    Trả về {'written','unchanged','failed','missing','errors','folders': (tổng, mới, có sẵn) | None}.
     """
-    assigned = 0
-    for idx, r in enumerate(results):
-        n = start_num + idx
-        lctc_dir = os.path.join(dest_dir, make_name(prefix, n, pad_width))
+    rate = rate or RATE_CONTROLLER
+    end = start + len(urls) - 1
+    store = results_index()
+    todo = [] if journal.stage_done('fetched') else journal.pending()
+    backlog = [(i, r) for i, r in sorted(journal.results.items()) if r and i not in journal.assigned]
+    folders_done = {}  # idx -> thư mục đã ghi (chỉ để báo cáo)
+    folder_counts = []
+
+    def scaffold(mark_ready):
+        def folder_ready(i, path, created):
+            mark_ready(i, path, created)
+            if on_folder: on_folder(i, path, created)
+        folder_counts.append(build_range(dest_dir, prefix, start, end, pad_width, on_folder=folder_ready))
+
+    def engine_result(pos, url, r, cached):
+        idx = todo[pos]
+        deferred = bool(r.get('caption_tracks'))  # phụ đề chưa tải: lưu kho sau khi ghi (write)
+        if not cached and not deferred and r.get('status') == 'success':  # lỗi (429...) không lưu: lượt sau tải lại
+            store.add(r, replace=True)  # thay bản cũ khác yêu cầu ngôn ngữ (accept_cached)
+        key = _result_key(r)
+        # có trong kho: nhật ký chỉ ghi tham chiếu
+        journal.record_result(idx, r, stored_key=key if not deferred and key in store else None)
+        if on_result: on_result(idx, url, r, cached)
+
+    def engine_wait(pos, url, delay, reason):
+        if on_wait: on_wait(todo[pos], url, delay, reason)
+
+    def write(idx, r):
+        name = make_name(prefix, start + idx, pad_width)
+        lctc_dir = os.path.join(dest_dir, name)
         if not os.path.isdir(lctc_dir):
-            print(f"{Colors.WARNING}⚠ Thiếu folder {lctc_dir} (bỏ qua).{Colors.ENDC}")
-            continue
-
-        target_base = lctc_dir
-
-        if r.get('status') != 'success':
-            folder = os.path.join(target_base, f"ERR_{idx+1:02d}")
-            os.makedirs(folder, exist_ok=True)
-            with open(os.path.join(folder,'info.txt'),'w',encoding='utf-8') as f:
-                f.write(f"URL: {r.get('url')}\n")
-                f.write(f"Status: {r.get('status')}\n")
-                f.write(f"Error: {r.get('error','')}\n")
-            print(f"{Colors.WARNING}↷ Ghi chú lỗi vào {folder}{Colors.ENDC}")
-            continue
-
-        title = r.get('title','Video')
-        vid = r.get('video_id','unknown')
-        sub = r.get('subtitles') or "Không có phụ đề"
-        safe = safe_title(title)
-
-        folder = os.path.join(target_base, f"{safe}_{vid}")
-        os.makedirs(folder, exist_ok=True)
-
-        sub_path = os.path.join(folder, 'sub.txt')
-        info_path = os.path.join(folder, 'info.txt')
-
-        if os.path.exists(sub_path) and os.path.exists(info_path):
-            print(f"{Colors.OKCYAN}↷ Bỏ qua (đã tồn tại): {folder}{Colors.ENDC}")
-            continue
-
-        with open(sub_path,'w',encoding='utf-8') as f:
-            f.write(sub)
-        with open(info_path,'w',encoding='utf-8') as f:
-            f.write(f"Title: {title}\nVideo ID: {vid}\nURL: {r.get('url')}\n")
-            f.write(f"Duration: {r.get('duration','N/A')} seconds\n")
-            f.write(f"MappedTo: {make_name(prefix, n, pad_width)}\n")
-
-        assigned += 1
-        print(f"{Colors.OKGREEN}✓ Lưu vào: {folder}{Colors.ENDC}")
-
-    print(f"{Colors.OKGREEN if assigned else Colors.WARNING}→ Đã gán {assigned}/{len(results)} video vào {prefix}-*.{Colors.ENDC}")
+            raise FileNotFoundError(f"Thiếu folder {lctc_dir}")
+        deferred = bool(r.get('caption_tracks'))
+        folders_done[idx], changed, r = write_result(idx, r, lctc_dir, name, rate=rate)
+        if deferred and r.get('status') == 'success':
+            store.add(r, replace=True)
+            journal.record_result(idx, r, stored_key=_result_key(r))  # thay bản chưa tải phụ đề trong nhật ký
+        return changed
+
+    def written(idx, status, err):
+        if status in (WRITE_WRITTEN, WRITE_UNCHANGED):
+            journal.mark_assigned(idx)
+        if on_written: on_written(idx, status, folders_done.pop(idx, None), err)
+
+    fetch = functools.partial(get_video_info, langs=langs, all_langs=all_langs, stream_captions=True)
+    engine = ExtractionEngine(fetch, concurrency=concurrency, rate=rate,
+                              on_result=engine_result, on_wait=engine_wait,
+                              id_func=extract_video_id, session_factory=YDLSession, keep_results=False,
+                              accept_cached=lambda r: caption_result_matches(r, langs, all_langs))
+    pipeline = StagedPipeline(engine, write, None if journal.stage_done('folders') else scaffold,
+                              on_written=written)
+    pipeline.run(urls, todo, store, backlog)
+    if pipeline.scaffold_error:
+        raise pipeline.scaffold_error
+    journal.mark_stage('folders')
+    if not engine.stopped():
+        journal.mark_stage('fetched')
+    summary = dict(pipeline.summary, folders=folder_counts[0] if folder_counts else None)
+    summary['errors'] = sum(1 for r in journal.results.values() if r and r.get('status') != 'success')
+    return summary
 
 # ===== Menu
 def display_menu():
@@ -450,11 +457,14 @@ def display_menu():
 {Colors.BOLD}Chọn một tùy chọn:{Colors.ENDC}
 {Colors.OKGREEN}1.{Colors.ENDC} Chọn file .txt chứa danh sách URL (MỞ POP-UP)
 {Colors.OKGREEN}2.{Colors.ENDC} Nhập URL trực tiếp
-{Colors.OKGREEN}3.{Colors.ENDC} Thoát
+{Colors.OKGREEN}3.{Colors.ENDC} Nén kho kết quả & xuất youtube_results.json (định dạng cũ)
+{Colors.OKGREEN}4.{Colors.ENDC} Thoát
 
-{Colors.OKCYAN}Nhập lựa chọn (1-3): {Colors.ENDC}""", end="")
+{Colors.OKCYAN}Nhập lựa chọn (1-4): {Colors.ENDC}""", end="")
 
-def main():
+def main(resume=False):
+    """resume=True (--resume): tự tiếp tục lượt chạy dở nếu có nhật ký khớp danh sách URL + tham số."""
+    preload_heavy_imports()  # menu hiện ngay, yt_dlp/python-docx nạp nền trong lúc người dùng chọn
     while True:
         clear_screen(); print_banner()
 
@@ -505,7 +515,7 @@ def main():
 
             candidates = re.split(r'[,\s]+', raw_text)
 
-            urls = [u for u in candidates if extract_video_id(u)]
+            urls = [u for c in candidates if c for u in expand_url(c, on_collection=print_collection)]
 
             if not urls:
                 input(f"\n{Colors.FAIL}Không có URL hợp lệ. Enter để quay lại...{Colors.ENDC}")
@@ -514,6 +524,15 @@ def main():
 
 
         elif choice == '3':
+            clear_screen(); print_banner()
+            try:
+                maintain_results_store(compact=True, export_path=LEGACY_RESULTS_JSON)
+            except Exception as e:
+                print(f"{Colors.FAIL}✗ Lỗi khi nén/xuất kho kết quả: {e}{Colors.ENDC}")
+            input(f"\n{Colors.OKCYAN}Enter để quay lại menu...{Colors.ENDC}")
+            continue
+
+        elif choice == '4':
             print(f"\n{Colors.OKGREEN}Tạm biệt!{Colors.ENDC}")
             break
 
@@ -542,28 +561,290 @@ def main():
         except Exception:
             pad_width = default_width
 
+        raw = input(f"{Colors.OKCYAN}Số video xử lý song song [Enter = {DEFAULT_CONCURRENCY}]: {Colors.ENDC}").strip()
+        concurrency = clamp_concurrency(raw) if raw else DEFAULT_CONCURRENCY
+
+        # ===== Ngôn ngữ phụ đề (thứ tự ưu tiên) + có lưu mọi ngôn ngữ không
+        while True:
+            raw = input(f"{Colors.OKCYAN}Ngôn ngữ phụ đề theo thứ tự ưu tiên [Enter = {CAPTION_LANGS}]: "
+                        f"{Colors.ENDC}").strip()
+            try:
+                langs = ",".join(e.label for e in parse_caption_langs(raw or CAPTION_LANGS))
+                break
+            except ValueError as e:
+                print(f"{Colors.FAIL}{e}{Colors.ENDC}")
+        all_langs = input(f"{Colors.OKCYAN}Lưu mọi ngôn ngữ tìm được (sub.<lang>.txt)? (y/N): "
+                          f"{Colors.ENDC}").strip().lower() in ('y', 'yes', 'c', 'có')
+
         dest = choose_directory_topmost(f"Chọn nơi lưu các {prefix}-*")
         if not dest:
             input(f"\n{Colors.FAIL}Bạn đã hủy chọn nơi lưu. Enter để quay lại...{Colors.ENDC}")
             continue
 
-        # ===== 1) TẠO FOLDER TRƯỚC
-        print(f"\n{Colors.OKBLUE}Đang tạo thư mục {make_name(prefix,start,pad_width)} .. {make_name(prefix,end,pad_width)} ...{Colors.ENDC}")
-        total, created, skipped = build_range(dest, prefix, start, end, pad_width)
-        print(f"{Colors.OKGREEN}✓ Hoàn tất tạo folder (tổng {total}, mới {created}, tồn tại {skipped}).{Colors.ENDC}")
+        # ===== Nhật ký lượt chạy: tiếp tục lượt dở (nếu có)
+        params = {'prefix': prefix, 'start': start, 'pad_width': pad_width}
+        cont = False
+        if find_run_journal(dest, params, urls):
+            cont = resume or input(f"{Colors.OKCYAN}Tìm thấy lượt chạy dở cho danh sách này. "
+                                   f"Tiếp tục? (Y/n): {Colors.ENDC}").strip().lower() not in ('n', 'no', 'k', 'không')
+        journal = RunJournal(dest, params, urls, resume=cont, store=results_index())
+        if journal.resumed:
+            print(f"{Colors.OKCYAN}↷ Tiếp tục lượt dở: {journal.summary()}.{Colors.ENDC}")
+
+        # ===== Dựng folder, trích phụ đề và gán vào <prefix>-<n> chồng lên nhau:
+        # mỗi video được ghi vào folder của nó ngay khi xong
+        total = len(urls)
+        if journal.stage_done('folders'):
+            print(f"\n{Colors.OKCYAN}↷ Bỏ qua tạo thư mục (đã xong ở lượt trước).{Colors.ENDC}")
+        else:
+            print(f"\n{Colors.OKBLUE}Đang tạo thư mục {make_name(prefix,start,pad_width)} .. {make_name(prefix,end,pad_width)} "
+                  f"(song song với việc trích phụ đề) ...{Colors.ENDC}")
+        todo = 0 if journal.stage_done('fetched') else len(journal.pending())
+        if todo < total:
+            print(f"\n{Colors.OKCYAN}↷ Tiếp tục lượt dở: {total - todo}/{total} video đã có kết quả.{Colors.ENDC}")
+        print(f"\n{Colors.BOLD}Bắt đầu xử lý {todo} video(s) với {concurrency} luồng.{Colors.ENDC}")
+        print(f"{Colors.OKCYAN}Ngôn ngữ phụ đề: {langs}{' (lưu mọi ngôn ngữ)' if all_langs else ''}{Colors.ENDC}\n")
+        done = [total - todo]
+
+        def on_result(idx, url, r, cached):
+            done[0] += 1
+            if cached:
+                print(f"\n{Colors.OKCYAN}↷ Dùng lại kết quả đã có: {url}{Colors.ENDC}")
+            else:
+                print(f"\n{Colors.OKBLUE}{'OK' if r.get('status')=='success' else 'Lỗi'} - {url}{Colors.ENDC}")
+            progress_bar(done[0], total, f"Video {idx+1} | {RATE_CONTROLLER.describe()}")
+
+        def on_wait(idx, url, delay, reason):
+            why = "YouTube báo quá tải (429/5xx)" if reason == 'cooldown' else "giữ nhịp"
+            print(f"\n{Colors.WARNING}⏳ Đợi {delay:.0f} giây ({why}) trước khi xử lý video {idx+1}.{Colors.ENDC}")
+
+        def on_written(idx, status, folder, err):
+            if status == WRITE_FAILED or status == 'missing':
+                print(f"\n{Colors.FAIL}✗ Lỗi ghi video {idx+1}: {err}{Colors.ENDC}")
+            elif status == WRITE_UNCHANGED:
+                print(f"\n{Colors.OKCYAN}↷ Không đổi: {folder}{Colors.ENDC}")
+            elif os.path.basename(folder).startswith('ERR_'):
+                print(f"\n{Colors.WARNING}↷ Ghi chú lỗi vào {folder}{Colors.ENDC}")
+            else:
+                print(f"\n{Colors.OKGREEN}✓ Lưu vào: {folder}{Colors.ENDC}")
+
+        progress_bar(done[0], total, "Bắt đầu")
+        written = run_lctc_pipeline(urls, dest, prefix, start, pad_width, concurrency, journal,
+                                    on_result=on_result, on_wait=on_wait, on_written=on_written,
+                                    langs=langs, all_langs=all_langs)
+        progress_bar(total, total, "Hoàn thành"); print()
+        if written['folders']:
+            total_f, created, skipped = written['folders']
+            print(f"{Colors.OKGREEN}✓ Hoàn tất tạo folder (tổng {total_f}, mới {created}, tồn tại {skipped}).{Colors.ENDC}")
+        failed = written['failed'] + written['missing']
+        color = Colors.FAIL if failed else (Colors.OKGREEN if written['written'] else Colors.WARNING)
+        print(f"{color}→ Gán vào {prefix}-*: ghi {written['written']}, không đổi {written['unchanged']}, "
+              f"lỗi {failed}; video trích xuất lỗi {written['errors']}.{Colors.ENDC}")
+        if failed:
+            journal.close()
+            print(f"{Colors.WARNING}Còn video chưa gán được — chạy lại cùng danh sách để tiếp tục.{Colors.ENDC}")
+        else:
+            journal.mark_stage('assigned')
+            journal.finish()
 
-        # ===== 2) TRÍCH PHỤ ĐỀ (giữ thứ tự & tái dụng kết quả cũ)
-        results = process_urls_keep_order(urls)
-        save_results_merge(results)
+        input(f"\n{Colors.OKCYAN}Xong! Nhấn Enter để quay lại menu...{Colors.ENDC}")
 
-        # ===== 3) GÁN SUB VÀO TỪNG <prefix>-<n>
-        print(f"\n{Colors.OKBLUE}Đang gán phụ đề vào từng {make_name(prefix,start,pad_width)} .. {make_name(prefix,end,pad_width)}{Colors.ENDC}")
-        assign_results_to_lctc(results, dest, prefix, start, pad_width)
+# ===== Chế độ headless (cron / server): không input(), không tkinter, tiến trình dạng NDJSON
+_EVENT_LOCK = threading.Lock()
 
-        input(f"\n{Colors.OKCYAN}Xong! Nhấn Enter để quay lại menu...{Colors.ENDC}")
+def emit_event(event, stream=None, **fields):
+    """Một sự kiện = một dòng JSON trên stdout: {"event": ..., "ts": ..., ...}."""
+    line = json.dumps({'event': event, 'ts': round(time.time(), 3), **fields}, ensure_ascii=False)
+    stream = stream or sys.stdout
+    with _EVENT_LOCK:
+        stream.write(line + "\n")
+        stream.flush()
+
+def read_urls_from_stream(stream, on_invalid=None, on_collection=None):
+    """Như read_urls_from_file nhưng đọc từ stream bất kỳ (file đã mở / stdin), không in gì ra stdout."""
+    urls = []
+    for ln, line in enumerate(stream, 1):
+        s = line.strip()
+        if s and not s.startswith('#'):
+            urls.extend(expand_url(s, ln, on_invalid, on_collection))
+    return urls
+
+def rate_controller_from_args(args):
+    """--rate/--min-rate/--max-rate tính bằng video/phút; None => dùng RATE_CONTROLLER mặc định."""
+    if all(v is None for v in (args.rate, args.min_rate, args.max_rate, args.burst, args.cooldown)):
+        return RATE_CONTROLLER
+    defaults = RateController()
+    per_sec = lambda v, d: d if v is None else max(v, 0.01) / 60.0
+    return RateController(rate=per_sec(args.rate, defaults.rate),
+                          min_rate=per_sec(args.min_rate, defaults.min_rate),
+                          max_rate=per_sec(args.max_rate, defaults.max_rate),
+                          burst=defaults.burst if args.burst is None else args.burst,
+                          cooldown=defaults.base_cooldown if args.cooldown is None else args.cooldown)
+
+def run_batch(args):
+    """
+    Chạy trọn pipeline (tạo folder -> trích phụ đề -> gán) không tương tác.
+    stdout chỉ chứa sự kiện NDJSON; thông báo dạng chữ (nếu có) đi ra stderr.
+    Mã thoát: 0 = xong, 1 = xong nhưng có video lỗi / ghi file lỗi, 2 = tham số/môi trường sai, 130 = bị ngắt.
+    """
+    preload_heavy_imports()  # nạp nền trong lúc đọc danh sách URL
+    out = sys.stdout
+    emit = lambda event, **fields: emit_event(event, stream=out, **fields)
+    if not sys.stderr.isatty():
+        Colors.disable()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        on_invalid = lambda ln, s: emit('invalid_url', line=ln, url=s)
+        on_collection = lambda ln, s, count, err: emit('playlist', line=ln, url=s, videos=count,
+                                                       error=str(err) if err else None)
+        try:
+            if args.urls in (None, '-'):
+                urls = read_urls_from_stream(sys.stdin, on_invalid, on_collection)
+            else:
+                with open(args.urls, 'r', encoding='utf-8') as f:
+                    urls = read_urls_from_stream(f, on_invalid, on_collection)
+        except OSError as e:
+            emit('error', message=f"Lỗi đọc file URL: {e}")
+            return 2
+        urls += [u for s in args.url for u in expand_url(s, 0, on_invalid, on_collection)]
+        if not urls:
+            emit('error', message="Không có URL hợp lệ")
+            return 2
+        if not os.path.isdir(args.dest):
+            emit('error', message=f"Thư mục đích không tồn tại: {args.dest}")
+            return 2
+        if not check_yt_dlp():
+            emit('error', message="Thiếu yt-dlp")
+            return 2
+
+        prefix, start = args.prefix, args.start
+        end = start + len(urls) - 1
+        pad_width = max(1, len(str(end))) if args.pad is None else max(0, args.pad)
+        concurrency = clamp_concurrency(args.concurrency)
+        rate = rate_controller_from_args(args)
+        try:
+            langs = ",".join(e.label for e in parse_caption_langs(args.langs or CAPTION_LANGS))
+        except ValueError as e:
+            emit('error', message=str(e))
+            return 2
+        t0 = time.monotonic()
+
+        params = {'prefix': prefix, 'start': start, 'pad_width': pad_width}
+        journal = RunJournal(args.dest, params, urls, resume=args.resume, store=results_index())
+        emit('start', total=len(urls), prefix=prefix, start=start, end=end, pad_width=pad_width,
+             dest=os.path.abspath(args.dest), concurrency=concurrency, langs=langs, all_langs=args.all_langs,
+             journal=journal.path,
+             resumed=journal.resumed, results_done=len(journal.results))
+        try:
+            # Folder, trích phụ đề, gán vào <prefix>-<n>: chạy chồng lên nhau, mỗi video ghi ngay khi xong
+            todo = 0 if journal.stage_done('fetched') else len(journal.pending())
+            emit('stage', stage='folders', status='skipped' if journal.stage_done('folders') else 'start')
+            emit('stage', stage='fetch', status='start' if todo else 'skipped', pending=todo)
+            emit('stage', stage='assign', status='start')
+            done = [len(urls) - todo]
+
+            def on_result(idx, url, r, cached):
+                done[0] += 1
+                emit('result', index=idx, url=url, video_id=r.get('video_id') or extract_video_id(url),
+                     status=r.get('status'), cached=cached, error=r.get('error'),
+                     subtitle_format=r.get('subtitle_format'), subtitle_lang=r.get('subtitle_lang'),
+                     done=done[0], total=len(urls), rate_per_min=round(rate.rate * 60, 2))
+
+            def on_wait(idx, url, delay, reason):
+                emit('wait', index=idx, url=url, delay=round(delay, 1), reason=reason)
+
+            def on_written(idx, status, folder, err):
+                r = journal.results.get(idx) or {}  # phụ đề tải ở giai đoạn ghi: ngôn ngữ/định dạng có từ đây
+                emit('assign', index=idx, state=status, folder=folder, error=str(err) if err else None,
+                     subtitle_format=r.get('subtitle_format'), subtitle_lang=r.get('subtitle_lang'))
+
+            written = run_lctc_pipeline(urls, args.dest, prefix, start, pad_width, concurrency, journal, rate,
+                                        on_result=on_result, on_wait=on_wait, on_written=on_written,
+                                        langs=langs, all_langs=args.all_langs)
+            if written['folders']:
+                total, created, skipped = written['folders']
+                emit('stage', stage='folders', status='done', total=total, created=created, existing=skipped)
+            errors = written['errors']
+            emit('stage', stage='fetch', status='done', success=len(urls) - errors, errors=errors)
+            failed = written['failed'] + written['missing']
+            if failed:
+                journal.close()  # giữ nhật ký: chạy lại với --resume để gán nốt
+            else:
+                journal.mark_stage('assigned')
+                journal.finish()
+            emit('stage', stage='assign', status='done', written=written['written'], unchanged=written['unchanged'],
+                 failed=written['failed'], missing=written['missing'])
+        except KeyboardInterrupt:
+            journal.close()
+            emit('cancelled', journal=journal.path, results_done=len(journal.results))
+            return 130
+        except Exception as e:
+            journal.close()
+            emit('error', message=str(e), journal=journal.path)
+            return 2
+
+        store_failed = False
+        if args.compact or args.export_json:
+            try:
+                exported = maintain_results_store(args.compact, args.export_json)
+                emit('results_store', compacted=args.compact, exported=exported, path=args.export_json)
+            except Exception as e:
+                emit('results_store', error=str(e))
+                store_failed = True
+
+        emit('done', total=len(urls), success=len(urls) - errors, errors=errors,
+             written=written['written'], unchanged=written['unchanged'], write_failed=failed,
+             elapsed=round(time.monotonic() - t0, 1))
+        return 1 if errors or failed or store_failed else 0
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="LCTC Pipeline CLI. Không tham số: menu tương tác. "
+                    "Có --batch (hoặc --urls/--dest): chạy không tương tác, tiến trình in ra stdout dạng NDJSON.")
+    parser.add_argument("--resume", action="store_true",
+                        help="tự tiếp tục lượt chạy dở (nhật ký .lctc-run-*.jsonl trong thư mục đích)")
+    batch = parser.add_argument_group("chế độ batch (cron / server)")
+    batch.add_argument("--batch", action="store_true", help="chạy không tương tác")
+    batch.add_argument("--urls", metavar="FILE", help="file .txt chứa URL (mỗi dòng một URL); '-' hoặc bỏ trống = stdin")
+    batch.add_argument("url", nargs="*", help="thêm URL trực tiếp (sau các URL trong file)")
+    batch.add_argument("--prefix", default=DEFAULT_PREFIX, help=f"tiền tố thư mục (mặc định {DEFAULT_PREFIX})")
+    batch.add_argument("--start", type=int, help="số bắt đầu cho <prefix>-* (bắt buộc)")
+    batch.add_argument("--pad", type=int, help="số chữ số padding (mặc định theo số cuối)")
+    batch.add_argument("--dest", help="thư mục đích (bắt buộc)")
+    batch.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                       help=f"số video xử lý song song (mặc định {DEFAULT_CONCURRENCY})")
+    batch.add_argument("--langs", help="ngôn ngữ phụ đề theo thứ tự ưu tiên, vd 'vi,vi-VN,en,auto-translated vi' "
+                                       f"(mặc định {CAPTION_LANGS}; biến môi trường LCTC_SUB_LANGS)")
+    batch.add_argument("--all-langs", action="store_true",
+                       help="lưu mọi ngôn ngữ tìm được (sub.<lang>.txt), tải song song; sub.txt vẫn là ngôn ngữ ưu tiên nhất")
+    store = parser.add_argument_group("kho kết quả (youtube_results.jsonl / .sqlite3)")
+    store.add_argument("--compact", action="store_true", help="nén kho: chỉ giữ bản ghi còn hiệu lực")
+    store.add_argument("--export-json", nargs="?", const=LEGACY_RESULTS_JSON, metavar="FILE",
+                       help=f"xuất kho ra mảng JSON kiểu cũ (mặc định {LEGACY_RESULTS_JSON}); "
+                            "dùng kèm --batch thì chạy sau khi xong lượt")
+    pacing = parser.add_argument_group("nhịp gửi request (video/phút)")
+    pacing.add_argument("--rate", type=float, help="tốc độ khởi đầu")
+    pacing.add_argument("--min-rate", type=float, help="tốc độ thấp nhất khi bị 429")
+    pacing.add_argument("--max-rate", type=float, help="tốc độ cao nhất")
+    pacing.add_argument("--burst", type=float, help="số request được dồn liên tiếp")
+    pacing.add_argument("--cooldown", type=float, help="số giây tạm nghỉ sau 429 đầu tiên")
+    return parser
 
 if __name__ == "__main__":
+    parser = build_arg_parser()
+    args = parser.parse_args()
+    if args.batch or args.urls or args.dest or args.url:
+        if args.start is None or not args.dest:
+            parser.error("chế độ batch cần --start và --dest")
+        sys.exit(run_batch(args))
+    if args.compact or args.export_json:
+        try:
+            maintain_results_store(args.compact, args.export_json)
+        except Exception as e:
+            print(f"{Colors.FAIL}✗ Lỗi khi nén/xuất kho kết quả: {e}{Colors.ENDC}", file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0)
     try:
-        main()
+        main(resume=args.resume)
     except KeyboardInterrupt:
         print(f"\n{Colors.WARNING}Đã hủy bởi người dùng.{Colors.ENDC}")
\ No newline at end of file
@@ -0,0 +1,3349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+LCTC Pipeline core — shared by the CLI (lctc_pipeline_cli.py) and the GUI (lctc_pipeline_gui.py)
+
+Provides:
+- URL parsing (video id, playlist/channel expansion) and the ordered URL list
+- yt-dlp sessions, the parallel ExtractionEngine, the asyncio API (aprocess_urls) and the staged pipeline
+  (folders -> extraction -> writes), all paced by one shared rate controller
+- caption download and streaming parsers (json3 / srv3 / VTT), language priority and cleaning
+- the indexed results store (JSONL or SQLite) and the per-run journal used to resume interrupted runs
+- folder scaffolding, template.docx copying/filling and atomic result writes
+- lazy imports, GUI log sink and progress bus
+"""
+
+import abc
+import asyncio
+import atexit
+import base64
+import codecs
+import functools
+import hashlib
+import html
+import http.client
+import importlib
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import ssl
+import struct
+import threading
+import time
+import urllib.parse
+import urllib.request
+import zipfile
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from xml.etree import ElementTree
+
+# ====== Module nặng (yt_dlp, docx): nạp nền, chỉ chờ khi thật sự cần =====
+class LazyImport:
+    """
+    preload(): bắt đầu import trong luồng nền và trả về ngay (UI/menu dùng được liền).
+    get(): chờ import xong (tự import nếu chưa preload) và trả về module; None nếu không có module.
+    warm: các module con nạp kèm trong nền (vd extractor YouTube của yt-dlp).
+    """
+
+    def __init__(self, name: str, warm: Iterable[str] = ()):
+        self.name = name
+        self.warm = tuple(warm)
+        self.error: Optional[BaseException] = None
+        self.load_time: Optional[float] = None
+        self._module = None
+        self._thread: Optional[threading.Thread] = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        t = time.perf_counter()
+        try:
+            module = importlib.import_module(self.name)
+            for sub in self.warm:
+                try:
+                    importlib.import_module(sub)
+                except Exception:
+                    pass
+            self._module = module
+        except Exception as e:
+            self.error = e
+        finally:
+            self.load_time = time.perf_counter() - t
+            self._done.set()
+
+    def preload(self) -> 'LazyImport':
+        with self._lock:
+            if self._thread is None and not self._done.is_set():
+                self._thread = threading.Thread(target=self._load, name=f"preload-{self.name}", daemon=True)
+                self._thread.start()
+        return self
+
+    def get(self):
+        with self._lock:
+            load_here = self._thread is None and not self._done.is_set()
+            if load_here:
+                self._thread = threading.current_thread()
+        if load_here:
+            self._load()
+        self._done.wait()
+        return self._module
+
+    @property
+    def available(self) -> bool:
+        return self.get() is not None
+
+    @property
+    def ready(self) -> bool:
+        """Đã nạp xong và thành công (không chờ)."""
+        return self._done.is_set() and self._module is not None
+
+    def reset(self):
+        """Cho phép import lại (vd sau khi vừa pip install)."""
+        with self._lock:
+            if self._done.is_set():
+                self._done.clear()
+                self._thread = None
+                self._module = None
+                self.error = None
+                importlib.invalidate_caches()
+
+
+YT_DLP = LazyImport('yt_dlp', warm=('yt_dlp.extractor.youtube',))
+DOCX = LazyImport('docx')
+
+
+def preload_heavy_imports():
+    """Nạp yt_dlp + python-docx trong nền; gọi lúc khởi động, sau khi UI/menu đã sẵn sàng."""
+    YT_DLP.preload()
+    DOCX.preload()
+
+
+# ====== Điều tốc: token bucket + AIMD =====
+# Chỉ khớp mã trạng thái thật ('HTTP Error 503: ...'), không khớp số 429 bất kỳ trong URL / id / thông báo
+_HTTP_CODE_RE = re.compile(r'HTTP Error (\d{3})|Too Many Requests', re.IGNORECASE)
+
+
+def classify_error(err) -> Optional[str]:
+    """
+    Phân loại lỗi mạng: 'throttle' (429), 'server' (5xx) hoặc None.
+    Nhận exception (HTTPError có .code / .status) hoặc chuỗi lỗi của yt-dlp.
+    """
+    if err is None:
+        return None
+    code = getattr(err, 'code', None) or getattr(err, 'status', None)
+    if not isinstance(code, int):
+        m = _HTTP_CODE_RE.search(str(err))
+        if not m:
+            return None
+        code = int(m.group(1) or 429)
+    if code == 429:
+        return 'throttle'
+    if 500 <= code < 600:
+        return 'server'
+    return None
+
+
+class RateController:
+    """
+    Token bucket + AIMD dùng chung cho mọi request tới YouTube.
+    - acquire(): chờ tới khi có token và không trong thời gian cooldown.
+    - on_success(): tăng tốc cộng dần (additive increase).
+    - on_throttle() (429): giảm tốc theo cấp số nhân + cooldown tăng dần nếu 429 liên tiếp.
+    - on_server_error() (5xx): giảm nhẹ hơn + cooldown ngắn.
+    Tốc độ tính bằng request/giây.
+    """
+
+    def __init__(self, rate: float = 0.2, min_rate: float = 1 / 60, max_rate: float = 2.0,
+                 burst: float = 2.0, increase: float = 0.02, decrease: float = 0.5,
+                 cooldown: float = 60.0, max_cooldown: float = 600.0,
+                 server_decrease: float = 0.75, server_cooldown: float = 5.0):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = max(1.0, burst)
+        self.increase = increase
+        self.decrease = decrease
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.server_decrease = server_decrease
+        self.server_cooldown = server_cooldown
+        self._rate = max(min_rate, min(max_rate, rate))
+        self._tokens = 1.0
+        self._last = time.monotonic()
+        self._cooldown_until = 0.0
+        self._strikes = 0
+        self._lock = threading.Lock()
+
+    # --- trạng thái
+    @property
+    def rate(self) -> float:
+        with self._lock:
+            return self._rate
+
+    def cooldown_remaining(self) -> float:
+        with self._lock:
+            return max(0.0, self._cooldown_until - time.monotonic())
+
+    @property
+    def in_cooldown(self) -> bool:
+        return self.cooldown_remaining() > 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                'rate': self._rate,
+                'tokens': self._tokens,
+                'cooldown': max(0.0, self._cooldown_until - time.monotonic()),
+                'strikes': self._strikes,
+            }
+
+    def describe(self) -> str:
+        snap = self.snapshot()
+        text = f"{snap['rate'] * 60:.1f} video/phút"
+        if snap['cooldown'] > 0:
+            text += f", tạm nghỉ {snap['cooldown']:.0f}s (429 x{snap['strikes']})"
+        return text
+
+    # --- token bucket
+    def _refill(self, now: float):
+        elapsed = now - self._last
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self._rate)
+            self._last = now
+
+    def _reserve(self) -> Tuple[float, str]:
+        """Lấy token nếu được; nếu chưa, trả về (số giây cần chờ, lý do)."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._cooldown_until:
+                return self._cooldown_until - now, 'cooldown'
+            self._refill(now)
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0, ''
+            return (1.0 - self._tokens) / self._rate, 'rate'
+
+    def acquire(self, should_stop: Optional[Callable[[], bool]] = None,
+                on_wait: Optional[Callable[[float, str], None]] = None) -> bool:
+        """Chặn tới khi được phép gửi request. Trả False nếu bị hủy trong lúc chờ."""
+        should_stop = should_stop or (lambda: False)
+        announced = None
+        while True:
+            if should_stop():
+                return False
+            delay, reason = self._reserve()
+            if delay <= 0:
+                return True
+            if on_wait and delay >= 1.0 and reason != announced:
+                on_wait(delay, reason)
+                announced = reason
+            time.sleep(min(0.5, delay))
+
+    async def acquire_async(self, should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        """Như acquire() nhưng chờ bằng asyncio.sleep, không chặn event loop."""
+        should_stop = should_stop or (lambda: False)
+        while True:
+            if should_stop():
+                return False
+            delay, _ = self._reserve()
+            if delay <= 0:
+                return True
+            await asyncio.sleep(min(0.5, delay))
+
+    # --- AIMD
+    def on_success(self):
+        with self._lock:
+            self._strikes = 0
+            self._rate = min(self.max_rate, self._rate + self.increase)
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        with self._lock:
+            self._strikes += 1
+            self._rate = max(self.min_rate, self._rate * self.decrease)
+            self._tokens = 0.0
+            cooldown = min(self.max_cooldown, self.base_cooldown * (2 ** (self._strikes - 1)))
+            try:
+                cooldown = max(cooldown, float(retry_after or 0))
+            except (TypeError, ValueError):
+                pass  # Retry-After dạng ngày giờ: dùng cooldown mặc định
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + cooldown)
+
+    def on_server_error(self):
+        with self._lock:
+            self._rate = max(self.min_rate, self._rate * self.server_decrease)
+            self._tokens = 0.0
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + self.server_cooldown)
+
+    def report(self, err=None, retry_after: Optional[float] = None) -> Optional[str]:
+        """
+        Ghi nhận kết quả một request (err=None là thành công); trả về loại lỗi.
+        retry_after mặc định lấy từ header Retry-After của lỗi (HTTPStatusError.headers) nếu có.
+        """
+        kind = classify_error(err)
+        if kind == 'throttle':
+            if retry_after is None and getattr(err, 'headers', None) is not None:
+                retry_after = err.headers.get('Retry-After')
+            self.on_throttle(retry_after)
+        elif kind == 'server':
+            self.on_server_error()
+        elif err is None:
+            self.on_success()
+        return kind
+
+
+# Một bộ điều tốc cho cả tiến trình: giới hạn của YouTube tính theo IP, không theo worker
+RATE_CONTROLLER = RateController()
+
+
+# ====== HTTP client dùng chung cho việc tải phụ đề =====
+class HTTPStatusError(IOError):
+    """Phản hồi HTTP lỗi (>= 400) sau khi đã hết lượt thử lại."""
+
+    def __init__(self, code: int, url: str, headers=None):
+        super().__init__(f"HTTP Error {code}: {url}")
+        self.code = code
+        self.url = url
+        self.headers = headers
+
+
+class _PooledResponse:
+    """
+    Phản hồi đọc dần (đã giải nén gzip/deflate). Kết nối được trả về pool
+    khi đọc hết body; close() giữa chừng sẽ đóng hẳn kết nối.
+    """
+
+    def __init__(self, client: 'HTTPClient', key, conn, resp):
+        self._client = client
+        self._key = key
+        self._conn = conn
+        self._resp = resp
+        self.status = resp.status
+        self.headers = resp.headers
+        self._buffer = b''
+        self._eof = False
+        encoding = (resp.getheader('Content-Encoding') or '').lower()
+        self._raw_deflate = encoding == 'deflate'
+        if encoding in ('gzip', 'x-gzip'):
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._decoder = zlib.decompressobj(zlib.MAX_WBITS)
+        else:
+            self._decoder = None
+
+    def _release(self, reuse: bool):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._client._release(self._key, conn, reuse and not self._resp.will_close)
+
+    def read_chunk(self, size: int = 64 * 1024) -> bytes:
+        """Trả về một đoạn dữ liệu đã giải nén; b'' khi hết body."""
+        while not self._eof:
+            raw = self._resp.read(size)
+            if not raw:
+                self._eof = True
+                tail = self._decoder.flush() if self._decoder else b''
+                self._release(True)
+                return tail
+            if self._decoder is None:
+                return raw
+            try:
+                data = self._decoder.decompress(raw)
+            except zlib.error:
+                if not self._raw_deflate:
+                    raise
+                # Một số server gửi "deflate" không có header zlib
+                self._raw_deflate = False
+                self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+                data = self._decoder.decompress(raw)
+            if data:
+                return data
+        return b''
+
+    def iter_chunks(self, size: int = 64 * 1024):
+        while True:
+            chunk = self.read_chunk(size)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self) -> bytes:
+        return b''.join(self.iter_chunks())
+
+    def close(self):
+        if self._conn is not None:
+            self._resp.close()
+            self._release(False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HTTPClient:
+    """
+    HTTP client thread-safe dùng chung cho mọi lần tải phụ đề:
+    - pool kết nối keep-alive theo (scheme, host, port, proxy)
+    - Accept-Encoding gzip/deflate, timeout cho từng request
+    - thử lại có giới hạn (lỗi kết nối, 5xx) với backoff
+    - proxy HTTP như urllib: proxies=None lấy từ hệ thống (http_proxy/https_proxy/no_proxy, registry Windows);
+      https qua proxy đi bằng CONNECT (set_tunnel), kết nối tunnel cũng được giữ trong pool
+    Lỗi HTTP cuối cùng => HTTPStatusError (có .code); bên gọi báo về bộ điều tốc của mình (rate.report),
+    nên mỗi phản hồi 429/5xx chỉ được tính một lần.
+    """
+
+    USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                  '(KHTML, like Gecko) Chrome/124.0 Safari/537.36')
+    RETRY_STATUSES = (500, 502, 503, 504)
+
+    def __init__(self, timeout: float = 20.0, retries: int = 3, backoff: float = 0.5,
+                 max_idle_per_host: int = 8, max_redirects: int = 5,
+                 proxies: Optional[Dict[str, str]] = None):
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.max_idle_per_host = max_idle_per_host
+        self.max_redirects = max_redirects
+        self._idle: Dict[Tuple[Any, ...], List[Any]] = {}  # (scheme, host, port, proxy) -> kết nối rảnh
+        self._lock = threading.Lock()
+        self._ssl_context = None
+        self._proxies = proxies  # None: đọc từ hệ thống ở request đầu tiên
+        self._system_proxies = proxies is None
+
+    # --- proxy
+    def _proxy_for(self, scheme: str, host: str) -> Optional[Tuple[str, int, Optional[str]]]:
+        """(host, port, Proxy-Authorization) của proxy dùng cho URL này, None = kết nối thẳng."""
+        if self._proxies is None:
+            self._proxies = urllib.request.getproxies()
+        proxy = self._proxies.get(scheme)
+        if not proxy:
+            return None
+        if self._system_proxies:
+            if urllib.request.proxy_bypass(host):
+                return None
+        elif urllib.request.proxy_bypass_environment(host, self._proxies):
+            return None
+        if '://' not in proxy:
+            proxy = 'http://' + proxy
+        parts = urllib.parse.urlsplit(proxy)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise OSError(f"Proxy không được hỗ trợ: {proxy}")
+        auth = None
+        if parts.username is not None:
+            creds = f"{urllib.parse.unquote(parts.username)}:{urllib.parse.unquote(parts.password or '')}"
+            auth = 'Basic ' + base64.b64encode(creds.encode('utf-8')).decode('ascii')
+        return parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80), auth
+
+    # --- pool
+    def _context(self):
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()  # tôn trọng SSL_CERT_FILE (certifi)
+        return self._ssl_context
+
+    def _acquire(self, key, timeout: float):
+        with self._lock:
+            idle = self._idle.get(key)
+            conn = idle.pop() if idle else None
+        if conn is not None:
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        scheme, host, port, proxy = key
+        if proxy is not None:
+            proxy_host, proxy_port, auth = proxy
+            if scheme == 'https':
+                conn = http.client.HTTPSConnection(proxy_host, proxy_port, timeout=timeout, context=self._context())
+                conn.set_tunnel(host, port, headers={'Proxy-Authorization': auth} if auth else None)
+            else:
+                conn = http.client.HTTPConnection(proxy_host, proxy_port, timeout=timeout)
+        elif scheme == 'https':
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout, context=self._context())
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        return conn, False
+
+    def _release(self, key, conn, reuse: bool):
+        if reuse:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle_per_host:
+                    idle.append(conn)
+                    return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            pools, self._idle = self._idle, {}
+        for idle in pools.values():
+            for conn in idle:
+                conn.close()
+
+    # --- request
+    def open(self, url: str, headers: Optional[Dict[str, str]] = None,
+             timeout: Optional[float] = None) -> _PooledResponse:
+        """GET url, trả về phản hồi 2xx để đọc dần; lỗi => HTTPStatusError / OSError."""
+        timeout = timeout or self.timeout
+        attempt = redirects = 0
+        while True:
+            parts = urllib.parse.urlsplit(url)
+            scheme = parts.scheme or 'https'
+            port = parts.port or (443 if scheme == 'https' else 80)
+            proxy = self._proxy_for(scheme, parts.hostname)
+            key = (scheme, parts.hostname, port, proxy)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+            req_headers = {
+                'User-Agent': self.USER_AGENT,
+                'Accept-Encoding': 'gzip, deflate',
+                'Connection': 'keep-alive',
+            }
+            if proxy is not None and scheme == 'http':
+                # HTTP qua proxy: request line mang URL đầy đủ (https đi trong tunnel, không cần)
+                path = urllib.parse.urlunsplit((scheme, parts.netloc, path, '', ''))
+                if proxy[2]:
+                    req_headers['Proxy-Authorization'] = proxy[2]
+            req_headers.update(headers or {})
+
+            conn, reused = self._acquire(key, timeout)
+            try:
+                conn.request('GET', path, headers=req_headers)
+                resp = conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if reused:
+                    continue  # kết nối keep-alive đã bị server đóng: mở lại, không tính lượt thử
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                time.sleep(self.backoff * (2 ** (attempt - 1)))
+                continue
+
+            if resp.status in (301, 302, 303, 307, 308) and resp.getheader('Location'):
+                location = resp.getheader('Location')
+                resp.read()
+                self._release(key, conn, not resp.will_close)
+                redirects += 1
+                if redirects > self.max_redirects:
+                    raise HTTPStatusError(resp.status, url, resp.headers)
+                url = urllib.parse.urljoin(url, location)
+                continue
+
+            if resp.status >= 400:
+                resp.read()
+                self._release(key, conn, not resp.will_close)
+                err = HTTPStatusError(resp.status, url, resp.headers)
+                if resp.status in self.RETRY_STATUSES and attempt < self.retries:
+                    attempt += 1
+                    time.sleep(self.backoff * (2 ** (attempt - 1)))
+                    continue
+                raise err
+
+            return _PooledResponse(self, key, conn, resp)
+
+    def get_bytes(self, url: str, **kwargs) -> bytes:
+        with self.open(url, **kwargs) as resp:
+            return resp.read()
+
+    def get_text(self, url: str, encoding: str = 'utf-8', **kwargs) -> str:
+        return self.get_bytes(url, **kwargs).decode(encoding, errors='replace')
+
+
+HTTP_CLIENT = HTTPClient()
+
+
+# ====== Đọc phụ đề dạng stream (json3 / srv3 / văn bản) =====
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WS = ' \t\r\n'
+MAX_CAPTION_ITEM_CHARS = 4 * 1024 * 1024  # một event json3 lớn hơn mức này => dữ liệu hỏng
+
+
+def _iter_text(chunks: Iterable[bytes]) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def _iter_json_array_items(texts: Iterator[str], buf: str = '', key: Optional[str] = None) -> Iterator[Any]:
+    """
+    Parse dần từng phần tử của một mảng JSON: mảng gốc (key=None) hoặc mảng "key": [...].
+    Chỉ giữ trong bộ nhớ phần tử đang đọc dở.
+    """
+    eof = False
+
+    def more() -> bool:
+        nonlocal buf, eof
+        if eof:
+            return False
+        for text in texts:
+            buf += text
+            return True
+        eof = True
+        return False
+
+    # Tìm dấu '[' mở mảng
+    marker = f'"{key}"' if key else None
+    while True:
+        if marker:
+            at = buf.find(marker)
+            if at >= 0:
+                colon = buf.find(':', at + len(marker))
+                bracket = buf.find('[', colon) if colon >= 0 else -1
+                if bracket >= 0:
+                    pos = bracket + 1
+                    break
+                buf = buf[at:]
+            else:
+                buf = buf[-len(marker):]  # giữ đuôi phòng khi marker bị cắt giữa 2 chunk
+        else:
+            pos = buf.find('[')
+            if pos >= 0:
+                pos += 1
+                break
+        if not more():
+            return
+
+    while True:
+        # bỏ khoảng trắng và dấu phẩy giữa các phần tử
+        while True:
+            while pos < len(buf) and (buf[pos] in _JSON_WS or buf[pos] == ','):
+                pos += 1
+            if pos < len(buf):
+                break
+            buf, pos = '', 0
+            if not more():
+                return
+        if buf[pos] == ']':
+            return
+        try:
+            item, end = _JSON_DECODER.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            buf, pos = buf[pos:], 0
+            if len(buf) > MAX_CAPTION_ITEM_CHARS or not more():
+                return  # phần tử hỏng / cụt: dừng, giữ các dòng đã đọc
+            continue
+        yield item
+        pos = end
+        if pos > 64 * 1024:
+            buf, pos = buf[pos:], 0
+
+
+def _json3_event_line(ev) -> str:
+    if not isinstance(ev, dict) or 'segs' not in ev:
+        return ''
+    return ''.join(seg.get('utf8', '') for seg in ev['segs'] if isinstance(seg, dict)).strip()
+
+
+def _iter_xml_lines(texts: Iterator[str], buf: str) -> Iterator[str]:
+    """srv1/srv2/srv3 (timedtext XML): mỗi <p>/<text> là một dòng; phần tử đọc xong bị xóa ngay."""
+    parser = ElementTree.XMLPullParser(events=('end',))
+    try:
+        for text in itertools.chain((buf,), texts):
+            parser.feed(text)
+            for _, elem in parser.read_events():
+                if elem.tag in ('p', 'text'):
+                    line = ''.join(elem.itertext()).strip()
+                    elem.clear()
+                    if line:
+                        yield line
+        parser.close()
+    except ElementTree.ParseError:
+        return
+
+
+def _iter_plain_lines(texts: Iterator[str], buf: str) -> Iterator[str]:
+    pending = ''
+    for text in itertools.chain((buf,), texts):
+        pending += text
+        lines = pending.split('\n')
+        pending = lines.pop()  # giữ phần dòng dở dang cho chunk sau
+        for line in lines:
+            yield line.rstrip('\r')
+    if pending:
+        yield pending.rstrip('\r')
+
+
+def _sniff_caption(chunks: Iterable[bytes]) -> Tuple[str, Iterator[str], str]:
+    """Đọc tới ký tự khác khoảng trắng đầu tiên: (ký tự đó hoặc '' nếu body rỗng, phần còn lại, phần đã đọc)."""
+    texts = _iter_text(chunks)
+    buf = ''
+    for text in texts:
+        buf += text
+        if buf.strip():
+            break
+    head = buf.lstrip()
+    return head[:1], texts, buf
+
+
+def _iter_sniffed_lines(head: str, texts: Iterator[str], buf: str) -> Iterator[str]:
+    """
+    Yield từng dòng theo nội dung đã nhận dạng, bộ nhớ không phụ thuộc độ dài video: json3 ({"events": [...]}),
+    mảng JSON [{"text": ...}], XML srv1/2/3, còn lại (VTT/SRT/...) trả nguyên từng dòng.
+    """
+    if head == '{':
+        for ev in _iter_json_array_items(texts, buf, key='events'):
+            line = _json3_event_line(ev)
+            if line:
+                yield line
+    elif head == '[':
+        for it in _iter_json_array_items(texts, buf):
+            line = it.get('text', '') if isinstance(it, dict) else ''
+            if line:
+                yield line
+    elif head == '<':
+        yield from _iter_xml_lines(texts, buf)
+    elif head:
+        yield from _iter_plain_lines(texts, buf)
+
+
+# ====== Làm sạch phụ đề: một lượt, regex biên dịch sẵn =====
+# Dòng bỏ qua: số thứ tự SRT, dòng thời gian (kể cả "-->" + align/position), "--"
+_CAPTION_SKIP_RE = re.compile(
+    r'\d+'
+    r'|\d{2}:\d{2}(?::\d{2})?[.,]\d{3}\s*-->.*'
+    r'|\d{2}:\d{2}:\d{2}.*'
+    r'|--'
+)
+_CAPTION_SKIP_FIRST = frozenset('0123456789-')  # chỉ chạy regex khi ký tự đầu có thể khớp
+# Khối header VTT (WEBVTT + Kind/Language, NOTE, STYLE, REGION): chỉ có trước cue đầu tiên, bỏ cả khối
+# tới dòng trống; sau cue đầu tiên các từ này là chữ phụ đề bình thường
+_CAPTION_BLOCK_RE = re.compile(r'(?:WEBVTT|NOTE|STYLE|REGION)(?:\s.*)?')
+_CAPTION_BLOCK_FIRST = frozenset('WNSR')
+# Thẻ <...> (kể cả <00:00:01.000><c>) xóa bằng một lần sub; entity giải mã bằng html.unescape
+_CAPTION_TAG_RE = re.compile(r'<[^>]*>')
+MIN_OVERLAP_WORDS = 2    # số từ chồng lấn tối thiểu giữa cuối dòng trước và đầu dòng sau
+
+
+def _strip_caption_tokens(text: str) -> str:
+    if '<' in text:
+        text = _CAPTION_TAG_RE.sub('', text)
+    if '&' in text:
+        text = html.unescape(text)
+    return text
+
+
+def _word_overlap(prev_words: List[str], words: List[str]) -> int:
+    for k in range(min(len(prev_words), len(words), 30), MIN_OVERLAP_WORDS - 1, -1):
+        if prev_words[-k:] == words[:k]:
+            return k
+    return 0
+
+
+def _iter_cue_text(lines: Iterable[str], tokens_done: bool) -> Iterator[str]:
+    """Lấy phần chữ của các cue VTT/SRT: bỏ số thứ tự, dòng thời gian, khối header; xóa thẻ, giải mã entity."""
+    skip = _CAPTION_SKIP_RE.fullmatch
+    skip_first = _CAPTION_SKIP_FIRST
+    block = _CAPTION_BLOCK_RE.fullmatch
+    block_first = _CAPTION_BLOCK_FIRST
+    in_cues = in_block = False
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            in_block = False
+            continue
+        first = line[0]
+        if first in skip_first and skip(line):
+            if '-->' in line:
+                in_cues = True
+                in_block = False
+            continue
+        if in_block:
+            continue
+        if not in_cues and first in block_first and block(line):
+            in_block = True
+            continue
+        if not tokens_done and ('<' in line or '&' in line):
+            line = _strip_caption_tokens(line).strip()
+        if line:
+            yield line
+
+
+def iter_dedupe_lines(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Gộp khoảng trắng và loại phụ đề "cuốn" của YouTube auto-caption — chỉ dùng cho track auto:
+    - dòng mở rộng dòng trước theo ranh giới từ (hoặc lặp lại y hệt ngay sau nó) thay cho dòng trước;
+    - phần đầu trùng >= MIN_OVERLAP_WORDS từ với đuôi dòng trước bị cắt (trùng cả dòng => bỏ dòng).
+    Lời thoại lặp lại không liền nhau hay từ ngắn tình cờ nằm trong dòng trước được giữ nguyên.
+    """
+    pending = None  # giữ 1 dòng để còn thay bằng bản mở rộng của nó
+
+    for line in lines:
+        if '  ' in line or '\t' in line or '\xa0' in line or '\n' in line:
+            line = ' '.join(line.split())
+        if not line:
+            continue
+
+        if pending is not None:
+            if line.startswith(pending) and (len(line) == len(pending) or line[len(pending)] == ' '):
+                pending = line  # dòng cuốn: bản sau chứa trọn bản trước
+                continue
+            head = line.split(' ', 1)[0]
+            if f' {head} ' in f' {pending} ':  # chỉ tính chồng lấn khi từ đầu có trong dòng trước
+                words = line.split(' ')
+                k = _word_overlap(pending.split(' '), words)
+                if k:
+                    if k == len(words):
+                        continue
+                    line = ' '.join(words[k:])
+            yield pending
+        pending = line
+
+    if pending is not None:
+        yield pending
+
+
+def _iter_squashed(lines: Iterable[str]) -> Iterator[str]:
+    """Gộp khoảng trắng trong dòng, bỏ dòng rỗng — KHÔNG loại trùng (json3/XML không có phụ đề "cuốn")."""
+    for line in lines:
+        if '  ' in line or '\t' in line or '\xa0' in line or '\n' in line:
+            line = ' '.join(line.split())
+        if line:
+            yield line
+
+
+def clean_subtitles(subtitle_content, auto: bool = False):
+    """Làm sạch cả một phụ đề VTT/SRT đã tải; auto=True: track auto-caption, loại thêm phụ đề "cuốn"."""
+    if not subtitle_content: return "Không có nội dung phụ đề"
+    # Xóa thẻ/entity cho cả văn bản trong một lần gọi regex, rồi mới tách dòng
+    text = _strip_caption_tokens(subtitle_content)
+    lines = _iter_cue_text(text.splitlines(), tokens_done=True)
+    lines = iter_dedupe_lines(lines) if auto else _iter_squashed(lines)
+    return "\n".join(lines) or "Không thể trích xuất nội dung phụ đề"
+
+
+# ====== Chọn định dạng phụ đề + parser riêng cho từng định dạng =====
+# Thứ tự ưu tiên: rẻ nhất để tải & parse trước (json3 đã tách sẵn từng câu, srv3 là XML gọn, vtt cần lọc nhiều)
+CAPTION_FORMAT_PREFERENCE = ('json3', 'srv3', 'vtt')
+
+
+def select_caption_track(tracks, preference=None) -> Optional[Dict[str, Any]]:
+    """
+    Chọn track phụ đề theo định dạng ưu tiên trong danh sách yt-dlp trả về ([{'ext', 'url', ...}, ...]).
+    Không có định dạng nào trong danh sách ưu tiên => lấy track đầu tiên (như trước).
+    """
+    tracks = [t for t in (tracks or []) if isinstance(t, dict) and t.get('url')]
+    if not tracks:
+        return None
+    by_ext = {}
+    for t in tracks:
+        by_ext.setdefault((t.get('ext') or '').lower(), t)
+    for ext in (preference or CAPTION_FORMAT_PREFERENCE):
+        if ext in by_ext:
+            return by_ext[ext]
+    return tracks[0]
+
+
+# Mọi parser: parser(chunks, auto) -> các dòng đã làm sạch; auto=True là track auto-caption.
+def parse_json3_lines(chunks: Iterable[bytes], auto: bool = False) -> Iterator[str]:
+    """json3: mỗi event một dòng; dòng lặp lại là lời thoại thật nên được giữ nguyên (kể cả track auto)."""
+    return _iter_squashed(_json3_event_line(ev) for ev in _iter_json_array_items(_iter_text(chunks), key='events'))
+
+
+def parse_timedtext_xml_lines(chunks: Iterable[bytes], auto: bool = False) -> Iterator[str]:
+    """srv1/srv2/srv3/ttml: parser XML đã giải mã entity, không cần lọc thẻ bằng regex; không có phụ đề "cuốn"."""
+    return _iter_squashed(_iter_xml_lines(_iter_text(chunks), ''))
+
+
+def parse_vtt_lines(chunks: Iterable[bytes], auto: bool = False) -> Iterator[str]:
+    """VTT/SRT: lọc cue; auto=True thì loại thêm phụ đề "cuốn" (chỉ VTT auto-caption có kiểu lặp đó)."""
+    lines = _iter_cue_text(_iter_plain_lines(_iter_text(chunks), ''), tokens_done=False)
+    return iter_dedupe_lines(lines) if auto else _iter_squashed(lines)
+
+
+def parse_unknown_caption_lines(chunks: Iterable[bytes], auto: bool = False) -> Iterator[str]:
+    """Định dạng lạ: tự nhận dạng nội dung; văn bản thuần xử lý như VTT, JSON/XML như json3/srv3."""
+    head, texts, buf = _sniff_caption(chunks)
+    lines = _iter_sniffed_lines(head, texts, buf)
+    if head in ('{', '[', '<'):
+        yield from _iter_squashed(lines)
+    else:
+        lines = _iter_cue_text(lines, tokens_done=False)
+        yield from (iter_dedupe_lines(lines) if auto else _iter_squashed(lines))
+
+
+CAPTION_PARSERS: Dict[str, Callable[[Iterable[bytes], bool], Iterator[str]]] = {
+    'json3': parse_json3_lines,
+    'srv1': parse_timedtext_xml_lines,
+    'srv2': parse_timedtext_xml_lines,
+    'srv3': parse_timedtext_xml_lines,
+    'ttml': parse_timedtext_xml_lines,
+    'vtt': parse_vtt_lines,
+    'srt': parse_vtt_lines,
+}
+
+
+def download_track_lines(track: Dict[str, Any], client: Optional['HTTPClient'] = None,
+                         auto: bool = False) -> Iterator[str]:
+    """
+    Tải một track phụ đề và yield các dòng đã làm sạch, dùng parser đúng với track['ext'];
+    auto=True: track auto-caption (loại phụ đề "cuốn" nếu định dạng có kiểu lặp đó).
+    """
+    parser = CAPTION_PARSERS.get((track.get('ext') or '').lower(), parse_unknown_caption_lines)
+    client = client or HTTP_CLIENT
+    with client.open(track['url']) as resp:
+        yield from parser(resp.iter_chunks(), auto)
+        for _ in resp.iter_chunks():
+            pass  # đọc nốt phần đuôi để kết nối quay lại pool
+
+
+def download_track_text(track: Dict[str, Any], client: Optional['HTTPClient'] = None,
+                        auto: bool = False) -> str:
+    """Như download_track_lines nhưng trả về chuỗi; lỗi mạng => OSError / HTTPStatusError (có .code)."""
+    return "\n".join(download_track_lines(track, client, auto))
+
+
+def _is_transient_caption_error(err: Exception) -> bool:
+    """429/5xx hoặc mất kết nối: tải lại sau có thể được. 4xx khác = track hỏng, coi như không có."""
+    if isinstance(err, HTTPStatusError):
+        return classify_error(err) is not None
+    return isinstance(err, (OSError, http.client.HTTPException))
+
+
+# ====== Ngôn ngữ phụ đề theo thứ tự ưu tiên + tải song song các track của một video =====
+# Mỗi mục là mã ngôn ngữ yt-dlp ('vi', 'vi-VN', 'en'...): phụ đề thủ công trước, rồi auto-caption gốc;
+# 'auto-translated <mã>': auto-caption do YouTube dịch máy (URL track có tlang=).
+DEFAULT_CAPTION_LANGS = 'vi,vi-VN,auto-translated vi'
+CAPTION_LANGS = os.environ.get('LCTC_SUB_LANGS') or DEFAULT_CAPTION_LANGS
+_TRANSLATED_PREFIXES = ('auto-translated', 'translated')
+_CAPTION_LANG_RE = re.compile(r'[A-Za-z0-9]+(?:[-_][A-Za-z0-9]+)*')  # mã yt-dlp: vi, vi-VN, zh-Hans...
+
+
+class CaptionLang(NamedTuple):
+    lang: str
+    translated: bool = False
+
+    @property
+    def key(self) -> str:
+        """Khóa ngôn ngữ dùng gom track và đặt tên file: 'vi-VN' và 'auto-translated vi' đều là 'vi'."""
+        return self.lang.split('-')[0].lower()
+
+    @property
+    def label(self) -> str:
+        return f"auto-translated {self.lang}" if self.translated else self.lang
+
+
+class CaptionText(NamedTuple):
+    lang: str             # CaptionLang.key
+    source: CaptionLang   # mục ưu tiên đã cho ra track này
+    ext: Optional[str]
+    text: str
+
+
+@functools.lru_cache(maxsize=64)
+def parse_caption_langs(spec: Optional[str] = None) -> Tuple[CaptionLang, ...]:
+    """'vi,vi-VN,en,auto-translated vi' -> các CaptionLang theo thứ tự; mục trùng bị bỏ, mục sai => ValueError."""
+    out = []
+    for item in (spec or CAPTION_LANGS).split(','):
+        words = item.split()
+        if not words:
+            continue
+        translated = words[0].lower() in _TRANSLATED_PREFIXES
+        if len(words) != 1 + translated or not _CAPTION_LANG_RE.fullmatch(words[-1]):
+            raise ValueError(f"Ngôn ngữ phụ đề không hợp lệ: {item.strip()!r}")
+        entry = CaptionLang(words[-1], translated)
+        if entry not in out:
+            out.append(entry)
+    if not out:
+        raise ValueError("Danh sách ngôn ngữ phụ đề trống")
+    return tuple(out)
+
+
+def _is_translated_track(track: Dict[str, Any]) -> bool:
+    return 'tlang=' in (track.get('url') or '')
+
+
+def _caption_formats(source: Dict[str, Any], lang: str) -> List[Dict[str, Any]]:
+    if lang in source:
+        return source[lang] or []
+    lower = lang.lower()
+    for key, formats in source.items():
+        if key.lower() == lower:
+            return formats or []
+    return []
+
+
+def caption_tracks(info: Dict[str, Any], langs: Optional[str] = None,
+                   preference=None) -> List[Tuple[CaptionLang, Dict[str, Any], bool]]:
+    """
+    (mục ưu tiên, track, là auto-caption) có trong info, đúng thứ tự `langs`; mỗi mục tối đa một track,
+    đã chọn định dạng rẻ nhất (CAPTION_FORMAT_PREFERENCE). Mục thường: thủ công -> auto '<mã>-orig' -> auto
+    chưa dịch; mục 'auto-translated': chỉ auto-caption dịch máy.
+    """
+    subs = info.get('subtitles', {}) or {}
+    auto = info.get('automatic_captions', {}) or {}
+    out = []
+    for entry in parse_caption_langs(langs):
+        if entry.translated:
+            candidates = ([t for t in _caption_formats(auto, entry.lang) if _is_translated_track(t)],)
+        else:
+            candidates = (_caption_formats(subs, entry.lang),
+                          _caption_formats(auto, entry.lang + '-orig'),
+                          [t for t in _caption_formats(auto, entry.lang) if not _is_translated_track(t)])
+        for n, formats in enumerate(candidates):
+            track = select_caption_track(formats, preference)
+            if track:
+                out.append((entry, track, entry.translated or n > 0))  # candidates[0] (mục thường) = thủ công
+                break
+    return out
+
+
+def _fetch_first_caption(group: List[Tuple[CaptionLang, Dict[str, Any], bool]],
+                         client: Optional['HTTPClient']) -> Optional[CaptionText]:
+    # Các track cùng ngôn ngữ là phương án dự phòng của nhau: thử lần lượt, dừng ở track đầu có nội dung.
+    # Không track nào có nội dung mà đã gặp lỗi tạm thời => ném lỗi đó, để video bị báo lỗi (và điều tốc)
+    # thay vì được ghi nhận thành công với phụ đề rỗng.
+    error = None
+    for entry, track, auto in group:
+        try:
+            text = download_track_text(track, client, auto)
+        except Exception as e:
+            if error is None and _is_transient_caption_error(e):
+                error = e
+            continue
+        if text:
+            return CaptionText(entry.key, entry, track.get('ext'), text)
+    if error is not None:
+        raise error
+    return None
+
+
+def _caption_groups(tracks: List[Tuple[CaptionLang, Dict[str, Any], bool]]
+                    ) -> List[List[Tuple[CaptionLang, Dict[str, Any], bool]]]:
+    """Gom track theo ngôn ngữ (CaptionLang.key), giữ thứ tự ưu tiên: mỗi nhóm là các phương án của một ngôn ngữ."""
+    groups: Dict[str, List[Tuple[CaptionLang, Dict[str, Any], bool]]] = {}
+    for item in tracks:
+        groups.setdefault(item[0].key, []).append(item)
+    return list(groups.values())
+
+
+def fetch_caption_texts(info: Dict[str, Any], langs: Optional[str] = None, all_langs: bool = False,
+                        preference=None, client: Optional['HTTPClient'] = None) -> List[CaptionText]:
+    """
+    Tải phụ đề theo thứ tự ưu tiên `langs` (mặc định CAPTION_LANGS / biến môi trường LCTC_SUB_LANGS).
+    - all_langs=False: một phụ đề — track ưu tiên cao nhất có nội dung (thường chỉ một request).
+    - all_langs=True: mỗi ngôn ngữ (CaptionLang.key) một phụ đề; các ngôn ngữ tải ĐỒNG THỜI qua pool
+      kết nối dùng chung, nên độ trễ mỗi video không tăng theo số ngôn ngữ.
+    Trả về list CaptionText theo thứ tự ưu tiên; rỗng = không có phụ đề nào.
+    Một ngôn ngữ chỉ gặp lỗi tạm thời (429/5xx, mất kết nối) => ném lỗi đó (HTTPStatusError có .code):
+    bên gọi báo lỗi phụ đề cho video và báo mã HTTP về bộ điều tốc.
+    """
+    tracks = caption_tracks(info, langs, preference)
+    if not all_langs:
+        found = _fetch_first_caption(tracks, client)
+        return [found] if found else []
+    groups = _caption_groups(tracks)
+    if len(groups) <= 1:
+        found = [_fetch_first_caption(g, client) for g in groups]
+    else:
+        with ThreadPoolExecutor(max_workers=len(groups) - 1, thread_name_prefix="lctc-captions") as pool:
+            futures = [pool.submit(_fetch_first_caption, g, client) for g in groups[1:]]
+            found = [_fetch_first_caption(groups[0], client)] + [f.result() for f in futures]
+    return [c for c in found if c]
+
+
+def caption_langs_spec(langs: Optional[str] = None) -> str:
+    """Dạng chuẩn của danh sách ưu tiên (lưu kèm kết quả để biết kết quả được tải theo yêu cầu nào)."""
+    return ','.join(e.label for e in parse_caption_langs(langs))
+
+
+def caption_result_fields(captions: List[CaptionText], all_langs: bool = False,
+                          missing: str = "Không có phụ đề", langs: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Các trường phụ đề của một kết quả: subtitles/subtitle_format/subtitle_lang lấy từ phụ đề ưu tiên nhất;
+    all_langs=True thêm extra_subtitles {ngôn ngữ: nội dung} cho các ngôn ngữ còn lại.
+    subtitle_langs: danh sách ưu tiên đã dùng (xem caption_result_matches).
+    """
+    first = captions[0] if captions else None
+    fields = {'subtitles': first.text if first else missing,
+              'subtitle_format': first.ext if first else None,
+              'subtitle_lang': first.lang if first else None,
+              'subtitle_langs': caption_langs_spec(langs)}
+    if all_langs:
+        fields['extra_subtitles'] = {c.lang: c.text for c in captions[1:]}
+    return fields
+
+
+def caption_result_matches(result: Dict[str, Any], langs: Optional[str] = None, all_langs: bool = False) -> bool:
+    """
+    Kết quả đã lưu có dùng lại được cho yêu cầu ngôn ngữ (langs, all_langs) này không:
+    - một ngôn ngữ: phụ đề đã lưu là ngôn ngữ đầu danh sách, hoặc đã được tải theo đúng danh sách này;
+    - mọi ngôn ngữ: kết quả đã lưu mọi ngôn ngữ và có đủ các ngôn ngữ được hỏi (hoặc tải theo đúng danh sách).
+    Kết quả cũ không có subtitle_lang (bản chỉ lấy phụ đề tiếng Việt) chỉ khớp yêu cầu một ngôn ngữ bắt đầu bằng 'vi'.
+    Kết quả chỉ giữ phần đầu phụ đề (subtitles_truncated) hoặc chưa tải phụ đề (caption_tracks) không dùng lại được.
+    """
+    if result.get('status', 'success') != 'success':
+        return False
+    if result.get('subtitles_truncated') or result.get('caption_tracks'):
+        return False
+    entries = parse_caption_langs(langs)
+    if 'subtitle_lang' not in result:
+        return not all_langs and entries[0].key == 'vi'
+    same_request = result.get('subtitle_langs') == caption_langs_spec(langs)
+    if not all_langs:
+        return result['subtitle_lang'] == entries[0].key or same_request
+    extra = result.get('extra_subtitles')
+    if extra is None:
+        return False
+    found = {result['subtitle_lang'], *extra}
+    return same_request or all(e.key in found for e in entries)
+
+
+def caption_files(result: Dict[str, Any]) -> Dict[str, str]:
+    """
+    File phụ đề theo ngôn ngữ của một kết quả lưu mọi ngôn ngữ: {'sub.vi.txt': ..., 'sub.en.txt': ...}.
+    Kết quả chỉ một ngôn ngữ (không có extra_subtitles) => {} (chỉ có sub.txt như trước).
+    """
+    extra = result.get('extra_subtitles')
+    if extra is None:
+        return {}
+    files = {}
+    if result.get('subtitle_lang'):
+        files[f"sub.{result['subtitle_lang']}.txt"] = result.get('subtitles') or ""
+    for lang, text in extra.items():
+        files[f"sub.{lang}.txt"] = text
+    return files
+
+
+# ====== Phụ đề tải ở giai đoạn ghi: stream thẳng ra sub.txt, kết quả chỉ giữ phần đầu =====
+SUBTITLE_PREVIEW_CHARS = 256 * 1024  # phần đầu phụ đề giữ trong kết quả (RAM, kho, docx); file .txt luôn đủ
+
+
+def deferred_caption_fields(info: Dict[str, Any], langs: Optional[str] = None, all_langs: bool = False,
+                            missing: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Như fetch_subtitles nhưng chưa tải gì: chỉ chọn track (caption_tracks), để giai đoạn ghi stream thẳng
+    ra file bằng write_caption_files. Video không có track nào => các trường "không có phụ đề" như fetch_subtitles.
+    """
+    tracks = caption_tracks(info, langs)
+    if not tracks:
+        return caption_result_fields([], all_langs, missing or missing_caption_text(langs), langs)
+    groups = _caption_groups(tracks) if all_langs else [tracks]
+    return {'caption_tracks': {'all_langs': all_langs,
+                               'groups': [[{'lang': entry.label, 'ext': track.get('ext'), 'url': track['url'],
+                                            'auto': auto} for entry, track, auto in group] for group in groups]},
+            'subtitle_langs': caption_langs_spec(langs)}
+
+
+def _with_note(lines: Iterable[str], note: Optional[str]) -> Iterator[str]:
+    empty = True
+    for line in lines:
+        empty = False
+        yield line
+    if note and not empty:
+        yield ''
+        yield note
+
+
+def _read_text_lines(path: str) -> Iterator[str]:
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            yield line.rstrip('\n')
+
+
+def _write_caption_group(group: List[Dict[str, Any]], path: str, client: Optional['HTTPClient'],
+                         rate: Optional['RateController'], note: Optional[Callable[[CaptionLang], Optional[str]]],
+                         keep_chars: int):
+    # Như _fetch_first_caption, nhưng mỗi track stream thẳng vào path (file tạm + os.replace):
+    # track đầu có nội dung thắng; không có mà đã gặp lỗi tạm thời => ném lỗi đó.
+    error = None
+    for item in group:
+        entry = parse_caption_langs(item['lang'])[0]
+        try:
+            lines = download_track_lines(item, client, item.get('auto', False))
+            out = write_lines_if_changed(path, _with_note(lines, note and note(entry)), keep_chars)
+        except Exception as e:
+            if rate is not None:
+                rate.report(e)
+            if error is None and _is_transient_caption_error(e):
+                error = e
+            continue
+        if out is not None:
+            return entry, item.get('ext'), out
+    if error is not None:
+        raise error
+    return None
+
+
+def write_caption_files(result: Dict[str, Any], folder: str, client: Optional['HTTPClient'] = None,
+                        rate: Optional['RateController'] = None,
+                        note: Optional[Callable[[CaptionLang], Optional[str]]] = None,
+                        missing: Optional[str] = None,
+                        keep_chars: int = SUBTITLE_PREVIEW_CHARS) -> Tuple[Dict[str, Any], bool]:
+    """
+    Giai đoạn ghi của kết quả có caption_tracks (deferred_caption_fields): tải từng track, stream các dòng
+    vào sub.txt (all_langs: thêm sub.<lang>.txt) qua file tạm + os.replace, bộ nhớ không phụ thuộc độ dài
+    phụ đề; file không đổi thì giữ nguyên.
+    Trả về (kết quả đầy đủ trường như fetch_subtitles, bỏ caption_tracks; có file nào đổi không).
+    subtitles chỉ giữ keep_chars ký tự đầu; bị cắt => subtitles_truncated=True (bản đủ nằm trong file).
+    note(mục ưu tiên đã cho ra phụ đề) -> dòng ghi chú thêm vào cuối sub.txt (None = không ghi).
+    Lỗi tạm thời (429/5xx, mất kết nối) được báo về rate và ném ra: video ghi lỗi, lượt sau tải lại.
+    """
+    spec = result['caption_tracks']
+    groups = spec['groups']
+    langs = result.get('subtitle_langs')
+    os.makedirs(folder, exist_ok=True)
+    changed = False
+    if spec['all_langs']:
+        # Mỗi ngôn ngữ một file sub.<lang>.txt, tải đồng thời; sub.txt = bản của ngôn ngữ ưu tiên nhất có phụ đề
+        def one(group):
+            key = parse_caption_langs(group[0]['lang'])[0].key
+            return _write_caption_group(group, os.path.join(folder, f"sub.{key}.txt"), client, rate, None, keep_chars)
+
+        if len(groups) <= 1:
+            found = [one(g) for g in groups]
+        else:
+            with ThreadPoolExecutor(max_workers=len(groups) - 1, thread_name_prefix="lctc-captions") as pool:
+                futures = [pool.submit(one, g) for g in groups[1:]]
+                found = [one(groups[0])] + [f.result() for f in futures]
+        found = [c for c in found if c]
+        changed = any(c[2][0] for c in found)
+        if found:
+            primary = os.path.join(folder, f"sub.{found[0][0].key}.txt")
+            changed |= write_lines_if_changed(os.path.join(folder, 'sub.txt'), _read_text_lines(primary))[0]
+    else:
+        one_found = _write_caption_group(groups[0], os.path.join(folder, 'sub.txt'), client, rate, note, keep_chars)
+        found = [one_found] if one_found else []
+        changed = bool(found and found[0][2][0])
+    if not found:
+        changed = write_text_if_changed(os.path.join(folder, 'sub.txt'), missing or missing_caption_text(langs))
+    fields = caption_result_fields([CaptionText(entry.key, entry, ext, preview)
+                                    for entry, ext, (_, preview, _) in found],
+                                   spec['all_langs'], missing or missing_caption_text(langs), langs)
+    if any(truncated for _, _, (_, _, truncated) in found):
+        fields['subtitles_truncated'] = True
+    out = {k: v for k, v in result.items() if k != 'caption_tracks'}
+    out.update(fields)
+    return out, changed
+
+
+def transcript_text(result: Dict[str, Any]) -> str:
+    """Phụ đề để điền docx / hiển thị: subtitles, kèm ghi chú khi chỉ là phần đầu (subtitles_truncated)."""
+    text = result.get('subtitles') or "Không có phụ đề"
+    if result.get('subtitles_truncated'):
+        text += "\n…\n(Phụ đề quá dài: bản đầy đủ trong sub.txt)"
+    return text
+
+
+# ====== Kết quả một video (dùng chung cho engine đồng bộ và API asyncio) =====
+def missing_caption_text(langs: Optional[str] = None) -> str:
+    return f"Không có phụ đề ({', '.join(e.label for e in parse_caption_langs(langs))})"
+
+
+def fetch_subtitles(info: Dict[str, Any], langs: Optional[str] = None, all_langs: bool = False) -> Dict[str, Any]:
+    """
+    Các trường phụ đề của kết quả (subtitles, subtitle_format, subtitle_lang [, extra_subtitles]).
+    langs: thứ tự ưu tiên, vd 'vi,vi-VN,en,auto-translated vi'; all_langs=True: lưu mọi ngôn ngữ có trong
+    danh sách (sub.<lang>.txt), các ngôn ngữ tải song song.
+    Lỗi khi tải (429/5xx, mất kết nối) được ném ra: xem caption_error_result.
+    """
+    return caption_result_fields(fetch_caption_texts(info, langs, all_langs), all_langs,
+                                 missing_caption_text(langs), langs)
+
+
+def video_result(info: Dict[str, Any], url: str, subtitle_fields: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'title': info.get('title', 'Không có tiêu đề'),
+        'video_id': info.get('id', 'unknown'),
+        'duration': info.get('duration', 0),
+        'url': url,
+        **subtitle_fields,
+        'status': 'success'
+    }
+
+
+def caption_error_result(info: Dict[str, Any], url: str, err) -> Dict[str, Any]:
+    """Tải phụ đề lỗi: video bị báo lỗi (mã HTTP trong thông báo => điều tốc), không lưu như thành công."""
+    return {
+        'title': info.get('title', 'Không có tiêu đề'),
+        'video_id': info.get('id'),
+        'url': url,
+        'status': 'error',
+        'error': f'Lỗi khi tải phụ đề: {err}'
+    }
+
+
+# ====== Kho kết quả có index (thay cho việc ghi lại toàn bộ youtube_results.json) =====
+def default_result_key(item: Dict[str, Any]) -> Optional[str]:
+    return item.get('video_id') or item.get('url')
+
+
+class ResultsStore(abc.ABC):
+    """
+    Kho kết quả theo khóa (video_id): tra cứu O(1), ghi thêm từng bản ghi, không ghi lại cả file.
+    Dùng như một dict chỉ đọc (in, [], get, len, keys/values/items theo thứ tự thêm vào).
+    Lớp con bắt buộc cài đặt: __contains__, __len__, keys, _get_raw, _put;
+    tùy chọn: flush, compact, reload, close (mặc định không làm gì).
+    """
+
+    backend = ''
+    extension = ''
+
+    def __init__(self, path: str, key_func: Optional[Callable[[Dict[str, Any]], Optional[str]]] = None):
+        self.path = path
+        self.key_func = key_func or default_result_key
+        self._lock = threading.RLock()
+
+    # --- đọc
+    @abc.abstractmethod
+    def __contains__(self, key) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    @abc.abstractmethod
+    def keys(self) -> List[str]:
+        ...
+
+    @abc.abstractmethod
+    def _get_raw(self, key: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    def get(self, key, default=None):
+        if not key:
+            return default
+        item = self._get_raw(key)
+        return default if item is None else item
+
+    def __getitem__(self, key) -> Dict[str, Any]:
+        item = self.get(key)
+        if item is None:
+            raise KeyError(key)
+        return item
+
+    def values(self) -> Iterator[Dict[str, Any]]:
+        for key in self.keys():
+            item = self._get_raw(key)
+            if item is not None:
+                yield item
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for key in self.keys():
+            item = self._get_raw(key)
+            if item is not None:
+                yield key, item
+
+    # --- ghi
+    @abc.abstractmethod
+    def _put(self, key: str, item: Dict[str, Any]):
+        ...
+
+    def add(self, item: Dict[str, Any], replace: bool = False) -> bool:
+        """Thêm một kết quả; khóa đã có thì bỏ qua (trừ khi replace=True). Trả True nếu đã ghi."""
+        key = self.key_func(item)
+        if not key:
+            return False
+        with self._lock:
+            if not replace and key in self:
+                return False
+            self._put(key, item)
+        return True
+
+    def merge(self, items: Iterable[Dict[str, Any]]) -> int:
+        """Gộp kết quả mới (không ghi đè bản cũ). Trả về số bản ghi đã thêm."""
+        appended = 0
+        with self._lock:
+            for item in items:
+                if item and self.add(item):
+                    appended += 1
+            self.flush()
+        return appended
+
+    def flush(self):
+        pass
+
+    def compact(self):
+        pass
+
+    def fingerprint(self) -> Tuple:
+        """(inode, mtime, kích thước) của file kho — đổi khi có tiến trình khác ghi/compact."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return ()
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def reload(self):
+        """Đọc lại kho từ đĩa (sau khi tiến trình khác thay đổi file)."""
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- youtube_results.json cũ
+    def import_legacy_json(self, legacy_path: str) -> int:
+        """Nhập youtube_results.json (mảng JSON) theo dạng stream; bản ghi trùng khóa giữ bản đầu tiên."""
+        def chunks():
+            with open(legacy_path, 'rb') as f:
+                while True:
+                    chunk = f.read(1024 * 1024)
+                    if not chunk:
+                        return
+                    yield chunk
+        return self.merge(it for it in _iter_json_array_items(_iter_text(chunks())) if isinstance(it, dict))
+
+    def export_legacy_json(self, legacy_path: str) -> int:
+        """Xuất toàn bộ kho ra định dạng youtube_results.json cũ (ghi file tạm rồi đổi tên)."""
+        tmp = f"{legacy_path}.tmp"
+        count = 0
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write('[')
+            for item in self.values():
+                f.write(',\n' if count else '\n')
+                f.write(json.dumps(item, ensure_ascii=False, indent=2))
+                count += 1
+            f.write('\n]' if count else ']')
+        os.replace(tmp, legacy_path)
+        return count
+
+
+class JsonlResultsStore(ResultsStore):
+    """
+    Log JSONL chỉ ghi thêm (mỗi dòng {"k": khóa, "v": kết quả}) + file index <log>.idx
+    ("offset length khóa" mỗi dòng). Mở kho chỉ đọc index, không parse lại log;
+    phần log chưa có trong index (vd crash giữa chừng) được quét bù.
+    """
+
+    backend = 'jsonl'
+    extension = '.jsonl'
+    _KEY_RE = re.compile(rb'^\{"k": "((?:[^"\\]|\\.)*)"')
+
+    def __init__(self, path: str, key_func=None):
+        super().__init__(path, key_func)
+        self.index_path = path + '.idx'
+        self._open()
+
+    def _open(self):
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._records = 0
+        self._log = open(self.path, 'ab')
+        self._reader = open(self.path, 'rb')
+        self._size = self._log.seek(0, os.SEEK_END)
+        self._load_index()
+        self._idx = open(self.index_path, 'a', encoding='utf-8')
+
+    def _load_index(self):
+        indexed_end = 0
+        valid = os.path.exists(self.index_path)
+        if valid:
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if not line.endswith('\n'):
+                            break  # dòng index cụt: phần log sau đó sẽ được quét bù
+                        off, length, key = line.rstrip('\n').split(' ', 2)
+                        off, length = int(off), int(length)
+                        if off + length > self._size:
+                            valid = False
+                            break
+                        self._index[key] = (off, length)
+                        self._records += 1
+                        indexed_end = max(indexed_end, off + length)
+            except (OSError, ValueError):
+                valid = False
+        if not valid:
+            self._index.clear()
+            self._records = 0
+            indexed_end = 0
+            with open(self.index_path, 'w', encoding='utf-8'):
+                pass
+        if indexed_end < self._size:
+            self._scan_log(indexed_end)
+
+    def _scan_log(self, start: int):
+        entries = []
+        self._reader.seek(start)
+        off = start
+        for line in self._reader:
+            if not line.endswith(b'\n'):
+                break  # bản ghi cuối bị cắt (crash khi đang ghi): bỏ qua
+            m = self._KEY_RE.match(line)
+            if m:
+                key = json.loads(b'"' + m.group(1) + b'"')
+                self._index[key] = (off, len(line))
+                self._records += 1
+                entries.append(f"{off} {len(line)} {key}\n")
+            off += len(line)
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.writelines(entries)
+        if off < self._size:
+            # cắt phần đuôi hỏng để bản ghi mới bắt đầu ở đầu dòng
+            self._log.truncate(off)
+            self._size = off
+
+    def __contains__(self, key) -> bool:
+        return key in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._index)
+
+    def _get_raw(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            loc = self._index.get(key)
+            if loc is None:
+                return None
+            self._reader.seek(loc[0])
+            data = self._reader.read(loc[1])
+        try:
+            return json.loads(data)['v']
+        except (ValueError, KeyError):
+            return None
+
+    def _put(self, key: str, item: Dict[str, Any]):
+        line = (json.dumps({'k': key, 'v': item}, ensure_ascii=False) + '\n').encode('utf-8')
+        off = self._size
+        self._log.write(line)
+        self._log.flush()
+        self._size += len(line)
+        self._index[key] = (off, len(line))
+        self._records += 1
+        self._idx.write(f"{off} {len(line)} {key}\n")
+
+    @property
+    def garbage(self) -> int:
+        """Số bản ghi cũ (đã bị thay) còn nằm trong log."""
+        return self._records - len(self._index)
+
+    def flush(self):
+        with self._lock:
+            self._log.flush()
+            self._idx.flush()
+
+    def sync(self):
+        self.flush()
+        os.fsync(self._log.fileno())
+        os.fsync(self._idx.fileno())
+
+    def compact(self):
+        """Viết lại log chỉ gồm bản ghi còn hiệu lực (theo thứ tự hiện tại) + index mới."""
+        with self._lock:
+            tmp_log, tmp_idx = self.path + '.compact', self.index_path + '.compact'
+            new_index: Dict[str, Tuple[int, int]] = {}
+            off = 0
+            with open(tmp_log, 'wb') as out, open(tmp_idx, 'w', encoding='utf-8') as idx:
+                for key, (old_off, length) in self._index.items():
+                    self._reader.seek(old_off)
+                    data = self._reader.read(length)
+                    out.write(data)
+                    idx.write(f"{off} {length} {key}\n")
+                    new_index[key] = (off, length)
+                    off += length
+            self._close_files()
+            os.replace(tmp_log, self.path)
+            os.replace(tmp_idx, self.index_path)
+            self._index = new_index
+            self._records = len(new_index)
+            self._log = open(self.path, 'ab')
+            self._reader = open(self.path, 'rb')
+            self._idx = open(self.index_path, 'a', encoding='utf-8')
+            self._size = off
+
+    def reload(self):
+        with self._lock:
+            self._close_files()
+            self._open()
+
+    def _close_files(self):
+        for f in (self._log, self._idx, self._reader):
+            try:
+                f.close()
+            except Exception:
+                pass
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._close_files()
+
+
+class SqliteResultsStore(ResultsStore):
+    """Bảng results(k PRIMARY KEY, v JSON); thứ tự theo rowid (thứ tự thêm vào)."""
+
+    backend = 'sqlite'
+    extension = '.sqlite3'
+
+    def __init__(self, path: str, key_func=None):
+        super().__init__(path, key_func)
+        import sqlite3
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS results (k TEXT PRIMARY KEY, v TEXT NOT NULL)')
+        self._db.commit()
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM results WHERE k = ?', (key,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute('SELECT k FROM results ORDER BY rowid')]
+
+    def _get_raw(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute('SELECT v FROM results WHERE k = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, key: str, item: Dict[str, Any]):
+        data = json.dumps(item, ensure_ascii=False)
+        # UPDATE trước để giữ nguyên rowid (thứ tự) khi thay bản ghi
+        cur = self._db.execute('UPDATE results SET v = ? WHERE k = ?', (data, key))
+        if cur.rowcount == 0:
+            self._db.execute('INSERT INTO results (k, v) VALUES (?, ?)', (key, data))
+
+    def flush(self):
+        with self._lock:
+            self._db.commit()
+
+    def compact(self):
+        with self._lock:
+            self._db.commit()
+            self._db.execute('VACUUM')
+
+    def fingerprint(self) -> Tuple:
+        # ở chế độ WAL, ghi mới nằm trong <db>-wal cho tới lúc checkpoint
+        fp = super().fingerprint()
+        try:
+            st = os.stat(self.path + '-wal')
+        except OSError:
+            return fp
+        return fp + (st.st_mtime_ns, st.st_size)
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+
+RESULTS_BACKENDS = {cls.backend: cls for cls in (JsonlResultsStore, SqliteResultsStore)}
+RESULTS_BACKEND = os.environ.get('LCTC_RESULTS_BACKEND', 'jsonl')
+
+
+def results_store_path(results_path: str, backend: Optional[str] = None) -> str:
+    """youtube_results.json -> youtube_results.jsonl / youtube_results.sqlite3 (đường dẫn đúng đuôi giữ nguyên)."""
+    cls = RESULTS_BACKENDS[backend or RESULTS_BACKEND]
+    root, ext = os.path.splitext(results_path)
+    return results_path if ext == cls.extension else root + cls.extension
+
+
+def open_results_store(results_path: str = 'youtube_results.json', backend: Optional[str] = None,
+                       key_func=None) -> ResultsStore:
+    """
+    Mở kho kết quả ứng với results_path. Lần đầu (kho chưa có) sẽ tự nhập youtube_results.json cũ;
+    file cũ được giữ nguyên.
+    """
+    backend = backend or RESULTS_BACKEND
+    cls = RESULTS_BACKENDS[backend]
+    path = results_store_path(results_path, backend)
+    fresh = not os.path.exists(path)
+    store = cls(path, key_func)
+    if fresh and path != results_path and os.path.exists(results_path):
+        try:
+            store.import_legacy_json(results_path)
+        except Exception:
+            pass  # file cũ hỏng: bắt đầu kho rỗng như load_existing_index trước đây
+    return store
+
+
+_SHARED_STORES: Dict[Tuple[str, str], ResultsStore] = {}
+_SHARED_STORES_LOCK = threading.Lock()
+
+
+def shared_results_store(results_path: str = 'youtube_results.json', backend: Optional[str] = None,
+                         key_func=None) -> ResultsStore:
+    """Một kho mở sẵn cho mỗi đường dẫn, dùng chung trong cả tiến trình (đóng khi thoát)."""
+    backend = backend or RESULTS_BACKEND
+    key = (os.path.abspath(results_store_path(results_path, backend)), backend)
+    with _SHARED_STORES_LOCK:
+        store = _SHARED_STORES.get(key)
+        if store is None:
+            store = _SHARED_STORES[key] = open_results_store(results_path, backend, key_func)
+        return store
+
+
+@atexit.register
+def close_shared_results_stores():
+    with _SHARED_STORES_LOCK:
+        stores = list(_SHARED_STORES.values())
+        _SHARED_STORES.clear()
+        _SHARED_INDEXES.clear()
+    for store in stores:
+        try:
+            store.close()
+        except Exception:
+            pass
+
+
+RESULTS_CACHE_MAX_BODIES = 256
+
+
+class ResultsIndex:
+    """
+    Cache trong tiến trình cho một kho kết quả: nạp một lần cho mọi lượt chạy, cập nhật tại chỗ khi gộp
+    kết quả mới, tự nạp lại khi file kho bị tiến trình khác thay đổi (so inode + mtime + kích thước).
+    Kết quả đầy đủ (kèm phụ đề) chỉ giữ trong LRU tối đa max_bodies bản; bản khác đọc lại từ kho khi cần.
+    """
+
+    def __init__(self, store: ResultsStore, max_bodies: int = RESULTS_CACHE_MAX_BODIES):
+        self.store = store
+        self.max_bodies = max(0, int(max_bodies))
+        self._bodies: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.RLock()
+        self._fingerprint = store.fingerprint()
+
+    def refresh(self) -> bool:
+        """Nạp lại nếu file kho đã đổi từ lần đọc/ghi trước. Trả True nếu đã nạp lại."""
+        with self._lock:
+            if self.store.fingerprint() == self._fingerprint:
+                return False
+            self.store.reload()
+            self._bodies.clear()
+            self._fingerprint = self.store.fingerprint()
+            return True
+
+    def _remember(self, key: str, item: Dict[str, Any]):
+        if not self.max_bodies:
+            return
+        self._bodies[key] = item
+        self._bodies.move_to_end(key)
+        while len(self._bodies) > self.max_bodies:
+            self._bodies.popitem(last=False)
+
+    # --- đọc (giống dict, như ResultsStore)
+    def __contains__(self, key) -> bool:
+        return key in self.store
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def keys(self) -> List[str]:
+        return self.store.keys()
+
+    def get(self, key, default=None):
+        if not key:
+            return default
+        with self._lock:
+            item = self._bodies.get(key)
+            if item is not None:
+                self._bodies.move_to_end(key)
+                return item
+            item = self.store.get(key)
+            if item is None:
+                return default
+            self._remember(key, item)
+            return item
+
+    def __getitem__(self, key) -> Dict[str, Any]:
+        item = self.get(key)
+        if item is None:
+            raise KeyError(key)
+        return item
+
+    def values(self) -> Iterator[Dict[str, Any]]:
+        # duyệt toàn bộ: đọc thẳng từ kho, không đẩy mọi bản ghi qua LRU
+        return self.store.values()
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        return self.store.items()
+
+    # --- ghi
+    def add(self, item: Dict[str, Any], replace: bool = False) -> bool:
+        with self._lock:
+            self.refresh()
+            added = self.store.add(item, replace=replace)
+            if added:
+                self._remember(self.store.key_func(item), item)
+                self.store.flush()
+                self._fingerprint = self.store.fingerprint()
+            return added
+
+    def merge(self, items: Iterable[Dict[str, Any]]) -> int:
+        """Gộp kết quả mới vào kho và cache (không ghi đè bản cũ). Trả về số bản ghi đã thêm."""
+        appended = 0
+        with self._lock:
+            self.refresh()
+            for item in items:
+                if item and self.store.add(item):
+                    appended += 1
+                    self._remember(self.store.key_func(item), item)
+            self.store.flush()
+            self._fingerprint = self.store.fingerprint()
+        return appended
+
+    # --- bảo trì
+    def compact(self):
+        """Thu gọn kho (bỏ bản ghi đã bị thay); cache nội dung giữ nguyên vì khóa không đổi."""
+        with self._lock:
+            self.refresh()
+            self.store.compact()
+            self._fingerprint = self.store.fingerprint()
+
+    def export_legacy_json(self, legacy_path: str) -> int:
+        """Xuất kho ra youtube_results.json kiểu cũ (mảng JSON) cho công cụ còn đọc định dạng đó."""
+        with self._lock:
+            self.refresh()
+            return self.store.export_legacy_json(legacy_path)
+
+
+_SHARED_INDEXES: Dict[int, ResultsIndex] = {}
+
+
+def shared_results_index(results_path: str = 'youtube_results.json', backend: Optional[str] = None,
+                         key_func=None, max_bodies: int = RESULTS_CACHE_MAX_BODIES) -> ResultsIndex:
+    """Cache dùng chung cho kho của results_path; mỗi lần lấy chỉ stat file kho để kiểm tra thay đổi."""
+    store = shared_results_store(results_path, backend, key_func)
+    with _SHARED_STORES_LOCK:
+        index = _SHARED_INDEXES.get(id(store))
+        if index is None or index.store is not store:
+            index = _SHARED_INDEXES[id(store)] = ResultsIndex(store, max_bodies)
+    index.refresh()
+    return index
+
+
+# ====== Nhật ký lượt chạy (checkpoint + tiếp tục lượt dở) =====
+JOURNAL_STAGES = ('folders', 'fetched', 'assigned')
+
+
+RESULT_SUMMARY_KEYS = ('url', 'video_id', 'title', 'duration', 'status', 'error', 'subtitle_format', 'subtitle_lang')
+
+
+def result_summary(result: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Bản rút gọn của một kết quả (không có phụ đề) để giữ trong bộ nhớ sau khi đã ghi ra đĩa."""
+    if result is None:
+        return None
+    return {k: result[k] for k in RESULT_SUMMARY_KEYS if k in result}
+
+
+def run_journal_id(params: Dict[str, Any], urls: List[str]) -> str:
+    """Mã lượt chạy: cùng danh sách URL + cùng tham số (prefix, start, pad...) => cùng mã."""
+    data = json.dumps({'params': params, 'urls': list(urls)}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()[:12]
+
+
+def run_journal_path(dest_dir: str, params: Dict[str, Any], urls: List[str]) -> str:
+    return os.path.join(dest_dir, f".lctc-run-{run_journal_id(params, urls)}.jsonl")
+
+
+def find_run_journal(dest_dir: str, params: Dict[str, Any], urls: List[str]) -> Optional[str]:
+    """Đường dẫn nhật ký lượt chạy dở (nếu có) cho đúng danh sách URL + tham số này."""
+    path = run_journal_path(dest_dir, params, urls)
+    return path if os.path.exists(path) else None
+
+
+class RunJournal:
+    """
+    Nhật ký JSONL của một lượt chạy, nằm trong thư mục đích (.lctc-run-<mã>.jsonl).
+    Mỗi sự kiện (xong giai đoạn, kết quả một video, đã gán một video) là một dòng, ghi + fsync ngay,
+    nên crash / Ctrl-C / hủy chỉ mất video đang chạy dở. Dòng cuối bị cắt khi crash được bỏ qua.
+    resume=True: nạp lại nhật ký cũ (nếu có) để chỉ làm nốt phần chưa xong; False: bắt đầu lại từ đầu.
+    Kết quả đã có trong kho kết quả chỉ ghi tham chiếu (vị trí, khóa, trạng thái) thay vì cả phụ đề;
+    khi tiếp tục, nội dung được lấy lại từ `store` (kho / ResultsIndex) — thiếu trong kho thì tải lại.
+    """
+
+    def __init__(self, dest_dir: str, params: Dict[str, Any], urls: List[str], resume: bool = True,
+                 store=None):
+        self.params = dict(params)
+        self.urls = list(urls)
+        self.store = store
+        self.path = run_journal_path(dest_dir, self.params, self.urls)
+        self.stages: set = set()
+        self.results: Dict[int, Dict[str, Any]] = {}
+        self.assigned: set = set()
+        self.resumed = False
+        self._lock = threading.Lock()
+        if resume and os.path.exists(self.path):
+            self._load()
+        if not self.resumed:
+            with open(self.path, 'w', encoding='utf-8'):
+                pass
+        self._f = open(self.path, 'a', encoding='utf-8')
+        if not self.resumed:
+            self._write({'t': 'run', 'params': self.params, 'urls': self.urls, 'time': time.time()})
+
+    def _load(self):
+        good = 0
+        refs: Dict[int, Dict[str, Any]] = {}
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError
+                    rec = json.loads(line)
+                except ValueError:
+                    break  # dòng cuối cụt (crash khi đang ghi)
+                good += len(line)
+                t = rec.get('t')
+                if t == 'run':
+                    if rec.get('urls') != self.urls or rec.get('params') != self.params:
+                        return  # nhật ký của lượt khác: bắt đầu lại
+                    self.resumed = True
+                elif t == 'stage':
+                    self.stages.add(rec.get('stage'))
+                elif t == 'result' and isinstance(rec.get('r'), dict):
+                    self.results[int(rec['i'])] = rec['r']
+                elif t == 'result' and isinstance(rec.get('ref'), dict):
+                    refs[int(rec['i'])] = rec['ref']
+                elif t == 'assigned':
+                    self.assigned.add(int(rec['i']))
+        for i, ref in refs.items():
+            if i in self.assigned:
+                # đã ghi ra đĩa ở lượt trước: chỉ cần bản rút gọn, không đọc kho
+                self.results[i] = {'url': self.urls[i], 'status': ref.get('status')}
+                continue
+            body = self.store.get(ref.get('k')) if self.store is not None else None
+            if body is not None:
+                self.results[i] = {'status': 'success', **body, 'url': self.urls[i]}
+        for i in self.assigned & self.results.keys():
+            self.results[i] = result_summary(self.results[i])  # đã ghi ra đĩa ở lượt trước
+        for i in [i for i, r in self.results.items() if r and r.get('caption_tracks')]:
+            del self.results[i]  # phụ đề chưa tải (URL track có hạn dùng): lượt này trích xuất lại
+        if self.resumed and good < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good)
+
+    def _write(self, rec: Dict[str, Any]):
+        line = json.dumps(rec, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._f.write(line)
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    # --- giai đoạn
+    def stage_done(self, stage: str) -> bool:
+        return stage in self.stages
+
+    def mark_stage(self, stage: str):
+        if stage not in self.stages:
+            self.stages.add(stage)
+            self._write({'t': 'stage', 'stage': stage})
+
+    # --- kết quả từng video (idx = vị trí trong danh sách URL)
+    def record_result(self, idx: int, result: Dict[str, Any], stored_key: Optional[str] = None):
+        """stored_key: khóa của kết quả trong kho kết quả (đã lưu ở đó) => nhật ký chỉ ghi tham chiếu."""
+        if result is None:
+            return
+        self.results[idx] = result
+        if stored_key:
+            self._write({'t': 'result', 'i': idx, 'ref': {'k': stored_key, 'status': result.get('status')}})
+        else:
+            self._write({'t': 'result', 'i': idx, 'r': result})
+
+    def pending(self) -> List[int]:
+        """Vị trí các URL chưa có kết quả trong nhật ký."""
+        return [i for i in range(len(self.urls)) if i not in self.results]
+
+    def result_list(self) -> List[Optional[Dict[str, Any]]]:
+        return [self.results.get(i) for i in range(len(self.urls))]
+
+    def mark_assigned(self, idx: int):
+        if idx not in self.assigned:
+            self.assigned.add(idx)
+            if idx in self.results:
+                self.results[idx] = result_summary(self.results[idx])  # đã ghi ra đĩa: bỏ phụ đề khỏi RAM
+            self._write({'t': 'assigned', 'i': idx})
+
+    def summary(self) -> str:
+        done = [s for s in JOURNAL_STAGES if s in self.stages]
+        return (f"{len(self.results)}/{len(self.urls)} video đã có kết quả, "
+                f"{len(self.assigned)} đã gán; giai đoạn xong: {', '.join(done) or 'chưa có'}")
+
+    def close(self):
+        with self._lock:
+            if not self._f.closed:
+                self._f.close()
+
+    def finish(self):
+        """Lượt chạy xong trọn vẹn: xóa nhật ký."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ====== Dựng cây thư mục <prefix>-<n>: quét một lần, tạo song song =====
+SCAFFOLD_WORKERS = 8
+
+
+def scan_dir_names(path: str) -> Optional[set]:
+    """Tên (đã normcase) các mục trong thư mục; None nếu thư mục không tồn tại."""
+    try:
+        with os.scandir(path) as it:
+            return {os.path.normcase(entry.name) for entry in it}
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def scaffold_folders(dest_dir: str, names: List[str], subfolders: Iterable[str],
+                     files_for: Callable[[str], Iterable[str]], make_file: Callable[[str], None],
+                     workers: int = SCAFFOLD_WORKERS,
+                     should_stop: Optional[Callable[[], bool]] = None,
+                     on_folder: Optional[Callable[[int, str, bool], None]] = None) -> Tuple[int, int, int]:
+    """
+    Đảm bảo dest_dir/<name>/{subfolders, files_for(name)} cho mọi name (đã sanitize).
+    - dest_dir quét một lần bằng os.scandir: thư mục mới không cần kiểm tra gì thêm,
+      thư mục đã có chỉ quét một lần để biết phần còn thiếu.
+    - Phần còn thiếu được tạo trên pool `workers` luồng (file thiếu tạo bằng make_file(đường dẫn)).
+    - on_folder(i, path, created) gọi khi xong thư mục thứ i (tuần tự, theo thứ tự hoàn thành).
+    Trả về (tổng, mới tạo, đã tồn tại) như build_range.
+    """
+    subfolders = list(subfolders)
+    should_stop = should_stop or (lambda: False)
+    os.makedirs(dest_dir, exist_ok=True)
+    existing = scan_dir_names(dest_dir) or set()
+    lock = threading.Lock()
+    counts = {'created': 0, 'skipped': 0}
+
+    def build(i: int, name: str):
+        if should_stop():
+            return
+        base = os.path.join(dest_dir, name)
+        created = os.path.normcase(name) not in existing
+        present: set = set()
+        if created:
+            try:
+                os.mkdir(base)
+            except FileExistsError:  # vừa được tạo từ bên ngoài sau lần quét
+                created = False
+        if not created:
+            present = scan_dir_names(base) or set()
+        for sf in subfolders:
+            if os.path.normcase(sf) not in present:
+                os.makedirs(os.path.join(base, sf), exist_ok=True)
+        for fn in files_for(name):
+            if os.path.normcase(fn) not in present:
+                make_file(os.path.join(base, fn))
+        with lock:
+            counts['created' if created else 'skipped'] += 1
+            if on_folder:
+                on_folder(i, base, created)
+
+    if names:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(names))),
+                                thread_name_prefix="lctc-scaffold") as pool:
+            for _ in pool.map(build, range(len(names)), names):
+                pass  # lấy kết quả để lỗi (nếu có) được ném ra ở đây
+    return len(names), counts['created'], counts['skipped']
+
+
+# ====== Tạo file từ template.docx: reflink / copy_file_range / hardlink / ghi từ bộ nhớ =====
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FICLONE = 0x40049409  # ioctl reflink của Linux (btrfs, XFS, bcachefs...)
+TEMPLATE_HARDLINK = os.environ.get('LCTC_TEMPLATE_HARDLINK', '') not in ('', '0')
+
+
+class TemplateFile:
+    """
+    Template đọc một lần (bytes giữ trong bộ nhớ) rồi nhân bản ra nhiều file đích, theo thứ tự thử:
+      1. hardlink (chỉ khi bật: hardlink=True / LCTC_TEMPLATE_HARDLINK=1) — không tốn thêm dung lượng;
+         Word lưu bằng cách ghi file mới nên link tự tách ra ở lần sửa đầu tiên.
+         Trình sửa ghi đè tại chỗ sẽ sửa luôn template, nên mặc định tắt.
+      2. reflink (FICLONE) — chia sẻ block trên btrfs/XFS..., không đọc/ghi dữ liệu.
+      3. os.copy_file_range — sao chép trong kernel, không qua user space.
+      4. ghi bytes đã cache (buffered write) — không đọc lại template từ đĩa.
+    Cách nào lỗi (vd ổ đĩa không hỗ trợ) thì không thử lại cho tới lần refresh() sau (đầu lượt chạy kế tiếp).
+    refresh() nạp lại khi template bị thay đổi (so mtime + kích thước).
+    """
+
+    def __init__(self, path: str, hardlink: bool = TEMPLATE_HARDLINK):
+        self.path = os.path.abspath(path)
+        self.hardlink = hardlink
+        self.stats: Dict[str, int] = {}
+        self._data: Optional[bytes] = None
+        self._stat: Optional[Tuple[int, int]] = None
+        self._src_fd: Optional[int] = None
+        self._unsupported: set = set()
+        self._lock = threading.Lock()
+        self.refresh()
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    @property
+    def data(self) -> Optional[bytes]:
+        """Nội dung template (đã cache); None nếu không có template."""
+        return self._data
+
+    def refresh(self) -> bool:
+        """Đọc lại template nếu đổi từ lần trước. Trả True nếu template tồn tại."""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except OSError:
+                self._close_src()
+                self._data = self._stat = None
+                return False
+            if self._stat != (st.st_mtime_ns, st.st_size):
+                self._close_src()
+                with open(self.path, 'rb') as f:
+                    self._data = f.read()
+                self._stat = (st.st_mtime_ns, st.st_size)
+            self._unsupported.clear()  # lượt mới có thể ghi ra ổ đĩa khác
+            return True
+
+    def _src(self) -> int:
+        with self._lock:
+            if self._src_fd is None:
+                self._src_fd = os.open(self.path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+            return self._src_fd
+
+    def _close_src(self):
+        if self._src_fd is not None:
+            try:
+                os.close(self._src_fd)
+            except OSError:
+                pass
+            self._src_fd = None
+
+    def _count(self, method: str):
+        with self._lock:
+            self.stats[method] = self.stats.get(method, 0) + 1
+
+    def _try(self, method: str, func) -> bool:
+        if method in self._unsupported:
+            return False
+        try:
+            func()
+            return True
+        except OSError:
+            with self._lock:
+                self._unsupported.add(method)
+            return False
+
+    def _clone(self, dst_fd: int):
+        fcntl.ioctl(dst_fd, FICLONE, self._src())
+
+    def _copy_range(self, dst_fd: int):
+        src, off, size = self._src(), 0, len(self._data)
+        while off < size:
+            n = os.copy_file_range(src, dst_fd, size - off, off, off)
+            if n <= 0:
+                raise OSError("copy_file_range không sao chép được")
+            off += n
+
+    def instantiate(self, dst: str) -> str:
+        """Tạo dst từ template (ghi đè nếu đã có). Trả về cách đã dùng. Template không có => file rỗng."""
+        data = self._data
+        if data is None:
+            open(dst, 'a', encoding='utf-8').close()
+            self._count('empty')
+            return 'empty'
+
+        exists = True
+        try:
+            if os.lstat(dst).st_nlink > 1:
+                os.unlink(dst)  # không ghi xuyên qua hardlink (có thể chính là template)
+                exists = False
+        except FileNotFoundError:
+            exists = False
+        if self.hardlink and not exists:
+            if self._try('hardlink', lambda: os.link(self.path, dst)):
+                self._count('hardlink')
+                return 'hardlink'
+
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            if data:
+                for method, func, usable in (('reflink', self._clone, fcntl is not None),
+                                             ('copy_file_range', self._copy_range,
+                                              hasattr(os, 'copy_file_range'))):
+                    if usable and self._try(method, lambda: func(fd)):
+                        self._count(method)
+                        return method
+                    os.ftruncate(fd, 0)  # bỏ phần ghi dở (nếu có) trước khi thử cách khác
+            view, off = memoryview(data), 0
+            while off < len(data):
+                off += os.write(fd, view[off:])
+            self._count('write')
+            return 'write'
+        finally:
+            os.close(fd)
+
+    def describe(self) -> str:
+        with self._lock:
+            return ", ".join(f"{k} {v}" for k, v in sorted(self.stats.items())) or "chưa tạo file nào"
+
+    def close(self):
+        with self._lock:
+            self._close_src()
+
+
+_SHARED_TEMPLATES: Dict[str, TemplateFile] = {}
+_SHARED_TEMPLATES_LOCK = threading.Lock()
+
+
+def shared_template(path: str, refresh: bool = False) -> TemplateFile:
+    """Một TemplateFile cho mỗi đường dẫn trong cả tiến trình; refresh=True kiểm tra lại file (đầu mỗi lượt)."""
+    key = os.path.abspath(path)
+    with _SHARED_TEMPLATES_LOCK:
+        tpl = _SHARED_TEMPLATES.get(key)
+        if tpl is None:
+            tpl = _SHARED_TEMPLATES[key] = TemplateFile(key)
+            return tpl
+    if refresh:
+        tpl.refresh()
+    return tpl
+
+
+# ====== Điền DOCX từ template: thay placeholder trong word/document.xml, ghi zip trực tiếp =====
+DOCX_DOCUMENT = 'word/document.xml'
+DOCX_FIELDS = ('name', 'title', 'url', 'video_id', 'duration', 'transcript')
+# Template không có placeholder nào => dùng bố cục mặc định (mỗi phần tử một đoạn văn)
+DOCX_DEFAULT_LAYOUTS = {
+    'main': ('{{title}}', 'URL: {{url}}', 'Thời lượng: {{duration}} giây', '', '{{transcript}}'),
+    'desc': ('{{title}}', 'URL: {{url}}'),
+}
+# {{ khóa }} kể cả khi Word tách placeholder ra nhiều run (<w:t>{{ti</w:t></w:r><w:r><w:t>tle}}</w:t>)
+_DOCX_PLACEHOLDER_RE = re.compile(r'\{(?:<[^>]*>)*\{((?:[^{}<]|<[^>]*>)*?)\}(?:<[^>]*>)*\}')
+_XML_TAG_RE = re.compile(r'<[^>]*>')
+_XML_INVALID_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_ZIP_LOCAL = struct.Struct('<4s2B4HL2L2H')
+_ZIP_CENTRAL = struct.Struct('<4s4B4HL2L5H2L')
+_ZIP_END = struct.Struct('<4s4H2LH')
+
+
+def _xml_text(value) -> str:
+    return html.escape(_XML_INVALID_RE.sub('', '' if value is None else str(value)), quote=False)
+
+
+def _dos_datetime(date_time) -> Tuple[int, int]:
+    y, mo, d, h, mi, sec = date_time
+    return (h << 11) | (mi << 5) | (sec // 2), (max(y, 1980) - 1980) << 9 | (mo << 5) | d
+
+
+class DocxTemplate:
+    """
+    Mở template.docx một lần: mọi phần khác word/document.xml giữ nguyên dạng nén (không nén lại),
+    document.xml được tách sẵn thành các đoạn chữ + placeholder {{name}} {{title}} {{url}} {{video_id}}
+    {{duration}} {{transcript}}. Mỗi file đích chỉ cần ghép chuỗi, nén document.xml và ghi một luồng zip;
+    không cần Word hay python-docx.
+    Template không có placeholder: chèn đoạn văn theo DOCX_DEFAULT_LAYOUTS[layout] vào cuối thân văn bản
+    (thân văn bản chỉ toàn khoảng trắng thì thay hẳn).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._members: List[Tuple[zipfile.ZipInfo, bytes]] = []
+        with zipfile.ZipFile(path) as zf, open(path, 'rb') as raw:
+            xml = zf.read(DOCX_DOCUMENT).decode('utf-8')
+            for info in zf.infolist():
+                if info.filename == DOCX_DOCUMENT:
+                    continue
+                raw.seek(info.header_offset)
+                header = raw.read(_ZIP_LOCAL.size)
+                name_len, extra_len = struct.unpack('<HH', header[26:30])
+                raw.seek(info.header_offset + _ZIP_LOCAL.size + name_len + extra_len)
+                self._members.append((info, raw.read(info.compress_size)))
+        self._parts: List[str] = []   # chẵn: chữ cố định, lẻ: tên trường
+        pos = 0
+        for m in _DOCX_PLACEHOLDER_RE.finditer(xml):
+            self._parts += [xml[pos:m.start()], _XML_TAG_RE.sub('', m.group(1)).strip()]
+            pos = m.end()
+        self._parts.append(xml[pos:])
+        self.has_placeholders = len(self._parts) > 1
+        body = xml.find('<w:body>') + len('<w:body>')
+        end = xml.rfind('<w:sectPr', body)
+        if end < 0:
+            end = xml.rfind('</w:body>')
+        blank_body = not _XML_TAG_RE.sub('', xml[body:end]).strip()
+        self._head, self._tail = xml[:body if blank_body else end], xml[end:]
+        self._prefix, self._central = self._build_prefix()
+        self.written = 0
+
+    def _build_prefix(self) -> Tuple[bytes, List[bytes]]:
+        """Local header + dữ liệu nén của các phần cố định (ghi y nguyên vào mọi file đích)."""
+        out, central = [], []
+        offset = 0
+        for info, data in self._members:
+            name = info.filename.encode('utf-8')
+            flags = 0x800 if info.flag_bits & 0x800 else 0
+            dos_time, dos_date = _dos_datetime(info.date_time)
+            out.append(_ZIP_LOCAL.pack(b'PK\x03\x04', 20, 0, flags, info.compress_type, dos_time, dos_date,
+                                       info.CRC, info.compress_size, info.file_size, len(name), 0) + name + data)
+            central.append(_ZIP_CENTRAL.pack(b'PK\x01\x02', 20, 0, 20, 0, flags, info.compress_type,
+                                             dos_time, dos_date, info.CRC, info.compress_size, info.file_size,
+                                             len(name), 0, 0, 0, 0, info.external_attr, offset) + name)
+            offset += len(out[-1])
+        return b''.join(out), central
+
+    # --- document.xml
+    @staticmethod
+    def _inline(value) -> str:
+        """Giá trị nhiều dòng bên trong một <w:t>: xuống dòng => <w:br/>."""
+        lines = _xml_text(value).split('\n')
+        return '</w:t><w:br/><w:t xml:space="preserve">'.join(lines)
+
+    @staticmethod
+    def _paragraphs(line: str, values: Dict[str, Any], bold: bool) -> Iterator[str]:
+        text = re.sub(r'\{\{(\w+)\}\}', lambda m: str(values.get(m.group(1), '') or ''), line)
+        rpr = '<w:rPr><w:b/></w:rPr>' if bold else ''
+        for ln in text.split('\n'):
+            if ln.strip():
+                yield f'<w:p><w:r>{rpr}<w:t xml:space="preserve">{_xml_text(ln)}</w:t></w:r></w:p>'
+            else:
+                yield '<w:p/>'
+
+    def render_document(self, values: Dict[str, Any], layout: str = 'main') -> str:
+        if self.has_placeholders:
+            parts = self._parts
+            return ''.join(p if i % 2 == 0 else self._inline(values.get(p, ''))
+                           for i, p in enumerate(parts))
+        paras = []
+        for i, line in enumerate(DOCX_DEFAULT_LAYOUTS.get(layout, DOCX_DEFAULT_LAYOUTS['main'])):
+            paras.extend(self._paragraphs(line, values, bold=(i == 0)))
+        return self._head + ''.join(paras) + self._tail
+
+    # --- ghi
+    def write(self, dst: str, values: Dict[str, Any], layout: str = 'main'):
+        """Ghi dst (file tạm rồi os.replace: không bao giờ để lại docx ghi dở, không ghi xuyên hardlink)."""
+        xml = self.render_document(values, layout).encode('utf-8')
+        comp = zlib.compressobj(6, zlib.DEFLATED, -15)
+        data = comp.compress(xml) + comp.flush()
+        crc = zlib.crc32(xml)
+        name = DOCX_DOCUMENT.encode('utf-8')
+        dos_time, dos_date = _dos_datetime(time.localtime()[:6])
+        offset = len(self._prefix)
+        local = _ZIP_LOCAL.pack(b'PK\x03\x04', 20, 0, 0, zipfile.ZIP_DEFLATED, dos_time, dos_date,
+                                crc, len(data), len(xml), len(name), 0) + name
+        central = self._central + [_ZIP_CENTRAL.pack(b'PK\x01\x02', 20, 0, 20, 0, 0, zipfile.ZIP_DEFLATED,
+                                                     dos_time, dos_date, crc, len(data), len(xml),
+                                                     len(name), 0, 0, 0, 0, 0o644 << 16, offset) + name]
+        cd = b''.join(central)
+        cd_offset = offset + len(local) + len(data)
+        end = _ZIP_END.pack(b'PK\x05\x06', 0, 0, len(central), len(central), len(cd), cd_offset, 0)
+        tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(self._prefix)
+                f.write(local)
+                f.write(data)
+                f.write(cd)
+                f.write(end)
+            os.replace(tmp, dst)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        self.written += 1
+
+
+_SHARED_DOCX: Dict[str, Tuple[Tuple[int, int], DocxTemplate]] = {}
+
+
+def shared_docx_template(path: str) -> Optional[DocxTemplate]:
+    """DocxTemplate dùng chung (mở lại khi template đổi mtime/kích thước); None nếu không có / không phải docx."""
+    key = os.path.abspath(path)
+    try:
+        st = os.stat(key)
+    except OSError:
+        return None
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _SHARED_TEMPLATES_LOCK:
+        cached = _SHARED_DOCX.get(key)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        try:
+            tpl = DocxTemplate(key)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+        _SHARED_DOCX[key] = (stamp, tpl)
+        return tpl
+
+
+def _is_blank_copy(path: str, blank: Optional[bytes]) -> bool:
+    """File còn là bản trắng mới tạo (rỗng hoặc giống hệt template) => chưa ai sửa, được phép điền."""
+    try:
+        size = os.path.getsize(path)
+        if size == 0:
+            return True
+        if blank is None or size != len(blank):
+            return False
+        with open(path, 'rb') as f:
+            return f.read() == blank
+    except OSError:
+        return False
+
+
+def fill_template_docs(template_path: str, folder: str, docs: Iterable[Tuple[str, str]],
+                       values: Dict[str, Any]) -> int:
+    """
+    Điền các docx (tên file, bố cục) trong folder từ template; chỉ ghi đè file còn là bản trắng
+    (rỗng / giống hệt template), không đụng vào file đã có người sửa. Trả về số file đã điền.
+    """
+    tpl = shared_docx_template(template_path)
+    if tpl is None:
+        return 0
+    blank = shared_template(template_path).data
+    filled = 0
+    for filename, layout in docs:
+        dst = os.path.join(folder, filename)
+        if not os.path.exists(dst) or _is_blank_copy(dst, blank):
+            tpl.write(dst, values, layout)
+            filled += 1
+    return filled
+
+
+# ====== Ghi file kết quả: nguyên tử, bỏ qua nội dung không đổi =====
+WRITE_WORKERS = 4
+WRITE_WRITTEN, WRITE_UNCHANGED, WRITE_FAILED = 'written', 'unchanged', 'failed'
+
+
+def _file_digest(path: str) -> Optional[bytes]:
+    h = hashlib.sha1()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+    except OSError:
+        return None
+    return h.digest()
+
+
+def write_bytes_if_changed(path: str, data: bytes) -> bool:
+    """
+    Ghi data vào path nếu nội dung khác (so kích thước rồi hash), qua file tạm + os.replace
+    nên không bao giờ để lại file ghi dở. Trả True nếu đã ghi, False nếu file đã giống hệt.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = None
+    if size == len(data) and _file_digest(path) == hashlib.sha1(data).digest():
+        return False
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return True
+
+
+def write_text_if_changed(path: str, text: str) -> bool:
+    """Như write_bytes_if_changed cho văn bản UTF-8 (xuống dòng theo hệ điều hành, như open(path, 'w'))."""
+    if os.linesep != '\n':
+        text = text.replace('\n', os.linesep)
+    return write_bytes_if_changed(path, text.encode('utf-8'))
+
+
+def write_lines_if_changed(path: str, lines: Iterable[str],
+                           keep_chars: int = 0) -> Optional[Tuple[bool, str, bool]]:
+    """
+    Như write_text_if_changed cho các dòng đến dần (generator): ghi lần lượt vào file tạm, vừa ghi vừa hash,
+    nên bộ nhớ không phụ thuộc độ dài nội dung. Giữ keep_chars ký tự đầu (nối bằng '\n') làm bản xem trước.
+    Trả về (đã ghi, bản xem trước, bản xem trước bị cắt) hoặc None nếu không có dòng nào (path giữ nguyên).
+    Lỗi giữa chừng (vd mất kết nối khi đang tải) => xóa file tạm, ném lỗi ra; path không bao giờ bị ghi dở.
+    """
+    sep = os.linesep.encode('utf-8')
+    h = hashlib.sha1()
+    size = 0
+    preview: List[str] = []
+    kept = 0
+    truncated = False
+    first = True
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, 'wb') as f:
+            for line in lines:
+                data = line.encode('utf-8') if first else sep + line.encode('utf-8')
+                f.write(data)
+                h.update(data)
+                size += len(data)
+                piece = line if first else '\n' + line
+                first = False
+                if kept < keep_chars:
+                    cut = piece[:keep_chars - kept]
+                    preview.append(cut)
+                    kept += len(cut)
+                    truncated = len(cut) < len(piece)
+                else:
+                    truncated = True
+        if first:
+            os.remove(tmp)
+            return None
+        try:
+            same = os.path.getsize(path) == size and _file_digest(path) == h.digest()
+        except OSError:
+            same = False
+        if same:
+            os.remove(tmp)
+        else:
+            os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return not same, ''.join(preview), truncated
+
+
+# ====== Chuẩn hóa URL YouTube: regex biên dịch sẵn, mỗi chuỗi input chỉ parse một lần =====
+WATCH_URL = "https://www.youtube.com/watch?v={}"
+URL_PARSE_CACHE_SIZE = 1 << 16
+
+# watch?v= (v ở vị trí bất kỳ trong query), embed/ v/ e/ shorts/ live/, youtu.be/<id> (kèm ?si=, &t=, ...)
+# trên youtube.com, www./m./music., youtube-nocookie.com
+_VIDEO_URL_RE = re.compile(
+    r'(?:^|[^\w.-])(?:https?://)?(?:(?:www|m|music)\.)?'
+    r'(?:youtube(?:-nocookie)?\.com/(?:watch/?\?(?:[^#\s]*?&)?v=|(?:embed|v|e|shorts|live)/)|youtu\.be/)'
+    r'([\w-]{11})(?![\w-])',
+    re.IGNORECASE)
+_VIDEO_ID_RE = re.compile(r'^[\w-]{11}$')
+
+# playlist?list=..., kênh (@handle, channel/UC..., c/..., user/...) kèm tab tùy chọn (/videos, /shorts, /streams)
+COLLECTION_URL_RE = re.compile(
+    r'^(?:https?://)?(?:www\.|m\.|music\.)?youtube\.com/'
+    r'(?:playlist\?(?:[^#]*&)?list=[\w-]+|(?:@[^/?#\s]+|channel/[\w-]+|c/[^/?#\s]+|user/[^/?#\s]+)'
+    r'(?:/(?:videos|shorts|streams|featured))?/?(?:[?#]\S*)?$)',
+    re.IGNORECASE)
+
+
+class VideoRef(NamedTuple):
+    video_id: str
+    url: str        # URL chuẩn: https://www.youtube.com/watch?v=<id>
+    original: str   # chuỗi input gốc
+
+
+@functools.lru_cache(maxsize=URL_PARSE_CACHE_SIZE)
+def parse_video_url(text: str) -> Optional[VideoRef]:
+    """Chuỗi input -> VideoRef, None nếu không phải URL một video. Kết quả được nhớ theo chuỗi input."""
+    if not text:
+        return None
+    m = _VIDEO_URL_RE.search(text)
+    if not m:
+        return None
+    vid = m.group(1)
+    return VideoRef(vid, WATCH_URL.format(vid), text)
+
+
+def extract_video_id(url: str) -> Optional[str]:
+    ref = parse_video_url(url)
+    return ref.video_id if ref else None
+
+
+def is_collection_url(url: str) -> bool:
+    """URL playlist / kênh (cần liệt kê ra từng video), không phải URL một video."""
+    return bool(COLLECTION_URL_RE.match(url.strip()))
+
+
+# ====== Hàng đợi log cho GUI: gom theo lô, giới hạn số dòng, ghi đầy đủ ra file xoay vòng =====
+LOG_MAX_LINES = 2000                 # số dòng giữ trên textbox (cũ hơn chỉ còn trong file log)
+LOG_FILE = os.environ.get('LCTC_LOG_FILE', 'lctc_pipeline.log')  # '' = không ghi file
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+
+class LogSink:
+    """
+    put(message, tag) gọi từ bất kỳ luồng nào: chỉ đẩy vào hàng đợi (+ ghi file xoay vòng nếu có).
+    drain() gọi từ luồng UI theo nhịp cố định: lấy hết phần đang chờ, chỉ giữ `max_lines` dòng cuối
+    (phần bị bỏ vẫn có trong file) và gộp các dòng liền nhau cùng tag => [(text, tag), ...].
+    """
+
+    def __init__(self, max_lines: int = LOG_MAX_LINES, path: Optional[str] = LOG_FILE,
+                 max_bytes: int = LOG_FILE_MAX_BYTES, backups: int = LOG_FILE_BACKUPS):
+        self.max_lines = max(1, int(max_lines))
+        self._queue: "queue.SimpleQueue[Tuple[str, Optional[str]]]" = queue.SimpleQueue()
+        self._logger: Optional[logging.Logger] = None
+        self._handler: Optional[logging.Handler] = None
+        if path:
+            try:
+                handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                               encoding='utf-8', delay=True)
+            except OSError:
+                handler = None
+            if handler:
+                handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+                self._logger = logging.getLogger(f'lctc.log.{id(self):x}')
+                self._logger.propagate = False
+                self._logger.setLevel(logging.INFO)
+                self._logger.addHandler(handler)
+                self._handler = handler
+        self.path = path if self._handler else None
+
+    def put(self, message: str, tag: Optional[str] = None) -> None:
+        self._queue.put((message, tag))
+        if self._logger:
+            self._logger.info(message)
+
+    def drain(self) -> List[Tuple[str, Optional[str]]]:
+        items: 'deque[Tuple[str, Optional[str]]]' = deque(maxlen=self.max_lines)
+        try:
+            while True:
+                items.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        chunks: List[Tuple[str, Optional[str]]] = []
+        for message, tag in items:
+            if chunks and chunks[-1][1] == tag:
+                chunks[-1] = (chunks[-1][0] + message + "\n", tag)
+            else:
+                chunks.append((message + "\n", tag))
+        return chunks
+
+    def close(self) -> None:
+        if self._handler:
+            self._logger.removeHandler(self._handler)
+            self._handler.close()
+            self._handler = self._logger = None
+
+
+# ====== Bus tiến độ: worker đẩy (stage, current, total, mô tả), UI lấy bản mới nhất theo nhịp =====
+PROGRESS_FPS = 10  # số lần tối đa UI vẽ lại thanh tiến độ mỗi giây
+
+
+class ProgressBus:
+    """
+    publish() gọi từ bất kỳ luồng nào, không chạm tới widget: chỉ ghi đè sự kiện mới nhất của stage đó
+    (nghìn lần publish giữa hai nhịp vẽ chỉ còn một sự kiện mỗi stage, bộ nhớ cố định).
+    poll() gọi từ luồng UI: trả về sự kiện mới nhất (stage, current, total, mô tả) nếu có thay đổi
+    kể từ lần poll trước, ngược lại None.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest: 'OrderedDict[str, Tuple[str, int, int, str]]' = OrderedDict()
+        self._seq = 0
+        self._seen = 0
+
+    def publish(self, stage: str, current: int, total: int, description: str = "") -> None:
+        with self._lock:
+            self._latest.pop(stage, None)
+            self._latest[stage] = (stage, current, total, description)
+            self._seq += 1
+
+    def poll(self) -> Optional[Tuple[str, int, int, str]]:
+        with self._lock:
+            if self._seq == self._seen or not self._latest:
+                return None
+            self._seen = self._seq
+            return next(reversed(self._latest.values()))
+
+    def latest(self, stage: str) -> Optional[Tuple[str, int, int, str]]:
+        with self._lock:
+            return self._latest.get(stage)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._latest.clear()
+            self._seq += 1
+
+
+# ====== Danh sách URL: tập có thứ tự, khóa theo video id =====
+class UrlList:
+    """
+    Danh sách URL giữ thứ tự thêm vào, loại trùng theo key_func(url) (vd video id; None => chính URL)
+    bằng dict => thêm N URL là O(N) thay vì O(N²) với `url not in list`.
+    extend() trả về các URL mới thật sự được thêm, để widget chỉ cần chèn nối thêm chừng đó dòng.
+    """
+
+    def __init__(self, key_func: Optional[Callable[[str], Optional[str]]] = None, urls: Iterable[str] = ()):
+        self.key_func = key_func
+        self._keys: Dict[str, int] = {}
+        self._urls: List[str] = []
+        self.extend(urls)
+
+    def key(self, url: str) -> str:
+        return (self.key_func(url) if self.key_func else None) or url
+
+    def add(self, url: str) -> bool:
+        k = self.key(url)
+        if k in self._keys:
+            return False
+        self._keys[k] = len(self._urls)
+        self._urls.append(url)
+        return True
+
+    def extend(self, urls: Iterable[str]) -> List[str]:
+        return [url for url in urls if self.add(url)]
+
+    def index(self, url: str) -> int:
+        return self._keys[self.key(url)]
+
+    def clear(self) -> None:
+        self._keys.clear()
+        self._urls.clear()
+
+    @property
+    def urls(self) -> List[str]:
+        """Danh sách URL theo thứ tự (đọc, không sửa trực tiếp)."""
+        return self._urls
+
+    def __contains__(self, url: str) -> bool:
+        return self.key(url) in self._keys
+
+    def __len__(self) -> int:
+        return len(self._urls)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._urls)
+
+    def __getitem__(self, i):
+        return self._urls[i]
+
+
+# ====== Phiên yt-dlp dùng lại =====
+DEFAULT_YDL_OPTS: Dict[str, Any] = {
+    'quiet': True,
+    'no_warnings': True,
+    'extractaudio': False,
+    'extract_flat': False,
+    'retries': 5,
+}
+
+# Chế độ nhẹ: không tải manifest DASH/HLS, không tải player JS (giải mã chữ ký/n-param);
+# extract_info(process=False) bỏ qua bước chọn format => không còn "Requested format is not available".
+CAPTIONS_ONLY_YDL_OPTS: Dict[str, Any] = {
+    **DEFAULT_YDL_OPTS,
+    'skip_download': True,
+    'extractor_args': {'youtube': {'skip': ['dash', 'hls'], 'player_skip': ['js']}},
+}
+
+# Liệt kê playlist/kênh: chỉ lấy danh sách id (mỗi trang một request), không trích xuất từng video
+FLAT_YDL_OPTS: Dict[str, Any] = {
+    **DEFAULT_YDL_OPTS,
+    'skip_download': True,
+    'extract_flat': 'in_playlist',
+    'lazy_playlist': True,
+}
+
+EXTRACT_MODE_CAPTIONS = 'captions'
+EXTRACT_MODE_FULL = 'full'
+EXTRACT_MODE_FLAT = 'flat'
+
+
+def has_captions(info: Optional[Dict[str, Any]]) -> bool:
+    if not info:
+        return False
+    return bool(info.get('subtitles') or info.get('automatic_captions'))
+
+
+def is_fatal_session_error(err) -> bool:
+    """
+    Lỗi có làm hỏng phiên YoutubeDL không?
+    - Lỗi "dự kiến" của từng video (private, unavailable, ...) và 429 => không (giữ cookie/kết nối).
+    - Lỗi mạng/SSL, lỗi nội bộ không rõ => có (tạo lại phiên).
+    """
+    if classify_error(err) == 'throttle':
+        return False
+    cause = err
+    exc_info = getattr(err, 'exc_info', None)
+    if exc_info and len(exc_info) > 1 and exc_info[1] is not None:
+        cause = exc_info[1]
+    if getattr(cause, 'expected', False):
+        return False
+    if type(cause).__name__ == 'ExtractorError':
+        # Lỗi trích xuất thường: phiên vẫn dùng được, trừ khi gốc là lỗi tầng mạng (không có mã HTTP)
+        inner = getattr(cause, 'cause', None)
+        return inner is not None and getattr(inner, 'status', None) is None and getattr(inner, 'code', None) is None
+    return True
+
+
+class YDLSession:
+    """
+    Một yt_dlp.YoutubeDL tạo một lần cho cả lượt chạy (mỗi worker một phiên).
+    Giữ cookie, phiên TLS và kết nối giữa các video; chỉ tạo lại sau lỗi nghiêm trọng.
+    Phiên có 2 instance tạo lười: 'captions' (chế độ nhẹ) và 'full' (trích xuất đầy đủ).
+    """
+
+    def __init__(self, ydl_opts: Optional[Dict[str, Any]] = None,
+                 captions_opts: Optional[Dict[str, Any]] = None):
+        self.ydl_opts = dict(ydl_opts or DEFAULT_YDL_OPTS)
+        self.captions_opts = dict(captions_opts or CAPTIONS_ONLY_YDL_OPTS)
+        self._ydls: Dict[str, Any] = {}
+        self.uses = 0
+        self.resets = 0
+        self.fallbacks = 0
+
+    def get(self, mode: str = EXTRACT_MODE_FULL):
+        ydl = self._ydls.get(mode)
+        if ydl is None:
+            yt_dlp = YT_DLP.get()
+            if yt_dlp is None:
+                raise ImportError(f"yt-dlp không có sẵn: {YT_DLP.error}")
+            opts = {EXTRACT_MODE_CAPTIONS: self.captions_opts, EXTRACT_MODE_FLAT: FLAT_YDL_OPTS}.get(mode, self.ydl_opts)
+            ydl = self._ydls[mode] = yt_dlp.YoutubeDL(opts)
+        return ydl
+
+    def extract_info(self, url: str, mode: str = EXTRACT_MODE_FULL, **kwargs) -> Dict[str, Any]:
+        ydl = self.get(mode)
+        kwargs.setdefault('download', False)
+        if mode in (EXTRACT_MODE_CAPTIONS, EXTRACT_MODE_FLAT):
+            kwargs.setdefault('process', False)
+        try:
+            info = ydl.extract_info(url, **kwargs)
+        except Exception as e:
+            if is_fatal_session_error(e):
+                self.reset()
+            raise
+        self.uses += 1
+        return info
+
+    def extract_metadata(self, url: str, captions_only: bool = True) -> Tuple[Dict[str, Any], str]:
+        """
+        Lấy metadata cần cho pipeline. captions_only=True: thử chế độ nhẹ trước,
+        chỉ quay về trích xuất đầy đủ khi không thấy phụ đề (hoặc chế độ nhẹ lỗi).
+        Trả về (info, mode đã dùng).
+        """
+        if captions_only:
+            try:
+                info = self.extract_info(url, mode=EXTRACT_MODE_CAPTIONS)
+                if info and info.get('_type', 'video') == 'video' and has_captions(info):
+                    return info, EXTRACT_MODE_CAPTIONS
+            except Exception as e:
+                if classify_error(e):
+                    raise  # 429/5xx: thử lại chế độ đầy đủ chỉ làm nặng thêm
+            self.fallbacks += 1
+        return self.extract_info(url, mode=EXTRACT_MODE_FULL), EXTRACT_MODE_FULL
+
+    def iter_collection(self, url: str, max_depth: int = 2) -> Iterator[str]:
+        """
+        Video id của playlist/kênh theo đúng thứ tự, sinh dần theo từng trang (chế độ flat: một request
+        mỗi trang danh sách, không request nào cho từng video). Kênh không chỉ rõ tab => duyệt các tab con.
+        """
+        info = self.extract_info(url, mode=EXTRACT_MODE_FLAT)
+        while info and info.get('_type') in ('url', 'url_transparent') and max_depth > 0:
+            info, max_depth = self.extract_info(info['url'], mode=EXTRACT_MODE_FLAT), max_depth - 1
+        if not info:
+            return
+        if info.get('_type', 'video') == 'video':
+            if info.get('id'):
+                yield info['id']
+            return
+        for entry in info.get('entries') or ():
+            if not entry:
+                continue
+            vid = entry.get('id') or ''
+            if entry.get('ie_key', 'Youtube') == 'Youtube' and _VIDEO_ID_RE.match(vid):
+                yield vid
+            elif max_depth > 0 and entry.get('url'):
+                yield from self.iter_collection(entry['url'], max_depth - 1)
+
+    def reset(self):
+        self.close()
+        self.resets += 1
+
+    def close(self):
+        ydls, self._ydls = self._ydls, {}
+        for ydl in ydls.values():
+            try:
+                ydl.close()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def expand_collection(url: str, session: Optional[YDLSession] = None,
+                      rate: Optional[RateController] = None) -> Iterator[str]:
+    """
+    URL watch của từng video trong playlist/kênh `url`, theo thứ tự, sinh dần (không chờ hết danh sách).
+    session: phiên yt-dlp dùng lại (None => phiên tạm, đóng khi duyệt xong). Lỗi mở playlist được ném ra.
+    """
+    (rate or RATE_CONTROLLER).acquire()
+    own = session is None
+    session = session or YDLSession()
+    seen = set()
+    try:
+        for vid in session.iter_collection(url):
+            if vid not in seen:
+                seen.add(vid)
+                yield WATCH_URL.format(vid)
+    finally:
+        if own:
+            session.close()
+
+
+# ====== Engine trích xuất song song =====
+DEFAULT_CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+
+
+def clamp_concurrency(value, default: int = DEFAULT_CONCURRENCY) -> int:
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(MAX_CONCURRENCY, n))
+
+
+THROTTLE_RETRIES = 2  # số lần thử lại một URL bị 429 (sau cooldown của bộ điều tốc)
+
+
+def reuse_cached(existing_index: Dict[str, Dict[str, Any]], vid: Optional[str], url: str,
+                 accept: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Kết quả dùng lại từ kho cho URL này, None nếu phải tải. accept(kết quả đã lưu) -> False => tải lại.
+    Trả về bản sao mang URL của input: bản trong cache (dùng chung) giữ nguyên.
+    """
+    if not vid or vid not in existing_index:
+        return None
+    cached = existing_index[vid]
+    if accept is not None and not accept(cached):
+        return None
+    return {'status': 'success', **cached, 'url': url}
+
+
+def retry_throttled(rate: 'RateController', result: Dict[str, Any], attempt: int, retries: int) -> bool:
+    """Báo kết quả một lần tải về bộ điều tốc; True nếu nên tải lại (bị 429 và còn lượt thử)."""
+    kind = rate.report(result.get('error') if result.get('status') != 'success' else None)
+    return kind == 'throttle' and attempt < retries
+
+
+class ExtractionEngine:
+    """
+    Trích xuất nhiều URL với pool worker giới hạn.
+    - fetch_func(url) -> dict kết quả (get_video_info / get_video_info_gui);
+      nếu có session_factory thì gọi fetch_func(url, session) với phiên riêng của worker.
+    - Cache hit (youtube_results.json) trả về ngay: không vào hàng đợi, không chờ điều tốc;
+      accept_cached(kết quả đã lưu) -> False (vd khác yêu cầu ngôn ngữ phụ đề) => tải lại như chưa có.
+    - Mỗi lần gọi mạng lấy token từ RateController; 429/5xx làm bộ điều tốc lùi lại
+      và URL bị 429 được thử lại (tối đa `throttle_retries` lần) sau cooldown.
+    - Cùng video id xuất hiện nhiều lần trong input => chỉ tải một lần, các vị trí sau dùng lại kết quả.
+    - Kết quả trả về giữ nguyên thứ tự input; URL chưa xử lý (do hủy) là None.
+      keep_results=False: chỉ trả về bản rút gọn (result_summary), dùng khi on_result tự xử lý kết quả.
+    """
+
+    def __init__(self, fetch_func: Callable[[str], Dict[str, Any]],
+                 concurrency: int = DEFAULT_CONCURRENCY,
+                 rate: Optional[RateController] = None,
+                 throttle_retries: int = THROTTLE_RETRIES,
+                 should_stop: Optional[Callable[[], bool]] = None,
+                 on_result: Optional[Callable[[int, str, Dict[str, Any], bool], None]] = None,
+                 on_wait: Optional[Callable[[int, str, float, str], None]] = None,
+                 id_func: Optional[Callable[[str], Optional[str]]] = None,
+                 session_factory: Optional[Callable[[], YDLSession]] = None,
+                 keep_results: bool = True,
+                 accept_cached: Optional[Callable[[Dict[str, Any]], bool]] = None):
+        self.fetch_func = fetch_func
+        self.concurrency = clamp_concurrency(concurrency)
+        self.rate = rate or RATE_CONTROLLER
+        self.throttle_retries = max(0, throttle_retries)
+        self.should_stop = should_stop or (lambda: False)
+        self.on_result = on_result
+        self.on_wait = on_wait
+        self.id_func = id_func
+        self.session_factory = session_factory
+        self.accept_cached = accept_cached
+        # False: run() chỉ giữ result_summary (kết quả đầy đủ chỉ đi qua on_result) => bộ nhớ phẳng
+        self.keep_results = keep_results
+        # Gọi sau on_result, NGOÀI _cb_lock: được phép chặn (vd StagedPipeline chờ hàng đợi ghi còn chỗ)
+        # mà không giữ on_result/on_wait của các worker khác
+        self.after_result: Optional[Callable[[int, str, Dict[str, Any], bool], None]] = None
+        self._stop = threading.Event()
+        self._cb_lock = threading.Lock()
+        self._local = threading.local()
+        self._sessions: List[YDLSession] = []
+
+    def cancel(self):
+        self._stop.set()
+
+    def stopped(self) -> bool:
+        if not self._stop.is_set() and self.should_stop():
+            self._stop.set()
+        return self._stop.is_set()
+
+    def _emit(self, idx: int, url: str, result: Dict[str, Any], cached: bool):
+        if self.on_result:
+            with self._cb_lock:
+                self.on_result(idx, url, result, cached)
+        if self.after_result:
+            self.after_result(idx, url, result, cached)
+
+    def _acquire(self, idx: int, url: str) -> bool:
+        def announce(delay, reason):
+            if self.on_wait:
+                with self._cb_lock:
+                    self.on_wait(idx, url, delay, reason)
+        return self.rate.acquire(should_stop=self.stopped, on_wait=announce)
+
+    def _session(self) -> YDLSession:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self.session_factory()
+            with self._cb_lock:
+                self._sessions.append(session)
+        return session
+
+    def close_sessions(self):
+        with self._cb_lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+
+    def _work(self, idx: int, url: str) -> Optional[Dict[str, Any]]:
+        attempt = 0
+        while True:
+            if not self._acquire(idx, url):
+                return None
+            if self.session_factory:
+                r = self.fetch_func(url, self._session())
+            else:
+                r = self.fetch_func(url)
+            if retry_throttled(self.rate, r, attempt, self.throttle_retries) and not self.stopped():
+                attempt += 1
+                continue
+            self._emit(idx, url, r, False)
+            return r
+
+    def run(self, urls: List[str], existing_index: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Optional[Dict[str, Any]]]:
+        existing_index = existing_index or {}
+        results: List[Optional[Dict[str, Any]]] = [None] * len(urls)
+        pending = []
+        first_by_id: Dict[str, int] = {}
+        duplicates: Dict[int, List[int]] = {}
+
+        # Cache hit: trả ngay trên luồng gọi, không chiếm slot của pool
+        for idx, url in enumerate(urls):
+            vid = self.id_func(url) if self.id_func else None
+            r = reuse_cached(existing_index, vid, url, self.accept_cached)
+            if r is not None:
+                results[idx] = self._keep(r)
+                self._emit(idx, url, r, True)
+            elif vid and vid in first_by_id:
+                duplicates.setdefault(first_by_id[vid], []).append(idx)
+            else:
+                if vid:
+                    first_by_id[vid] = idx
+                pending.append((idx, url))
+
+        if not pending or self.stopped():
+            return results
+
+        workers = min(self.concurrency, len(pending))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lctc-extract") as pool:
+            futures = [(idx, pool.submit(self._work, idx, url)) for idx, url in pending]
+            try:
+                for idx, fut in futures:
+                    try:
+                        r = fut.result()
+                    except Exception as e:
+                        url = urls[idx]
+                        r = {'url': url, 'status': 'error', 'error': f'Lỗi khi lấy thông tin: {e}'}
+                        self._emit(idx, url, r, False)
+                    results[idx] = self._keep(r)
+                    if r is not None:
+                        # Cùng video ở vị trí sau: dùng lại kết quả vừa có, không gọi mạng
+                        for dup in duplicates.get(idx, ()):
+                            d = dict(r, url=urls[dup])
+                            results[dup] = self._keep(d)
+                            self._emit(dup, urls[dup], d, True)
+            except BaseException:
+                # Ctrl-C / lỗi ngoài ý muốn: dừng các worker đang chờ, hủy phần chưa chạy
+                self.cancel()
+                for _, fut in futures:
+                    fut.cancel()
+                raise
+            finally:
+                pool.shutdown(wait=True)
+                self.close_sessions()
+        return results
+
+    def _keep(self, r: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        return r if self.keep_results else result_summary(r)
+
+
+# ====== API asyncio (nhúng vào job runner) =====
+# Tải phụ đề dùng HTTPClient (http.client, blocking) để dùng chung pool kết nối keep-alive và các parser
+# stream với phần đồng bộ; trên event loop chúng chạy trong một pool luồng riêng (không phải executor mặc
+# định của loop), nên loop không bao giờ bị chặn và phụ đề của nhiều video tải đồng thời.
+async def afetch_subtitles(info: Dict[str, Any], langs: Optional[str] = None, all_langs: bool = False,
+                           executor: Optional[ThreadPoolExecutor] = None) -> Dict[str, Any]:
+    """Như fetch_subtitles nhưng không chặn event loop (chạy trong executor, None = executor mặc định)."""
+    return await asyncio.get_running_loop().run_in_executor(executor, fetch_subtitles, info, langs, all_langs)
+
+
+async def aprocess_urls(urls: Iterable[str], concurrency: int = DEFAULT_CONCURRENCY, captions_only: bool = True,
+                        results_path: str = 'youtube_results.json', rate: Optional[RateController] = None,
+                        langs: Optional[str] = None, all_langs: bool = False,
+                        throttle_retries: int = THROTTLE_RETRIES,
+                        session_factory: Callable[[], YDLSession] = YDLSession):
+    """
+    Async generator: nhận iterable URL, yield (index, result) ngay khi từng video xong.
+    - Cache hit trong kho kết quả (results_path) được yield ngay, không chờ điều tốc; kết quả thành công
+      mới được ghi vào kho ngay khi có (lượt sau là cache hit). Quy tắc dùng lại như ExtractionEngine
+      (reuse_cached + caption_result_matches).
+    - Cùng video id lặp lại trong input chỉ tải một lần.
+    - yt-dlp (blocking) chạy trong pool luồng riêng, mỗi luồng một phiên (session_factory);
+      tối đa `concurrency` video cùng lúc trích xuất.
+    - Phụ đề tải trong một pool luồng riêng khác (xem ghi chú đầu mục), sau khi đã nhả slot trích xuất:
+      video kế tiếp trích xuất song song với việc tải phụ đề (langs / all_langs: xem fetch_subtitles).
+    - Video bị 429 được thử lại tối đa `throttle_retries` lần sau cooldown, như ExtractionEngine.
+    index là vị trí trong input => ghép lại đúng thứ tự input (xem aprocess_urls_keep_order).
+    """
+    rate = rate or RATE_CONTROLLER
+    concurrency = clamp_concurrency(concurrency)
+    try:
+        store = shared_results_index(results_path)
+    except Exception:
+        store = None
+    existing_index = store if store is not None else {}
+    accept = functools.partial(caption_result_matches, langs=langs, all_langs=all_langs)
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="lctc-async")
+    caption_executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="lctc-async-captions")
+    slots = asyncio.Semaphore(concurrency)
+    local = threading.local()
+    sessions = []
+    sessions_lock = threading.Lock()
+
+    def extract(url):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = session_factory()
+            with sessions_lock:
+                sessions.append(session)
+        info, _ = session.extract_metadata(url, captions_only=captions_only)
+        return info
+
+    async def fetch(url):
+        async with slots:
+            await rate.acquire_async()
+            try:
+                info = await loop.run_in_executor(executor, extract, url)
+            except Exception as e:
+                return {'url': url, 'status': 'error', 'error': f'Lỗi khi lấy thông tin: {e}'}
+        # Nhả slot trước khi tải phụ đề: video kế tiếp bắt đầu trích xuất ngay
+        try:
+            fields = await afetch_subtitles(info, langs, all_langs, caption_executor)
+        except Exception as e:
+            return caption_error_result(info, url, e)
+        return video_result(info, url, fields)
+
+    async def one(idx, url):
+        attempt = 0
+        while True:
+            r = await fetch(url)
+            if not retry_throttled(rate, r, attempt, throttle_retries):
+                break
+            attempt += 1
+        if store is not None and r.get('status') == 'success':  # lỗi (429, mất mạng...) không lưu
+            store.add(r, replace=True)
+        return idx, r
+
+    async def same_as(idx, url, first):
+        # Cùng video đã có trong lượt này: chờ kết quả của lần tải đầu, không gọi mạng thêm
+        _, r = await first
+        return idx, dict(r, url=url)
+
+    tasks = []
+    in_run = {}
+    try:
+        for idx, url in enumerate(urls):
+            vid = extract_video_id(url)
+            r = reuse_cached(existing_index, vid, url, accept)
+            if r is not None:
+                yield idx, r
+            elif vid and vid in in_run:
+                tasks.append(asyncio.ensure_future(same_as(idx, url, in_run[vid])))
+            else:
+                task = asyncio.ensure_future(one(idx, url))
+                if vid:
+                    in_run[vid] = task
+                tasks.append(task)
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        for t in tasks:
+            t.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+        caption_executor.shutdown(wait=False, cancel_futures=True)
+        with sessions_lock:
+            for session in sessions:
+                session.close()
+
+
+async def aprocess_urls_keep_order(urls: Iterable[str], **kwargs) -> List[Optional[Dict[str, Any]]]:
+    """Chạy aprocess_urls tới hết, trả list kết quả đúng thứ tự input."""
+    urls = list(urls)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(urls)
+    async for idx, r in aprocess_urls(urls, **kwargs):
+        results[idx] = r
+    return results
+
+
+# ====== Pipeline chồng giai đoạn: dựng thư mục -> trích xuất -> ghi, nối bằng hàng đợi có giới hạn =====
+PIPELINE_QUEUE_SIZE = 32  # số kết quả đã tải nhưng chưa ghi tối đa; đầy => worker trích xuất chờ
+
+
+class StagedPipeline:
+    """
+    Ba giai đoạn chạy đồng thời thay vì lần lượt:
+      scaffold (luồng riêng, dựng <prefix>-<n>) -> fetch (ExtractionEngine) -> write (pool `write_workers` luồng).
+    - Mỗi kết quả vào hàng đợi giới hạn `queue_size` ngay khi xong; hàng đợi đầy => worker fetch chờ (backpressure).
+    - Video được ghi ngay khi có kết quả và thư mục của nó đã dựng xong => sub.txt đầu tiên xuất hiện
+      sau video đầu tiên, không phải sau video cuối cùng.
+    - Engine nên tạo với keep_results=False: kết quả đầy đủ chỉ nằm trong hàng đợi tới khi ghi xong.
+
+    scaffold(on_folder): dựng thư mục, gọi on_folder(idx, path, created) cho từng thư mục (None => đã có sẵn).
+    write(idx, result) -> bool: ghi một video (True = có ghi, False = không đổi); ném lỗi nếu thất bại.
+    on_written(idx, trạng thái, lỗi): trạng thái WRITE_WRITTEN / WRITE_UNCHANGED / WRITE_FAILED / 'missing'
+    (thư mục không dựng được). Gọi tuần tự.
+    """
+
+    def __init__(self, engine: ExtractionEngine,
+                 write: Callable[[int, Dict[str, Any]], bool],
+                 scaffold: Optional[Callable[[Callable[[int, str, bool], None]], Any]] = None,
+                 on_written: Optional[Callable[[int, str, Optional[BaseException]], None]] = None,
+                 queue_size: int = PIPELINE_QUEUE_SIZE,
+                 write_workers: int = WRITE_WORKERS):
+        self.engine = engine
+        self.write = write
+        self.scaffold = scaffold
+        self.on_written = on_written
+        self.write_workers = max(1, write_workers)
+        self.summary = {WRITE_WRITTEN: 0, WRITE_UNCHANGED: 0, WRITE_FAILED: 0, 'missing': 0}
+        self._queue: "queue.Queue[Optional[Tuple[int, Dict[str, Any]]]]" = queue.Queue(maxsize=max(1, queue_size))
+        self._ready: set = set()
+        self._scaffold_done = scaffold is None
+        self.scaffold_error: Optional[BaseException] = None  # lỗi của giai đoạn dựng thư mục (nếu có)
+        self._cond = threading.Condition()
+        self._cb_lock = threading.Lock()
+
+    # --- scaffold
+    def _on_folder(self, idx: int, path: str, created: bool):
+        with self._cond:
+            self._ready.add(idx)
+            self._cond.notify_all()
+
+    def _run_scaffold(self):
+        try:
+            self.scaffold(self._on_folder)
+        except BaseException as e:
+            self.scaffold_error = e
+        finally:
+            with self._cond:
+                self._scaffold_done = True
+                self._cond.notify_all()
+
+    def _wait_folder(self, idx: int) -> bool:
+        with self._cond:
+            while idx not in self._ready and not self._scaffold_done and not self.engine.stopped():
+                self._cond.wait(0.5)
+            return self.scaffold is None or idx in self._ready
+
+    # --- fetch -> hàng đợi
+    def put(self, idx: int, result: Dict[str, Any]) -> bool:
+        """Đưa một kết quả sang giai đoạn ghi; chặn khi hàng đợi đầy. False nếu bị hủy trong lúc chờ."""
+        while True:
+            try:
+                self._queue.put((idx, result), timeout=0.5)
+                return True
+            except queue.Full:
+                if self.engine.stopped():
+                    return False
+
+    # --- write
+    def _finish(self, idx: int, status: str, err: Optional[BaseException]):
+        with self._cb_lock:
+            self.summary[status] += 1
+            if self.on_written:
+                self.on_written(idx, status, err)
+
+    def _writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            idx, result = item
+            if self.engine.stopped():
+                continue  # bị hủy: kết quả đã có trong nhật ký, lượt sau ghi nốt
+            if not self._wait_folder(idx):
+                if not self.engine.stopped():
+                    self._finish(idx, 'missing', self.scaffold_error)
+                continue
+            try:
+                status, err = (WRITE_WRITTEN if self.write(idx, result) else WRITE_UNCHANGED), None
+            except Exception as e:
+                status, err = WRITE_FAILED, e
+            self._finish(idx, status, err)
+
+    def run(self, urls: List[str], todo: List[int],
+            existing_index: Optional[Dict[str, Dict[str, Any]]] = None,
+            backlog: Iterable[Tuple[int, Dict[str, Any]]] = ()) -> List[Optional[Dict[str, Any]]]:
+        """
+        urls: toàn bộ danh sách; todo: vị trí cần trích xuất; backlog: (vị trí, kết quả) đã tải nhưng chưa ghi
+        (lượt chạy dở). Trả về kết quả (theo engine.keep_results) của các vị trí trong todo, theo thứ tự todo.
+        """
+        threads = []
+        if self.scaffold is not None:
+            threads.append(threading.Thread(target=self._run_scaffold, name="lctc-scaffold", daemon=True))
+        writers = [threading.Thread(target=self._writer, name=f"lctc-write-{i}", daemon=True)
+                   for i in range(self.write_workers)]
+        for t in threads + writers:
+            t.start()
+
+        # put có thể chặn khi hàng đợi đầy: gọi qua after_result (ngoài khóa callback của engine)
+        self.engine.after_result = lambda pos, url, r, cached: self.put(todo[pos], r)
+        try:
+            for idx, r in backlog:
+                if not self.put(idx, r):
+                    break
+            results = self.engine.run([urls[i] for i in todo], existing_index) if todo else []
+        except BaseException:
+            self.engine.cancel()
+            raise
+        finally:
+            self.engine.after_result = None
+            for _ in writers:
+                self._queue.put(None)  # writer luôn rút hàng đợi => không chặn lâu
+            for t in writers + threads:
+                t.join()
+        return results
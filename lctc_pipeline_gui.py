@@ -4,16 +4,23 @@
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 import os
-import random
 import re
 import shutil
 import subprocess
 import sys
 import threading
-import time
-import json
 from typing import Optional, List, Dict, Any, Callable
 
+from lctc_pipeline_core import (DEFAULT_CAPTION_LANGS, DEFAULT_CONCURRENCY, DOCX, PROGRESS_FPS, RATE_CONTROLLER,
+                                WRITE_FAILED, WRITE_UNCHANGED, YT_DLP, ExtractionEngine, LogSink, ProgressBus,
+                                CaptionLang, RunJournal, StagedPipeline, UrlList, YDLSession, caption_files,
+                                caption_result_fields, caption_result_matches, clamp_concurrency,
+                                deferred_caption_fields, expand_collection, extract_video_id,
+                                fetch_caption_texts, fill_template_docs, find_run_journal, is_collection_url,
+                                parse_caption_langs, preload_heavy_imports, scaffold_folders,
+                                shared_results_index, shared_template, transcript_text, write_caption_files,
+                                write_text_if_changed)
+
 # ---- Chặn biến môi trường có thể gây PermissionError (sslkeys) khi tải mạng
 os.environ.pop("SSLKEYLOGFILE", None)
 
@@ -25,30 +32,16 @@ try:
 except Exception:
     pass
 
-# Import external dependencies if they exist, otherwise mark as missing
-DOCX_AVAILABLE = False
-try:
-    from docx import Document
-
-    DOCX_AVAILABLE = True
-except ImportError:
-    # print("Warning: python-docx not found. DOCX generation will be basic.", file=sys.stderr)
-    pass  # Will log to GUI if applicable
-
-YTDLP_AVAILABLE = False
-try:
-    import yt_dlp
-
-    YTDLP_AVAILABLE = True
-except ImportError:
-    # print("Warning: yt-dlp not found. YouTube subtitle extraction will not work.", file=sys.stderr)
-    pass  # Will log to GUI if applicable
+# yt_dlp / python-docx: không import lúc nạp module (chậm cửa sổ hiện lên).
+# Cửa sổ dựng xong mới nạp nền (preload_heavy_imports); YT_DLP/DOCX.available chỉ chờ khi thật sự cần.
 
 # ====== Cấu trúc thư mục & template (kế thừa make_lctc.py) =====
 INVALID = r'[<>:"/\\|?*]'
 SUBFOLDERS = ["TAI NGUYEN", "THUMB"]
 TEMPLATE = "template.docx"
 DEFAULT_PREFIX = "LCTC"
+# GUI mặc định dự phòng thêm tiếng Anh khi không có phụ đề tiếng Việt
+SUB_LANGS = os.environ.get('LCTC_SUB_LANGS') or DEFAULT_CAPTION_LANGS + ',en'
 
 
 def sanitize(name: str) -> str:
@@ -56,7 +49,7 @@ def sanitize(name: str) -> str:
 
 
 def _try_create_template_with_word(path: str) -> bool:
-    if not DOCX_AVAILABLE:
+    if not DOCX.available:
         try:  # fallback to simple file creation
             open(path, 'a', encoding='utf-8').close()
             return True
@@ -64,7 +57,7 @@ def _try_create_template_with_word(path: str) -> bool:
             return False
 
     try:
-        doc = Document();
+        doc = DOCX.get().Document();
         doc.add_paragraph(" ");
         doc.save(path + ".tmp")
         try:
@@ -98,13 +91,12 @@ def ensure_template_gui(log_func: Callable[[str, Optional[str]], None]):
             log_func(f"✓ Đã tạo {TEMPLATE}.", "green")
         else:
             log_func(f"✗ Không thể tạo {TEMPLATE}. Sẽ bỏ qua bước tạo .docx mẫu.", "red")
+    shared_template(TEMPLATE, refresh=True)  # đọc template một lần cho cả lượt tạo folder
 
 
 def new_blank_docx_gui(dst: str):
-    if os.path.exists(TEMPLATE):
-        shutil.copyfile(TEMPLATE, dst)
-    else:
-        open(dst, 'a', encoding='utf-8').close()
+    # template.docx đọc một lần cho cả lượt (refresh ở ensure_template), không có template => file rỗng
+    shared_template(TEMPLATE).instantiate(dst)
 
 
 def make_name(prefix: str, n: int, pad_width: int = 0) -> str:
@@ -113,157 +105,111 @@ def make_name(prefix: str, n: int, pad_width: int = 0) -> str:
     return f"{prefix}-{n}"
 
 
-# ====== Phần YouTube (kế thừa transcript.py) =====
-def extract_video_id(url):
-    patterns = [
-        r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/)([a-zA-Z0-9_-]{11})',
-        r'youtube\.com\/v\/([a-zA-Z0-9_-]{11})',
-    ]
-    for p in patterns:
-        m = re.search(p, url)
-        if m: return m.group(1)
-    return None
-
-
-def download_subtitle_content(url):
-    try:
-        import urllib.request, json as _json
-        with urllib.request.urlopen(url) as resp:
-            raw = resp.read().decode('utf-8')
-            s = raw.strip()
-            if s.startswith('{') or s.startswith('['):
-                try:
-                    data = _json.loads(raw)
-                    if isinstance(data, dict) and "events" in data:
-                        lines = []
-                        for ev in data["events"]:
-                            if "segs" in ev:
-                                line = ''.join(seg.get("utf8", "") for seg in ev["segs"]).strip()
-                                if line: lines.append(line)
-                        return "\n".join(lines)
-                    if isinstance(data, list):  # Handles formats like 'transcript_list' in some cases
-                        lines = [it.get("text", "") for it in data if it.get("text", "")]
-                        return "\n".join(lines)
-                    return raw
-                except Exception:
-                    return raw
-            return raw
-    except Exception:
-        return ""
-
-
-def clean_subtitles(subtitle_content):
-    if not subtitle_content: return "Không có nội dung phụ đề"
-    out = []
-    for line in subtitle_content.splitlines():
-        line = line.strip()
-        if (not re.match(r'^\d+$', line)
-                and not re.match(r'^\d{2}:\d{2}:\d{2}', line)
-                and not re.match(r'^(WEBVTT|NOTE)', line)
-                and line and line != '--'):
-            line = re.sub(r'<[^>]+>', '', line)
-            line = re.sub(r'&[a-zA-Z]+;', '', line)
-            if line and (not out or out[-1] != line):
-                out.append(line)
-    return "\n".join(out) or "Không thể trích xuất nội dung phụ đề"
-
-
-def get_subtitles_fallback(info: Dict[str, Any], primary_lang='vi', fallback_lang='en'):
-    try:
-        subs = info.get('subtitles', {}) or {}
-        auto = info.get('automatic_captions', {}) or {}
-
-        def get_sub_url(lang):
-            if lang in subs:
-                return subs[lang][0]['url']
-            if lang in auto:
-                return auto[lang][0]['url']
-            return None
-
-        # Thử phụ đề tiếng Việt trước
-        url = get_sub_url(primary_lang) or get_sub_url(primary_lang + '-VN')
-        if url:
-            text = download_subtitle_content(url)
-            if text:
-                return clean_subtitles(text)
-
-        # Nếu không có, thử fallback sang tiếng Anh
-        url = get_sub_url(fallback_lang)
-        if url:
-            text = download_subtitle_content(url)
-            if text:
-                return clean_subtitles(text + "\n\n(Nguồn phụ đề: Tiếng Anh - fallback)")
+def folder_docs(safe_name: str) -> List[str]:
+    """Các file .docx trong mỗi <prefix>-<n>."""
+    return [f"{safe_name}.docx", "MO TA.docx"]
 
-        # Nếu vẫn không có gì
-        return "Không tìm thấy phụ đề tiếng Việt (video không có phụ đề hoặc chưa được hỗ trợ)."
 
-    except Exception as e:
-        return f"Lỗi khi tải phụ đề: {e}"
+def fill_folder_docs(lctc_dir: str, name: str, r: Dict[str, Any], transcript: str) -> int:
+    """
+    Điền <prefix>-<n>.docx (tiêu đề, URL, thời lượng, phụ đề) và MO TA.docx (tiêu đề, URL) từ template.docx.
+    Chỉ ghi vào file còn là bản trắng; file đã có người sửa giữ nguyên.
+    """
+    main_doc, desc_doc = folder_docs(sanitize(name))
+    values = {'name': name, 'title': r.get('title', ''), 'url': r.get('url', ''),
+              'video_id': r.get('video_id', ''), 'duration': r.get('duration', 'N/A'), 'transcript': transcript}
+    return fill_template_docs(TEMPLATE, lctc_dir, [(main_doc, 'main'), (desc_doc, 'desc')], values)
 
 
-def get_video_info_gui(url: str, log_func: Callable[[str, Optional[str]], None]):
-    if not YTDLP_AVAILABLE:
+# ====== Phần YouTube (kế thừa transcript.py) =====
+def expand_url_gui(s: str, ln: int, log_func: Callable[[str, Optional[str]], None]) -> List[str]:
+    """
+    Một dòng input -> danh sách URL video: URL video giữ nguyên; playlist/kênh được liệt kê flat
+    (một request mỗi trang, theo thứ tự playlist). Có thể chặn vì gọi mạng: không gọi từ luồng UI.
+    """
+    if extract_video_id(s):
+        return [s]
+    if is_collection_url(s):
+        try:
+            found = list(expand_collection(s))
+        except Exception as e:
+            log_func(f"Dòng {ln}: không liệt kê được playlist/kênh {s}: {e}", "red")
+            return []
+        log_func(f"↳ {s}: {len(found)} video", "blue")
+        return found
+    log_func(f"Dòng {ln}: URL không hợp lệ - {s}", "yellow")
+    return []
+
+
+MISSING_SUBTITLES = "Không tìm thấy phụ đề theo ngôn ngữ đã chọn (video không có phụ đề hoặc chưa được hỗ trợ)."
+
+
+def fetch_subtitles_fallback(info: Dict[str, Any], langs: str = SUB_LANGS, all_langs: bool = False) -> Dict[str, Any]:
+    """
+    Các trường phụ đề của kết quả (subtitles, subtitle_format, subtitle_lang [, extra_subtitles]).
+    langs: thứ tự ưu tiên, vd 'vi,vi-VN,en,auto-translated vi'; mỗi track chọn định dạng rẻ nhất
+    (CAPTION_FORMAT_PREFERENCE: json3 > srv3 > vtt). all_langs=True: lưu mọi ngôn ngữ có trong danh sách
+    (sub.<lang>.txt), các ngôn ngữ của video tải song song.
+    Lỗi khi tải (429/5xx, mất kết nối) được ném ra để video bị báo lỗi thay vì thành công với phụ đề rỗng.
+    """
+    captions = fetch_caption_texts(info, langs, all_langs)
+    fields = caption_result_fields(captions, all_langs, MISSING_SUBTITLES, langs)
+    note = fallback_note(langs)(captions[0].source) if captions and not all_langs else None
+    if note:
+        fields['subtitles'] += f"\n\n{note}"
+    return fields
+
+
+def fallback_note(langs: str = SUB_LANGS) -> Callable[[CaptionLang], Optional[str]]:
+    """Phụ đề lấy từ ngôn ngữ dự phòng (không phải ngôn ngữ đầu danh sách): dòng ghi chú nguồn cuối sub.txt."""
+    first = parse_caption_langs(langs)[0].key
+    return lambda source: None if source.key == first else f"(Nguồn phụ đề: {source.label} - fallback)"
+
+
+def get_video_info_gui(url: str, log_func: Callable[[str, Optional[str]], None],
+                       session: Optional[YDLSession] = None, captions_only: bool = True,
+                       langs: str = SUB_LANGS, all_langs: bool = False, stream_captions: bool = False):
+    """
+    session: YDLSession dùng lại giữa các URL; None => tạo phiên tạm cho riêng URL này.
+    captions_only: chỉ lấy metadata + phụ đề (bỏ qua format), quay về trích xuất đầy đủ khi thiếu phụ đề.
+    langs / all_langs: xem fetch_subtitles_fallback.
+    stream_captions: chưa tải phụ đề, chỉ chọn track; _write_result stream thẳng ra sub.txt.
+    """
+    if not YT_DLP.available:
         return {'url': url, 'status': 'error', 'error': 'yt-dlp is not available.'}
+    own_session = session is None
+    if own_session:
+        session = YDLSession()
     try:
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extractaudio': False,
-            'extract_flat': False,
-            'sleep_interval': 20,  # Added for polite scraping
-            'max_sleep_interval': 25,
-            'retries': 5,
+        info, _ = session.extract_metadata(url, captions_only=captions_only)
+        try:
+            if stream_captions:
+                fields = deferred_caption_fields(info, langs, all_langs, MISSING_SUBTITLES)
+            else:
+                fields = fetch_subtitles_fallback(info, langs, all_langs)
+        except Exception as e:
+            # Mã HTTP nằm trong thông báo lỗi => ExtractionEngine báo về bộ điều tốc (429: chậm lại, thử lại)
+            log_func(f"Lỗi khi tải phụ đề cho {url}: {e}", "red")
+            return {'title': info.get('title', 'Không có tiêu đề'), 'video_id': info.get('id'),
+                    'url': url, 'status': 'error', 'error': f'Lỗi khi tải phụ đề: {e}'}
+        return {
+            'title': info.get('title', 'Không có tiêu đề'),
+            'video_id': info.get('id', 'unknown'),
+            'duration': info.get('duration', 0),
+            'url': url,
+            **fields,
+            'status': 'success'
         }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            return {
-                'title': info.get('title', 'Không có tiêu đề'),
-                'video_id': info.get('id', 'unknown'),
-                'duration': info.get('duration', 0),
-                'url': url,
-                'subtitles': get_subtitles_fallback(info),
-                'status': 'success'
-            }
     except Exception as e:
         log_func(f"Lỗi khi lấy thông tin cho {url}: {e}", "red")
         return {'url': url, 'status': 'error', 'error': f'Lỗi khi lấy thông tin: {e}'}
+    finally:
+        if own_session:
+            session.close()
 
 
-def load_existing_index(results_path='youtube_results.json'):
-    if not os.path.exists(results_path): return {}, []
-    try:
-        with open(results_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        idx, ordered = {}, []
-        for item in data:
-            vid = item.get('video_id') or extract_video_id(item.get('url', '')) or ''
-            if vid and vid not in idx:
-                idx[vid] = item;
-                ordered.append(item)
-        return idx, ordered
-    except Exception:
-        return {}, []
-
-
-def save_results_merge_gui(new_results: List[Dict[str, Any]], log_func: Callable[[str, Optional[str]], None],
-                           output_file='youtube_results.json'):
-    existing_index, ordered = load_existing_index(output_file)
-    appended = 0
-    for item in new_results:
-        vid = item.get('video_id') or extract_video_id(item.get('url', '')) or item.get('url')
-        if not vid:  # If no video_id or URL, just append if unique (less ideal)
-            if item not in ordered:  # Simple check for uniqueness
-                ordered.append(item);
-                appended += 1
-            continue
-        if vid in existing_index:
-            continue
-        existing_index[vid] = item;
-        ordered.append(item);
-        appended += 1
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(ordered, f, ensure_ascii=False, indent=2)
-    log_func(f"✓ Gộp kết quả (thêm {appended}) vào youtube_results.json", "green")
+def _result_key(item: Dict[str, Any]) -> Optional[str]:
+    return item.get('video_id') or extract_video_id(item.get('url', '')) or item.get('url')
 
 
 def safe_title(result_title: str) -> str:
@@ -278,10 +224,7 @@ def read_urls_from_file(file_path: str, log_func: Callable[[str, Optional[str]],
             for ln, line in enumerate(f, 1):
                 s = line.strip()
                 if s and not s.startswith('#'):
-                    if extract_video_id(s):
-                        urls.append(s)
-                    else:
-                        log_func(f"Dòng {ln}: URL không hợp lệ - {s}", "yellow")
+                    urls.extend(expand_url_gui(s, ln, log_func))
     except Exception as e:
         log_func(f"Lỗi đọc file: {e}", "red")
         return None
@@ -289,8 +232,12 @@ def read_urls_from_file(file_path: str, log_func: Callable[[str, Optional[str]],
 
 
 # ====== GUI Class ======
+LOG_TICK_MS = 100  # nhịp vẽ log (ms): mọi dòng log trong khoảng này được chèn một lần
+LOG_TAG_COLORS = {'red': 'error', 'yellow': 'warning', 'green': 'success', 'blue': 'accent'}
+
+
 class LCTCPipelineGUI:
-    def __init__(self):
+    def __init__(self, resume: bool = False):
         ctk.set_appearance_mode("dark")
         ctk.set_default_color_theme("blue") # Keep 'blue' for default components not explicitly styled
 
@@ -314,15 +261,23 @@ class LCTCPipelineGUI:
         self.root.configure(fg_color=self.colors['bg'])
 
         # State variables
-        self.urls_to_process: List[str] = []
+        self.url_list = UrlList(extract_video_id)  # thứ tự thêm vào, loại trùng theo video id
+        self._url_rows_shown = 0  # số dòng URL đang hiện trên url_list_textbox
         self.pipeline_running = False
         self.stop_pipeline_flag = False
+        self.resume = resume  # --resume: tự tiếp tục lượt chạy dở, không hỏi
+        self.log_sink = LogSink()  # luồng worker chỉ đẩy vào hàng đợi, luồng UI vẽ theo lô
+        self.progress = ProgressBus()  # tiến độ: worker publish, luồng UI poll tối đa PROGRESS_FPS lần/giây
 
         # Main container
         self.main_container = ctk.CTkFrame(self.root, fg_color=self.colors['bg'])
         self.main_container.pack(fill="both", expand=True, padx=20, pady=20)
 
         self._setup_ui()
+        self.root.after(LOG_TICK_MS, self._drain_log)
+        self.root.after(1000 // PROGRESS_FPS, self._poll_progress)
+        # Cửa sổ hiện trước, yt_dlp/python-docx nạp nền ngay sau đó
+        self.root.after(100, preload_heavy_imports)
 
     def _setup_ui(self):
         self.clear_screen()
@@ -470,6 +425,36 @@ class LCTCPipelineGUI:
         )
         self.end_num_label.pack(anchor="w", padx=15, pady=(0, 10))
 
+        ctk.CTkLabel(input_panel, text="Số video xử lý song song:", text_color=self.colors['text']).pack(
+            anchor="w", padx=15, pady=(10, 0))
+        self.concurrency_entry = ctk.CTkEntry(
+            input_panel,
+            placeholder_text=str(DEFAULT_CONCURRENCY),
+            fg_color=self.colors['bg'],
+            border_color=self.colors['accent']
+        )
+        self.concurrency_entry.insert(0, str(DEFAULT_CONCURRENCY))
+        self.concurrency_entry.pack(fill="x", padx=15, pady=(0, 10))
+
+        ctk.CTkLabel(input_panel, text="Ngôn ngữ phụ đề (thứ tự ưu tiên, vd vi,vi-VN,en,auto-translated vi):",
+                     text_color=self.colors['text']).pack(anchor="w", padx=15, pady=(10, 0))
+        self.sub_langs_entry = ctk.CTkEntry(
+            input_panel,
+            placeholder_text=SUB_LANGS,
+            fg_color=self.colors['bg'],
+            border_color=self.colors['accent']
+        )
+        self.sub_langs_entry.insert(0, SUB_LANGS)
+        self.sub_langs_entry.pack(fill="x", padx=15, pady=(0, 5))
+        self.all_langs_var = ctk.BooleanVar(value=False)
+        self.all_langs_checkbox = ctk.CTkCheckBox(
+            input_panel,
+            text="Lưu mọi ngôn ngữ tìm được (sub.<lang>.txt)",
+            variable=self.all_langs_var,
+            text_color=self.colors['text']
+        )
+        self.all_langs_checkbox.pack(anchor="w", padx=15, pady=(0, 10))
+
         # Destination Directory
         self._add_input_section(input_panel, "Thư mục đầu ra")
 
@@ -540,6 +525,8 @@ class LCTCPipelineGUI:
             height=300  # Initial height
         )
         self.log_textbox.pack(fill="both", expand=True, padx=15, pady=(0, 15))
+        for tag, color in LOG_TAG_COLORS.items():
+            self.log_textbox.tag_config(f"{tag}_tag", foreground=self.colors[color])
 
         # Cancel button
         self.cancel_button = ctk.CTkButton(
@@ -576,50 +563,57 @@ class LCTCPipelineGUI:
             widget.destroy()
 
     def gui_log_output(self, message: str, color_tag: Optional[str] = None):
-        """Thread-safe logging to the GUI textbox."""
-        self.root.after(0, lambda: self._append_log(message, color_tag))
-
-    def _append_log(self, message: str, color: Optional[str] = None):
-        """Appends a message to the log textbox."""
-        self.log_textbox.configure(state="normal")
-        if color == "red":
-            self.log_textbox.insert("end", f"{message}\n", "red_tag")
-            self.log_textbox.tag_config("red_tag", foreground=self.colors['error'])
-        elif color == "yellow":
-            self.log_textbox.insert("end", f"{message}\n", "yellow_tag")
-            self.log_textbox.tag_config("yellow_tag", foreground=self.colors['warning'])
-        elif color == "green":
-            self.log_textbox.insert("end", f"{message}\n", "green_tag")
-            self.log_textbox.tag_config("green_tag", foreground=self.colors['success'])
-        elif color == "blue":  # Custom blue for general info/process start, now uses accent color
-            self.log_textbox.insert("end", f"{message}\n", "blue_tag")
-            self.log_textbox.tag_config("blue_tag", foreground=self.colors['accent'])
-        else:
-            self.log_textbox.insert("end", f"{message}\n")
-        self.log_textbox.see("end")  # Scroll to bottom
-        self.log_textbox.configure(state="disabled")
+        """Thread-safe logging to the GUI textbox (queued; drained by _drain_log on the UI thread)."""
+        self.log_sink.put(message, color_tag)
+
+    def _drain_log(self):
+        """Appends queued log lines in one batch every LOG_TICK_MS, keeping at most LOG_MAX_LINES lines."""
+        chunks = self.log_sink.drain()
+        if chunks:
+            self.log_textbox.configure(state="normal")
+            for text, color in chunks:
+                self.log_textbox.insert("end", text, f"{color}_tag" if color in LOG_TAG_COLORS else None)
+            excess = int(self.log_textbox.index("end-1c").split(".")[0]) - 1 - self.log_sink.max_lines
+            if excess > 0:
+                self.log_textbox.delete("1.0", f"{excess + 1}.0")
+            self.log_textbox.see("end")  # Scroll to bottom
+            self.log_textbox.configure(state="disabled")
+        self.root.after(LOG_TICK_MS, self._drain_log)
+
+    @property
+    def urls_to_process(self) -> List[str]:
+        return self.url_list.urls
 
     def _update_url_list_display(self):
-        """Updates the URL list textbox and count label."""
-        self.url_list_textbox.configure(state="normal")
-        self.url_list_textbox.delete("1.0", "end")
-        for url in self.urls_to_process:
-            self.url_list_textbox.insert("end", f"{url}\n")
-        self.url_list_textbox.configure(state="disabled")
-        self.url_count_label.configure(text=f"Tổng số URL: {len(self.urls_to_process)}")
+        """Appends only the URLs not yet shown to the textbox (full redraw only after clearing) and updates the count."""
+        shown = self._url_rows_shown
+        if shown != len(self.url_list):
+            self.url_list_textbox.configure(state="normal")
+            if shown > len(self.url_list):
+                self.url_list_textbox.delete("1.0", "end")
+                shown = 0
+            new_rows = self.url_list.urls[shown:]
+            if new_rows:
+                self.url_list_textbox.insert("end", "\n".join(new_rows) + "\n")
+            self.url_list_textbox.configure(state="disabled")
+            self._url_rows_shown = len(self.url_list)
+        self.url_count_label.configure(text=f"Tổng số URL: {len(self.url_list)}")
         self._update_end_num_label()  # Recalculate end number based on URL count
 
     def _add_single_url(self):
         url = self.single_url_entry.get().strip()
         if url:
-            if extract_video_id(url):
-                if url not in self.urls_to_process:
-                    self.urls_to_process.append(url)
+            if is_collection_url(url):
+                self.single_url_entry.delete(0, "end")
+                self.gui_log_output(f"Đang liệt kê video của {url}...", "blue")
+                self._load_urls_in_background(lambda: expand_url_gui(url, 1, self.gui_log_output), url)
+            elif extract_video_id(url):
+                if self.url_list.add(url):
                     self.single_url_entry.delete(0, "end")
                     self.gui_log_output(f"Đã thêm URL: {url}", "blue")
                     self._update_url_list_display()
                 else:
-                    messagebox.showinfo("URL trùng lặp", "URL này đã có trong danh sách.")
+                    messagebox.showinfo("URL trùng lặp", "Video này đã có trong danh sách.")
             else:
                 messagebox.showerror("URL không hợp lệ", "Vui lòng nhập một URL YouTube hợp lệ.")
         else:
@@ -633,24 +627,35 @@ class LCTCPipelineGUI:
             initialdir=os.path.expanduser("~")
         )
         if file_path:
-            urls = read_urls_from_file(file_path, self.gui_log_output)
+            # File có playlist/kênh cần gọi mạng để liệt kê => đọc trong luồng nền, UI không bị treo
+            self._load_urls_in_background(lambda: read_urls_from_file(file_path, self.gui_log_output),
+                                          f"'{os.path.basename(file_path)}'")
+
+    def _load_urls_in_background(self, load: Callable[[], Optional[List[str]]], source: str):
+        """Runs load() on a worker thread, then adds the URLs to the list on the UI thread."""
+        self.browse_url_file_button.configure(state="disabled")
+        self.add_url_button.configure(state="disabled")
+
+        def done(urls):
+            if not self.pipeline_running:
+                self.browse_url_file_button.configure(state="normal")
+                self.add_url_button.configure(state="normal")
             if urls:
-                new_urls_added = 0
-                for url in urls:
-                    if url not in self.urls_to_process:
-                        self.urls_to_process.append(url)
-                        new_urls_added += 1
-                self.gui_log_output(
-                    f"Đã tải {len(urls)} URL từ '{os.path.basename(file_path)}'. Đã thêm {new_urls_added} URL mới.",
-                    "green")
-                self.root.after(0, self._update_url_list_display)
+                new_urls_added = len(self.url_list.extend(urls))
+                self.gui_log_output(f"Đã tải {len(urls)} URL từ {source}. Đã thêm {new_urls_added} URL mới.", "green")
+                self._update_url_list_display()
             else:
-                messagebox.showwarning("Không có URL hợp lệ",
-                                       f"Không tìm thấy URL YouTube hợp lệ nào trong '{os.path.basename(file_path)}'.")
+                messagebox.showwarning("Không có URL hợp lệ", f"Không tìm thấy URL YouTube hợp lệ nào trong {source}.")
+
+        def worker():
+            urls = load()
+            self.root.after(0, done, urls)
+
+        threading.Thread(target=worker, daemon=True).start()
 
     def _clear_urls(self):
         if messagebox.askyesno("Xóa URL", "Bạn có chắc muốn xóa tất cả URL khỏi danh sách không?"):
-            self.urls_to_process = []
+            self.url_list.clear()
             self.gui_log_output("Tất cả URL đã được xóa.", "yellow")
             self._update_url_list_display()
 
@@ -708,6 +713,15 @@ class LCTCPipelineGUI:
         except ValueError:
             pad_width = max(1, len(str(start_num + len(self.urls_to_process) - 1)))  # Default if invalid
 
+        concurrency = clamp_concurrency(self.concurrency_entry.get().strip())
+
+        try:
+            langs = ",".join(e.label for e in parse_caption_langs(self.sub_langs_entry.get().strip() or SUB_LANGS))
+        except ValueError as e:
+            messagebox.showerror("Ngôn ngữ phụ đề không hợp lệ", str(e))
+            return
+        all_langs = bool(self.all_langs_var.get())
+
         dest_dir = self.dest_dir_entry.get().strip()
         if not os.path.isdir(dest_dir):
             messagebox.showerror("Thư mục không hợp lệ", "Vui lòng chọn một thư mục đích hợp lệ.")
@@ -717,19 +731,30 @@ class LCTCPipelineGUI:
             messagebox.showwarning("Không có URL", "Vui lòng thêm ít nhất một URL YouTube để xử lý.")
             return
 
-        if not YTDLP_AVAILABLE:
+        if not YT_DLP.available:
             if not messagebox.askyesno("yt-dlp bị thiếu",
                                        "yt-dlp chưa được cài đặt/không có sẵn. Quá trình trích xuất phụ đề YouTube sẽ bị bỏ qua. Bạn có muốn tiếp tục không?"):
                 return
             self.gui_log_output("yt-dlp không có sẵn. Quá trình trích xuất phụ đề YouTube sẽ bị bỏ qua.", "yellow")
 
+        # Lượt chạy dở (bị hủy/crash) với cùng danh sách URL + tham số: hỏi có tiếp tục không
+        params = {'prefix': prefix, 'start': start_num, 'pad_width': pad_width}
+        resume = False
+        if find_run_journal(dest_dir, params, self.urls_to_process):
+            resume = self.resume or messagebox.askyesno(
+                "Tiếp tục lượt chạy dở",
+                "Tìm thấy lượt chạy dở cho danh sách URL này trong thư mục đích.\n"
+                "Tiếp tục (chỉ làm nốt phần chưa xong)? Chọn 'No' để chạy lại từ đầu.")
+
         # Disable inputs and enable cancel button
         self._toggle_ui_state(False)
         self.stop_pipeline_flag = False
         self.pipeline_running = True
         self.gui_log_output("Pipeline đã bắt đầu!", "blue")
 
-        threading.Thread(target=self._run_pipeline, args=(prefix, start_num, pad_width, dest_dir), daemon=True).start()
+        threading.Thread(target=self._run_pipeline,
+                         args=(prefix, start_num, pad_width, dest_dir, concurrency, resume, langs, all_langs),
+                         daemon=True).start()
 
     def _toggle_ui_state(self, enable: bool):
         """Enable/disable input widgets and buttons."""
@@ -738,6 +763,9 @@ class LCTCPipelineGUI:
         self.prefix_entry.configure(state=state)
         self.start_num_entry.configure(state=state)
         self.pad_width_entry.configure(state=state)
+        self.concurrency_entry.configure(state=state)
+        self.sub_langs_entry.configure(state=state)
+        self.all_langs_checkbox.configure(state=state)
         self.dest_dir_entry.configure(state=state)
         self.start_button.configure(state=state)
         self.add_url_button.configure(state=state)
@@ -759,160 +787,191 @@ class LCTCPipelineGUI:
             self.gui_log_output("Yêu cầu hủy Pipeline. Đang chờ bước hiện tại hoàn thành...", "yellow")
             self.cancel_button.configure(state="disabled", text="Đang dừng...")  # Prevent multiple clicks
 
-    def _update_progress_gui(self, current: int, total: int, description: str):
-        """Updates GUI progress bar and label from background thread."""
-        self.root.after(0, lambda: self.current_task_label.configure(text=description))
-        if total > 0:
-            self.root.after(0, lambda: self.pipeline_progress_bar.set(current / total))
+    def _update_progress_gui(self, stage: str, current: int, total: int, description: str):
+        """Publishes progress from any thread; the UI thread picks it up in _poll_progress."""
+        self.progress.publish(stage, current, total, description)
+
+    def _poll_progress(self):
+        """Redraws the progress bar/label with the latest event, at most PROGRESS_FPS times per second."""
+        event = self.progress.poll()
+        if event:
+            _, current, total, description = event
+            self.current_task_label.configure(text=description)
+            self.pipeline_progress_bar.set(current / total if total > 0 else 0)
+        self.root.after(1000 // PROGRESS_FPS, self._poll_progress)
+
+    def _write_result(self, idx: int, r: Dict[str, Any], lctc_dir: str, name: str, langs: str = SUB_LANGS):
+        """
+        Writes sub.txt[, sub.<lang>.txt]/info.txt (atomic, skipped when unchanged) and fills the docx.
+        Results still carrying caption_tracks have their captions downloaded and streamed into sub.txt here.
+        Returns (folder, changed, result with its subtitle fields).
+        """
+        if r.get('status') != 'success':
+            # Ensure folder name for errors is safe and unique
+            error_id = r.get('video_id', 'unknown_id') if r.get('video_id') else extract_video_id(
+                r.get('url', '')) or 'unknown_url'
+            folder = os.path.join(lctc_dir, sanitize(f"ERR_{idx + 1:02d}_{error_id}"))
+            files = {'info.txt': f"URL: {r.get('url')}\nStatus: {r.get('status')}\n"
+                                 f"Error: {r.get('error', '')}\n"}
         else:
-            self.root.after(0, lambda: self.pipeline_progress_bar.set(0))  # Or a neutral state
-        self.root.update_idletasks()  # Ensure UI updates immediately, might be heavy for many small updates
-
-    def _run_pipeline(self, prefix: str, start_num: int, pad_width: int, dest_dir: str):
+            title = r.get('title', 'Video')
+            vid = r.get('video_id', 'unknown')
+            folder = os.path.join(lctc_dir, f"{safe_title(title)}_{vid}")
+            subs = {} if r.get('caption_tracks') else {'sub.txt': r.get('subtitles') or "Không có phụ đề",
+                                                       **caption_files(r)}
+            files = {**subs,
+                     'info.txt': f"Title: {title}\nVideo ID: {vid}\nURL: {r.get('url')}\n"
+                                 f"Duration: {r.get('duration', 'N/A')} seconds\n"
+                                 f"MappedTo: {name}\n"}
+        os.makedirs(folder, exist_ok=True)
+        written = []
+        if r.get('caption_tracks'):
+            r, changed = write_caption_files(r, folder, rate=RATE_CONTROLLER, note=fallback_note(langs),
+                                             missing=MISSING_SUBTITLES)
+            written.append(changed)
+        written += [write_text_if_changed(os.path.join(folder, fn), text) for fn, text in files.items()]
+        if r.get('status') == 'success':
+            try:
+                written.append(fill_folder_docs(lctc_dir, name, r, transcript_text(r)) > 0)
+            except OSError as e:
+                self.gui_log_output(f"⚠ Không điền được .docx trong {lctc_dir}: {e}", "yellow")
+        return folder, any(written), r
+
+    def _run_pipeline(self, prefix: str, start_num: int, pad_width: int, dest_dir: str,
+                      concurrency: int = DEFAULT_CONCURRENCY, resume: bool = False,
+                      langs: str = SUB_LANGS, all_langs: bool = False):
+        journal = None
         try:
-            # Step 1: Create folders
+            # Nhật ký lượt chạy: mỗi bước/kết quả được ghi ngay, hủy hoặc crash vẫn tiếp tục được;
+            # kết quả đã có trong kho chỉ ghi tham chiếu, tiếp tục thì đọc lại từ kho
+            store = shared_results_index('youtube_results.json', key_func=_result_key)
+            journal = RunJournal(dest_dir, {'prefix': prefix, 'start': start_num, 'pad_width': pad_width},
+                                 self.urls_to_process, resume=resume, store=store)
+            if journal.resumed:
+                self.gui_log_output(f"↷ Tiếp tục lượt chạy dở: {journal.summary()}.", "blue")
+
+            # Tạo thư mục, trích xuất YouTube và gán kết quả chạy chồng lên nhau (StagedPipeline):
+            # mỗi video được ghi vào thư mục LCTC của nó ngay khi xong, không chờ cả danh sách
+            urls = self.urls_to_process
+            total = len(urls)
             self.gui_log_output(
-                f"\n--- Bước 1: Tạo cấu trúc thư mục ({prefix}-{make_name(prefix, start_num, pad_width)} đến {prefix}-{make_name(prefix, start_num + len(self.urls_to_process) - 1, pad_width)}) ---",
+                f"\n--- Tạo thư mục {make_name(prefix, start_num, pad_width)} đến "
+                f"{make_name(prefix, start_num + total - 1, pad_width)}, trích xuất phụ đề và gán kết quả ---",
                 "blue")
-            self._update_progress_gui(0, len(self.urls_to_process),
-                                      f"Đang tạo thư mục {prefix}-{make_name(prefix, start_num, pad_width)}...")
 
-            if not DOCX_AVAILABLE:
+            if not DOCX.available:
                 self.gui_log_output("python-docx không có sẵn. Việc tạo file .docx sẽ chỉ tạo file trống.", "yellow")
             ensure_template_gui(self.gui_log_output)
 
-            total_folders = len(self.urls_to_process)
-            created_folders = 0
-            skipped_folders = 0
-
-            for i, _ in enumerate(self.urls_to_process):
-                if self.stop_pipeline_flag:
-                    self.gui_log_output("Pipeline bị hủy trong quá trình tạo thư mục.", "red")
-                    return
-
-                n = start_num + i
-                name = make_name(prefix, n, pad_width)
-                safe_name = sanitize(name)
-                base_path = os.path.join(dest_dir, safe_name)
-
-                if not os.path.exists(base_path):
-                    os.makedirs(base_path, exist_ok=True)
-                    created_folders += 1
+            todo = [] if journal.stage_done('fetched') else journal.pending()
+            backlog = [(i, r) for i, r in sorted(journal.results.items()) if r and i not in journal.assigned]
+            if journal.stage_done('folders'):
+                self.gui_log_output("↷ Bỏ qua tạo thư mục (đã xong ở lượt trước).", "blue")
+            if len(todo) < total:
+                self.gui_log_output(f"↷ {total - len(todo)}/{total} video đã có kết quả từ lượt trước.", "blue")
+            self.gui_log_output(f"Xử lý {len(todo)} URL với {concurrency} luồng song song.")
+            self.gui_log_output(f"Ngôn ngữ phụ đề: {langs}" + (" (lưu mọi ngôn ngữ)" if all_langs else ""))
+            done_folders, done, done_assign = [0], [total - len(todo)], [len(journal.assigned)]
+            folder_counts, folders_done = [], {}
+
+            def on_folder(i, base_path, created):
+                done_folders[0] += 1
+                if created:
                     self.gui_log_output(f"Đã tạo thư mục: {base_path}", "green")
                 else:
-                    skipped_folders += 1
                     self.gui_log_output(f"Thư mục đã tồn tại: {base_path}", "yellow")
-
-                for sf in SUBFOLDERS:
-                    os.makedirs(os.path.join(base_path, sf), exist_ok=True)
-
-                main_doc = os.path.join(base_path, f"{safe_name}.docx")
-                desc_doc = os.path.join(base_path, "MO TA.docx")
-                if not os.path.exists(main_doc): new_blank_docx_gui(main_doc)
-                if not os.path.exists(desc_doc): new_blank_docx_gui(desc_doc)
-
-                self.root.after(0, self._update_progress_gui, i + 1, total_folders,
-                                f"Đang tạo thư mục {i + 1}/{total_folders}: {base_path}")
-
-            self.gui_log_output(
-                f"✓ Hoàn tất tạo folder (tổng {total_folders}, mới {created_folders}, tồn tại {skipped_folders}).",
-                "green")
-
-            # Step 2: Extract YouTube subtitles & info
-            self.gui_log_output("\n--- Bước 2: Trích xuất thông tin và phụ đề YouTube ---", "blue")
-            results: List[Dict[str, Any]] = []
-            total_urls = len(self.urls_to_process)
-            for i, url in enumerate(self.urls_to_process):
-                if self.stop_pipeline_flag:
-                    self.gui_log_output("Pipeline bị hủy trong quá trình trích xuất YouTube.", "red")
-                    return
-
-                self.root.after(0, self._update_progress_gui, i, total_urls,
-                                f"Đang xử lý video {i + 1}/{total_urls}: {url}")
-                self.gui_log_output(f"Đang xử lý URL: {url}")
-
-                vid = extract_video_id(url)
-                existing_index, _ = load_existing_index('youtube_results.json')
-
-                if vid and vid in existing_index:
-                    r = existing_index[vid]
-                    r.setdefault('url', url)
-                    r.setdefault('status', 'success')
-                    results.append(r)
+                self._update_progress_gui('folders', done_folders[0], total,
+                                          f"Đang tạo thư mục {done_folders[0]}/{total}: {base_path}")
+
+            def scaffold(mark_ready):
+                def folder_ready(i, base_path, created):
+                    mark_ready(i, base_path, created)
+                    on_folder(i, base_path, created)
+
+                # Quét dest_dir một lần, tạo thư mục/subfolder/docx còn thiếu song song
+                names = [sanitize(make_name(prefix, start_num + i, pad_width)) for i in range(total)]
+                folder_counts.append(scaffold_folders(
+                    dest_dir, names, SUBFOLDERS, folder_docs, new_blank_docx_gui,
+                    should_stop=lambda: self.stop_pipeline_flag, on_folder=folder_ready))
+
+            def on_result(pos, url, r, cached):
+                done[0] += 1
+                deferred = bool(r.get('caption_tracks'))  # phụ đề chưa tải: lưu kho sau khi ghi (write)
+                if not cached and not deferred and r.get('status') == 'success':  # lỗi không lưu: lượt sau tải lại
+                    store.add(r, replace=True)  # thay bản cũ khác yêu cầu ngôn ngữ (accept_cached)
+                key = _result_key(r)
+                journal.record_result(todo[pos], r, stored_key=key if not deferred and key in store else None)
+                if cached:
                     self.gui_log_output(f"↷ Dùng lại kết quả đã có cho: {url}", "blue")
                 else:
-                    r = get_video_info_gui(url, self.gui_log_output)
-                    results.append(r)
                     self.gui_log_output(f"{'✓ OK' if r.get('status') == 'success' else '✗ Lỗi'} - {url}",
                                         "green" if r.get('status') == 'success' else "red")
+                self._update_progress_gui('fetch', done[0], total,
+                                          f"Đã xử lý {done[0]}/{total} video | {RATE_CONTROLLER.describe()}")
 
-                if i < total_urls - 1 and not self.stop_pipeline_flag:
-                    wait_time = random.randint(20, 25)
-                    self.gui_log_output(f"⏳ Đợi {wait_time} giây trước khi xử lý video tiếp theo.", "yellow")
-                    time.sleep(wait_time)
-
-            self.root.after(0, self._update_progress_gui, total_urls, total_urls, "Hoàn tất xử lý YouTube.")
-            save_results_merge_gui(results, self.gui_log_output)
-            self.gui_log_output("✓ Hoàn tất trích xuất thông tin và phụ đề.", "green")
-
-            # Step 3: Assign results to LCTC folders
-            self.gui_log_output("\n--- Bước 3: Gán kết quả vào thư mục LCTC ---", "blue")
-            assigned_count = 0
-            for idx, r in enumerate(results):
-                if self.stop_pipeline_flag:
-                    self.gui_log_output("Pipeline bị hủy trong quá trình gán kết quả.", "red")
-                    return
-
-                n = start_num + idx
-                lctc_dir = os.path.join(dest_dir, make_name(prefix, n, pad_width))
+            def on_wait(pos, url, delay, reason):
+                why = "YouTube báo quá tải (429/5xx)" if reason == 'cooldown' else "giữ nhịp"
+                self.gui_log_output(f"⏳ Đợi {delay:.0f} giây ({why}) trước khi xử lý video {todo[pos] + 1}.", "yellow")
 
+            def write(idx, r):
+                name = make_name(prefix, start_num + idx, pad_width)
+                lctc_dir = os.path.join(dest_dir, name)
                 if not os.path.isdir(lctc_dir):
-                    self.gui_log_output(f"⚠ Thiếu folder {lctc_dir} (bỏ qua gán cho video này).", "yellow")
-                    continue
-
-                target_base = lctc_dir
-
-                if r.get('status') != 'success':
-                    # Ensure folder name for errors is safe and unique
-                    error_id = r.get('video_id', 'unknown_id') if r.get('video_id') else extract_video_id(
-                        r.get('url', '')) or 'unknown_url'
-                    folder_name_error = f"ERR_{idx + 1:02d}_{error_id}"
-                    folder = os.path.join(target_base, sanitize(folder_name_error))
-                    os.makedirs(folder, exist_ok=True)
-                    with open(os.path.join(folder, 'info.txt'), 'w', encoding='utf-8') as f:
-                        f.write(f"URL: {r.get('url')}\n")
-                        f.write(f"Status: {r.get('status')}\n")
-                        f.write(f"Error: {r.get('error', '')}\n")
-                    self.gui_log_output(f"↷ Ghi chú lỗi vào {folder}", "yellow")
-                    continue
-
-                title = r.get('title', 'Video')
-                vid = r.get('video_id', 'unknown')
-                sub = r.get('subtitles') or "Không có phụ đề"
-                safe = safe_title(title)
-
-                folder = os.path.join(target_base, f"{safe}_{vid}")
-                os.makedirs(folder, exist_ok=True)
-
-                sub_path = os.path.join(folder, 'sub.txt')
-                info_path = os.path.join(folder, 'info.txt')
-
-                if os.path.exists(sub_path) and os.path.exists(info_path):
-                    self.gui_log_output(f"↷ Bỏ qua (đã tồn tại): {folder}", "blue")
+                    raise FileNotFoundError(f"Thiếu folder {lctc_dir}")
+                deferred = bool(r.get('caption_tracks'))
+                folders_done[idx], changed, r = self._write_result(idx, r, lctc_dir, name, langs)
+                if deferred and r.get('status') == 'success':
+                    store.add(r, replace=True)
+                    journal.record_result(idx, r, stored_key=_result_key(r))  # thay bản chưa tải phụ đề
+                return changed
+
+            def on_written(idx, status, err):
+                folder = folders_done.pop(idx, None)
+                if status in (WRITE_FAILED, 'missing'):
+                    self.gui_log_output(f"✗ Lỗi ghi video {idx + 1}: {err}", "red")
                 else:
-                    with open(sub_path, 'w', encoding='utf-8') as f:
-                        f.write(sub)
-                    with open(info_path, 'w', encoding='utf-8') as f:
-                        f.write(f"Title: {title}\nVideo ID: {vid}\nURL: {r.get('url')}\n")
-                        f.write(f"Duration: {r.get('duration', 'N/A')} seconds\n")
-                        f.write(f"MappedTo: {make_name(prefix, n, pad_width)}\n")
-                    assigned_count += 1
-                    self.gui_log_output(f"✓ Lưu vào: {folder}", "green")
-
-                self.root.after(0, self._update_progress_gui, idx + 1, len(results),
-                                f"Đang gán kết quả {idx + 1}/{len(results)}")
+                    if status == WRITE_UNCHANGED:
+                        self.gui_log_output(f"↷ Không đổi: {folder}", "blue")
+                    elif os.path.basename(folder).startswith('ERR_'):
+                        self.gui_log_output(f"↷ Ghi chú lỗi vào {folder}", "yellow")
+                    else:
+                        self.gui_log_output(f"✓ Lưu vào: {folder}", "green")
+                    journal.mark_assigned(idx)
+                    done_assign[0] += 1
+                self._update_progress_gui('assign', done_assign[0], total, f"Đã gán {done_assign[0]}/{total} video")
+
+            engine = ExtractionEngine(lambda u, session: get_video_info_gui(u, self.gui_log_output, session,
+                                                                            langs=langs, all_langs=all_langs,
+                                                                            stream_captions=True),
+                                      concurrency=concurrency,
+                                      should_stop=lambda: self.stop_pipeline_flag,
+                                      on_result=on_result, on_wait=on_wait,
+                                      id_func=extract_video_id, session_factory=YDLSession, keep_results=False,
+                                      accept_cached=lambda r: caption_result_matches(r, langs, all_langs))
+            pipeline = StagedPipeline(engine, write, None if journal.stage_done('folders') else scaffold,
+                                      on_written=on_written)
+            pipeline.run(urls, todo, store, backlog)
+            if pipeline.scaffold_error:
+                raise pipeline.scaffold_error
+            if self.stop_pipeline_flag:
+                self.gui_log_output("Pipeline bị hủy (kết quả đã xong được giữ lại, chạy lại để tiếp tục).", "red")
+                return
 
-            self.gui_log_output(f"→ Đã gán {assigned_count}/{len(results)} video vào {prefix}-*.", "green")
+            journal.mark_stage('folders')
+            journal.mark_stage('fetched')
+            if folder_counts:
+                _, created_folders, skipped_folders = folder_counts[0]
+                self.gui_log_output(
+                    f"✓ Hoàn tất tạo folder (tổng {total}, mới {created_folders}, tồn tại {skipped_folders}).", "green")
+            summary = pipeline.summary
+            failed = summary['failed'] + summary['missing']
+            self.gui_log_output(f"→ Gán vào {prefix}-*: ghi {summary['written']}, không đổi {summary['unchanged']}, "
+                                f"lỗi {failed}.", "red" if failed else "green")
+            if failed:
+                messagebox.showwarning("Pipeline Hoàn thành", f"{failed} video ghi file lỗi — chạy lại để gán nốt.")
+                return
+            journal.mark_stage('assigned')
+            journal.finish()
 
             messagebox.showinfo("Pipeline Hoàn thành", "LCTC Pipeline đã hoàn thành thành công!")
 
@@ -921,17 +980,22 @@ class LCTCPipelineGUI:
             self.gui_log_output(error_msg, "red")
             messagebox.showerror("Lỗi Pipeline", error_msg)
         finally:
-            self.root.after(0, lambda: self.current_task_label.configure(text="Sẵn sàng."))
-            self.root.after(0, lambda: self.pipeline_progress_bar.set(0))
+            if journal:
+                journal.close()
+            self.progress.clear()
+            self._update_progress_gui('idle', 0, 0, "Sẵn sàng.")
             self.pipeline_running = False
             self.stop_pipeline_flag = False
             self.root.after(0, lambda: self._toggle_ui_state(True))
             self.root.after(0, lambda: self.cancel_button.configure(text="Hủy Pipeline"))
 
     def run(self):
-        self.root.mainloop()
+        try:
+            self.root.mainloop()
+        finally:
+            self.log_sink.close()
 
 
 if __name__ == "__main__":
-    app = LCTCPipelineGUI()
+    app = LCTCPipelineGUI(resume="--resume" in sys.argv[1:])
     app.run()
\ No newline at end of file
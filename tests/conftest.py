@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Các module nằm phẳng ở gốc repo (không đóng gói): cho pytest import được từ tests/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
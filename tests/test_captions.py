@@ -0,0 +1,259 @@
+import json
+
+import pytest
+
+from lctc_pipeline_core import (CaptionLang, HTTPStatusError, clean_subtitles, deferred_caption_fields,
+                                fetch_caption_texts, iter_dedupe_lines, parse_caption_langs, parse_json3_lines,
+                                parse_timedtext_xml_lines, parse_unknown_caption_lines, parse_vtt_lines,
+                                select_caption_track, write_caption_files, write_lines_if_changed)
+
+JSON3 = json.dumps({
+    'wireMagic': 'pb3',
+    'events': [
+        {'tStartMs': 0, 'dDurationMs': 1000},
+        {'tStartMs': 0, 'segs': [{'utf8': 'Xin chào'}, {'utf8': '  các bạn'}]},
+        {'tStartMs': 1000, 'segs': [{'utf8': '\n'}]},
+        {'tStartMs': 2000, 'segs': [{'utf8': 'yes'}]},
+        {'tStartMs': 3000, 'segs': [{'utf8': 'yes'}]},
+        {'tStartMs': 4000, 'segs': [{'utf8': 'Tạm biệt & hẹn gặp lại'}]},
+    ],
+}, ensure_ascii=False)
+
+SRV3 = """<?xml version="1.0" encoding="utf-8" ?><timedtext format="3">
+<body>
+<p t="0" d="1000">Xin chào <s>các</s> bạn</p>
+<p t="1000" d="500"></p>
+<p t="2000" d="1000">yes</p>
+<p t="3000" d="1000">yes</p>
+<p t="4000" d="1000">Tạm biệt &amp; hẹn gặp lại</p>
+</body></timedtext>"""
+
+VTT = """WEBVTT
+Kind: captions
+Language: vi
+
+STYLE
+::cue { color: white }
+
+NOTE bình luận
+nhiều dòng
+
+00:00:00.000 --> 00:00:01.500 align:start position:0%
+Xin chào<00:00:00.500><c> các</c><00:00:01.000><c> bạn</c>
+
+00:00:01.500 --> 00:00:03.000 align:start position:0%
+Xin chào các bạn
+hôm nay
+
+00:00:03.000 --> 00:00:04.000
+hôm nay chúng ta học
+
+00:00:04.000 --> 00:00:05.000
+NOTE này là lời thoại
+
+00:00:05.000 --> 00:00:06.000
+Tạm biệt &amp; hẹn gặp lại
+"""
+
+
+def chunked(text, size=7):
+    """Chia thành các chunk nhỏ (cắt ngang ký tự UTF-8 nhiều byte) như khi đọc dần từ mạng."""
+    data = text.encode('utf-8')
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+@pytest.mark.parametrize('size', [3, 7, 1 << 16])
+def test_json3_keeps_repeated_lines(size):
+    assert list(parse_json3_lines(chunked(JSON3, size))) == [
+        'Xin chào các bạn', 'yes', 'yes', 'Tạm biệt & hẹn gặp lại']
+
+
+@pytest.mark.parametrize('size', [3, 7, 1 << 16])
+def test_srv3_decodes_entities_and_keeps_repeated_lines(size):
+    assert list(parse_timedtext_xml_lines(chunked(SRV3, size))) == [
+        'Xin chào các bạn', 'yes', 'yes', 'Tạm biệt & hẹn gặp lại']
+
+
+VTT_MANUAL = ['Xin chào các bạn', 'Xin chào các bạn', 'hôm nay', 'hôm nay chúng ta học',
+              'NOTE này là lời thoại', 'Tạm biệt & hẹn gặp lại']
+VTT_AUTO = ['Xin chào các bạn', 'hôm nay chúng ta học', 'NOTE này là lời thoại', 'Tạm biệt & hẹn gặp lại']
+
+
+@pytest.mark.parametrize('size', [3, 7, 1 << 16])
+def test_vtt_drops_header_blocks_and_rolling_duplicates_of_auto_captions(size):
+    assert list(parse_vtt_lines(chunked(VTT, size), auto=True)) == VTT_AUTO
+    assert list(parse_vtt_lines(chunked(VTT, size))) == VTT_MANUAL  # phụ đề thủ công: giữ nguyên từng cue
+
+
+@pytest.mark.parametrize('lines, expected', [
+    (['I know what you mean', 'no', 'mean it'], ['I know what you mean', 'no', 'mean it']),
+    (['Anh có biết không', 'không', 'biết'], ['Anh có biết không', 'không', 'biết']),
+    (['yes', 'no', 'yes', 'ok', 'ok'], ['yes', 'no', 'yes', 'ok']),
+    (['chúng ta', 'chúng tao đi'], ['chúng ta', 'chúng tao đi']),  # tiền tố không theo ranh giới từ
+    (['hôm nay chúng', 'hôm nay chúng ta học', 'ta học'], ['hôm nay chúng ta học']),
+    (['xin chào các bạn', 'các bạn hôm nay'], ['xin chào các bạn', 'hôm nay']),
+])
+def test_rolling_dedupe_only_drops_word_aligned_overlap(lines, expected):
+    assert list(iter_dedupe_lines(lines)) == expected
+
+
+def test_manual_srt_keeps_repeated_dialogue():
+    srt = ("1\n00:00:00,000 --> 00:00:01,000\nI know what you mean\n\n"
+           "2\n00:00:01,000 --> 00:00:02,000\nno\n\n"
+           "3\n00:00:02,000 --> 00:00:03,000\nno\n\n"
+           "4\n00:00:03,000 --> 00:00:04,000\nmean it\n")
+    expected = ['I know what you mean', 'no', 'no', 'mean it']
+    assert list(parse_vtt_lines(chunked(srt))) == expected
+    assert clean_subtitles(srt).splitlines() == expected
+
+
+def test_srt_numbers_and_timings_are_skipped():
+    srt = "1\n00:00:00,000 --> 00:00:01,000\nMột\n\n2\n00:00:01,000 --> 00:00:02,000\nHai\n"
+    assert list(parse_vtt_lines(chunked(srt))) == ['Một', 'Hai']
+
+
+@pytest.mark.parametrize('body, expected', [
+    (JSON3, ['Xin chào các bạn', 'yes', 'yes', 'Tạm biệt & hẹn gặp lại']),
+    (SRV3, ['Xin chào các bạn', 'yes', 'yes', 'Tạm biệt & hẹn gặp lại']),
+    (VTT, VTT_MANUAL),
+    ('  \n ', []),
+])
+def test_unknown_format_is_sniffed(body, expected):
+    assert list(parse_unknown_caption_lines(chunked(body))) == expected
+
+
+def test_truncated_json3_yields_complete_events_only():
+    body = JSON3[:JSON3.index('Tạm biệt') - 10]
+    assert list(parse_json3_lines(chunked(body))) == ['Xin chào các bạn', 'yes', 'yes']
+
+
+def test_clean_subtitles_matches_vtt_parser():
+    assert clean_subtitles(VTT).splitlines() == VTT_MANUAL
+    assert clean_subtitles(VTT, auto=True).splitlines() == VTT_AUTO
+    assert clean_subtitles('') == "Không có nội dung phụ đề"
+
+
+def test_select_caption_track_prefers_cheapest_format():
+    tracks = [{'ext': 'vtt', 'url': 'v'}, {'ext': 'srv3', 'url': 's'}, {'ext': 'json3', 'url': 'j'}]
+    assert select_caption_track(tracks)['url'] == 'j'
+    assert select_caption_track(tracks, ('srv3',))['url'] == 's'
+    assert select_caption_track([{'ext': 'ttml', 'url': 't'}])['url'] == 't'
+    assert select_caption_track([{'ext': 'json3'}]) is None
+
+
+def test_parse_caption_langs():
+    assert parse_caption_langs('vi, vi-VN,en,auto-translated vi,vi') == (
+        CaptionLang('vi'), CaptionLang('vi-VN'), CaptionLang('en'), CaptionLang('vi', True))
+    for bad in ('auto-translated', 'vi VN', ' , '):
+        with pytest.raises(ValueError):
+            parse_caption_langs(bad)
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def iter_chunks(self):
+        yield from chunked(self.body)
+        self.body = ''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class FakeClient:
+    """url -> nội dung (str) hoặc mã lỗi HTTP (int)."""
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def open(self, url):
+        page = self.pages[url]
+        if isinstance(page, int):
+            raise HTTPStatusError(page, url)
+        return FakeResponse(page)
+
+
+INFO = {
+    'subtitles': {'vi': [{'ext': 'json3', 'url': 'vi-manual'}]},
+    'automatic_captions': {'vi': [{'ext': 'vtt', 'url': 'vi-auto'}], 'en': [{'ext': 'srv3', 'url': 'en-auto'}]},
+}
+
+
+def test_fetch_falls_back_to_next_language_on_broken_track():
+    client = FakeClient({'vi-manual': 404, 'vi-auto': VTT, 'en-auto': SRV3})
+    (caption,) = fetch_caption_texts(INFO, 'vi,en', client=client)
+    assert caption.lang == 'en' and caption.ext == 'srv3'
+    assert caption.text.startswith('Xin chào các bạn\n')
+
+
+def test_fetch_all_langs_returns_each_language_in_priority_order():
+    client = FakeClient({'vi-manual': JSON3, 'vi-auto': VTT, 'en-auto': SRV3})
+    captions = fetch_caption_texts(INFO, 'en,vi', all_langs=True, client=client)
+    assert [(c.lang, c.ext) for c in captions] == [('en', 'srv3'), ('vi', 'json3')]
+
+
+def test_fetch_raises_when_throttled_instead_of_returning_nothing():
+    client = FakeClient({'vi-manual': 429, 'vi-auto': VTT, 'en-auto': 404})
+    with pytest.raises(HTTPStatusError) as exc:
+        fetch_caption_texts(INFO, 'vi,en', client=client)
+    assert exc.value.code == 429
+
+
+def test_rolling_dedupe_applies_to_auto_caption_tracks_only():
+    info = {'subtitles': {'vi': [{'ext': 'vtt', 'url': 'vi-manual'}]},
+            'automatic_captions': {'en': [{'ext': 'vtt', 'url': 'en-auto'}]}}
+    captions = fetch_caption_texts(info, 'vi,en', all_langs=True, client=FakeClient({'vi-manual': VTT, 'en-auto': VTT}))
+    assert [c.text.split('\n') for c in captions] == [VTT_MANUAL, VTT_AUTO]
+
+
+def read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_write_caption_files_streams_to_sub_txt_and_keeps_a_preview(tmp_path):
+    result = {'video_id': 'x', 'status': 'success', **deferred_caption_fields(INFO, 'vi,en')}
+    client = FakeClient({'vi-manual': 404, 'vi-auto': VTT, 'en-auto': SRV3})
+    out, changed = write_caption_files(result, str(tmp_path), client, keep_chars=10)
+    full = 'Xin chào các bạn\nyes\nyes\nTạm biệt & hẹn gặp lại'
+    assert changed and read(tmp_path / 'sub.txt') == full
+    assert out['subtitles'] == full[:10] and out['subtitles_truncated']
+    assert (out['subtitle_lang'], out['subtitle_format']) == ('en', 'srv3') and 'caption_tracks' not in out
+    assert write_caption_files(result, str(tmp_path), client)[0]['subtitles'] == full
+    assert not write_caption_files(result, str(tmp_path), client)[1]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['sub.txt']
+
+
+def test_write_caption_files_all_langs_writes_one_file_per_language(tmp_path):
+    result = deferred_caption_fields(INFO, 'en,vi', all_langs=True)
+    client = FakeClient({'vi-manual': JSON3, 'vi-auto': VTT, 'en-auto': SRV3})
+    out, _ = write_caption_files(result, str(tmp_path), client)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['sub.en.txt', 'sub.txt', 'sub.vi.txt']
+    assert read(tmp_path / 'sub.txt') == read(tmp_path / 'sub.en.txt') == out['subtitles']
+    assert out['extra_subtitles'] == {'vi': read(tmp_path / 'sub.vi.txt')}
+
+
+def test_write_caption_files_raises_when_throttled_and_leaves_sub_txt_alone(tmp_path):
+    (tmp_path / 'sub.txt').write_text('cũ', encoding='utf-8')
+    result = deferred_caption_fields(INFO, 'vi,en')
+    with pytest.raises(HTTPStatusError):
+        write_caption_files(result, str(tmp_path), FakeClient({'vi-manual': 429, 'vi-auto': VTT, 'en-auto': 404}))
+    assert read(tmp_path / 'sub.txt') == 'cũ'
+
+
+def test_write_lines_if_changed_never_leaves_a_partial_file(tmp_path):
+    path = tmp_path / 'sub.txt'
+    path.write_text('cũ', encoding='utf-8')
+
+    def broken():
+        yield 'một'
+        raise OSError('mất kết nối')
+
+    with pytest.raises(OSError):
+        write_lines_if_changed(str(path), broken())
+    assert write_lines_if_changed(str(path), iter(())) is None
+    assert read(path) == 'cũ' and [p.name for p in tmp_path.iterdir()] == ['sub.txt']
@@ -0,0 +1,74 @@
+import pytest
+
+from lctc_pipeline_core import (EXTRACT_MODE_FLAT, RateController, YDLSession, expand_collection,
+                                is_collection_url)
+
+
+def vid(n):
+    return f"{n:011d}"
+
+
+class FakeFlatYDL:
+    """yt-dlp chế độ flat giả: entries sinh dần theo trang, đếm số trang đã tải."""
+
+    def __init__(self, playlists):
+        self.playlists = playlists
+        self.pages = []
+
+    def extract_info(self, url, download=False, process=False):
+        value = self.playlists[url]
+        if isinstance(value, str):
+            return {'_type': 'url', 'url': value}
+        return {'_type': 'playlist', 'entries': self._entries(url, value)}
+
+    def _entries(self, url, pages):
+        for n, page in enumerate(pages):
+            self.pages.append((url, n))
+            yield from page
+
+    def close(self):
+        pass
+
+
+def expand(playlists, url):
+    session = YDLSession()
+    ydl = session._ydls[EXTRACT_MODE_FLAT] = FakeFlatYDL(playlists)
+    rate = RateController(rate=1000, max_rate=1000, burst=1000)
+    return expand_collection(url, session, rate), ydl
+
+
+PLAYLIST = [
+    [{'id': vid(1)}, {'id': vid(2)}, None],
+    [{'id': vid(2)}, {'id': 'UCkênh', 'ie_key': 'YoutubeTab'}, {'id': 'ngắn'}, {'id': vid(3)}],
+]
+
+
+def test_expand_collection_pages_lazily_and_keeps_order_without_duplicates():
+    urls, ydl = expand({'pl': PLAYLIST}, 'pl')
+    assert next(urls) == f"https://www.youtube.com/watch?v={vid(1)}"
+    assert ydl.pages == [('pl', 0)]  # trang 2 chưa tải khi mới lấy video đầu
+    assert list(urls) == [f"https://www.youtube.com/watch?v={vid(n)}" for n in (2, 3)]
+    assert ydl.pages == [('pl', 0), ('pl', 1)]
+
+
+def test_expand_collection_follows_redirects_and_channel_tabs():
+    playlists = {
+        '@kenh': 'kenh-tabs',
+        'kenh-tabs': [[{'id': 'videos', 'ie_key': 'YoutubeTab', 'url': 'tab-videos'},
+                       {'id': 'shorts', 'ie_key': 'YoutubeTab', 'url': 'tab-shorts'}]],
+        'tab-videos': [[{'id': vid(1)}, {'id': vid(2)}]],
+        'tab-shorts': [[{'id': vid(2)}, {'id': vid(9)}]],
+    }
+    urls, _ = expand(playlists, '@kenh')
+    assert [u[-11:] for u in urls] == [vid(1), vid(2), vid(9)]
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://www.youtube.com/playlist?list=PL123abc', True),
+    ('https://youtube.com/@kenh/videos', True),
+    ('https://m.youtube.com/channel/UC123/streams?x=1', True),
+    ('https://www.youtube.com/watch?v=aaaaaaaaaaa&list=PL123', False),
+    ('https://youtu.be/aaaaaaaaaaa', False),
+])
+def test_is_collection_url(url, expected):
+    assert is_collection_url(url) is expected
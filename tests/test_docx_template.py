@@ -0,0 +1,116 @@
+import os
+import re
+import zipfile
+from xml.etree import ElementTree
+
+import pytest
+
+from lctc_pipeline_core import DOCX_DOCUMENT, DocxTemplate, fill_template_docs
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'template.docx')
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+VALUES = {
+    'name': 'LCTC-01', 'title': 'Bài 1: <HTML> & "JSON"', 'url': 'https://youtu.be/aaaaaaaaaaa?t=1&x=2',
+    'video_id': 'aaaaaaaaaaa', 'duration': 125,
+    'transcript': 'Dòng một\nDòng hai có ký tự điều khiển \x0b và \x01',
+}
+
+
+def paragraphs(path):
+    """Chữ của từng đoạn văn trong word/document.xml (<w:br/> => xuống dòng)."""
+    with zipfile.ZipFile(path) as zf:
+        root = ElementTree.fromstring(zf.read(DOCX_DOCUMENT))
+    out = []
+    for p in root.iter(W + 'p'):
+        out.append(''.join(el.text or '' if el.tag == W + 't' else '\n'
+                           for el in p.iter() if el.tag in (W + 't', W + 'br')))
+    return out
+
+
+def assert_valid_docx(path):
+    with zipfile.ZipFile(path) as zf, zipfile.ZipFile(TEMPLATE) as tpl:
+        assert zf.testzip() is None
+        assert sorted(zf.namelist()) == sorted(tpl.namelist())
+        for name in tpl.namelist():
+            if name != DOCX_DOCUMENT:
+                assert zf.read(name) == tpl.read(name)  # các phần khác giữ nguyên
+
+
+def with_document(tmp_path, body_xml):
+    """Bản sao template.docx với thân văn bản thay bằng body_xml."""
+    path = str(tmp_path / 'placeholders.docx')
+    with zipfile.ZipFile(TEMPLATE) as src, zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            data = src.read(info)
+            if info.filename == DOCX_DOCUMENT:
+                xml = data.decode('utf-8')
+                start = xml.index('<w:body>') + len('<w:body>')
+                end = xml.index('<w:sectPr', start)
+                data = (xml[:start] + body_xml + xml[end:]).encode('utf-8')
+            dst.writestr(info, data)
+    return path
+
+
+def test_default_layout_is_a_valid_docx(tmp_path):
+    tpl = DocxTemplate(TEMPLATE)
+    assert not tpl.has_placeholders
+    dst = str(tmp_path / 'out.docx')
+    tpl.write(dst, VALUES)
+    texts = [t for t in paragraphs(dst) if t]
+    assert texts[:3] == [VALUES['title'], f"URL: {VALUES['url']}", 'Thời lượng: 125 giây']
+    assert texts[-2:] == ['Dòng một', 'Dòng hai có ký tự điều khiển  và ']
+    assert_valid_docx(dst)
+
+
+def test_desc_layout(tmp_path):
+    dst = str(tmp_path / 'desc.docx')
+    DocxTemplate(TEMPLATE).write(dst, VALUES, layout='desc')
+    assert [t for t in paragraphs(dst) if t] == [VALUES['title'], f"URL: {VALUES['url']}"]
+    assert_valid_docx(dst)
+
+
+def test_placeholders_split_across_runs(tmp_path):
+    body = ('<w:p><w:r><w:t>Tiêu đề: {{ti</w:t></w:r><w:r><w:rPr><w:b/></w:rPr><w:t>tle}}</w:t></w:r></w:p>'
+            '<w:p><w:r><w:t>{{ url }} ({{duration}}s) {{khong_co}}</w:t></w:r></w:p>'
+            '<w:p><w:r><w:t xml:space="preserve">{{transcript}}</w:t></w:r></w:p>')
+    tpl = DocxTemplate(with_document(tmp_path, body))
+    assert tpl.has_placeholders
+    dst = str(tmp_path / 'out.docx')
+    tpl.write(dst, VALUES)
+    assert paragraphs(dst)[:3] == [
+        f"Tiêu đề: {VALUES['title']}",
+        f"{VALUES['url']} (125s) ",
+        'Dòng một\nDòng hai có ký tự điều khiển  và ',
+    ]
+    with zipfile.ZipFile(dst) as zf:
+        assert zf.testzip() is None
+        assert not re.search(r'\{\{|\}\}', zf.read(DOCX_DOCUMENT).decode('utf-8'))
+
+
+def test_output_opens_in_python_docx(tmp_path):
+    docx = pytest.importorskip('docx')
+    dst = str(tmp_path / 'out.docx')
+    DocxTemplate(TEMPLATE).write(dst, VALUES)
+    doc = docx.Document(dst)
+    assert doc.paragraphs[0].text == VALUES['title']
+    assert doc.paragraphs[0].runs[0].bold
+    body = with_document(tmp_path, '<w:p><w:r><w:t>{{title}}</w:t></w:r></w:p>')
+    DocxTemplate(body).write(dst, VALUES)
+    assert docx.Document(dst).paragraphs[0].text == VALUES['title']
+
+
+def test_fill_template_docs_only_touches_blank_copies(tmp_path):
+    with open(TEMPLATE, 'rb') as f:
+        blank = f.read()
+    folder = tmp_path / 'LCTC-01'
+    folder.mkdir()
+    (folder / 'blank.docx').write_bytes(blank)
+    (folder / 'empty.docx').write_bytes(b'')
+    (folder / 'edited.docx').write_bytes(blank + b'x')
+    docs = [('blank.docx', 'main'), ('empty.docx', 'desc'), ('edited.docx', 'main'), ('new.docx', 'main')]
+    assert fill_template_docs(TEMPLATE, str(folder), docs, VALUES) == 3
+    assert (folder / 'edited.docx').read_bytes() == blank + b'x'
+    for name in ('blank.docx', 'empty.docx', 'new.docx'):
+        assert VALUES['title'] in paragraphs(str(folder / name))
+    assert fill_template_docs(str(tmp_path / 'khong-co.docx'), str(folder), docs, VALUES) == 0
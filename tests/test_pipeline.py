@@ -0,0 +1,253 @@
+import asyncio
+import random
+import threading
+import time
+
+import pytest
+
+import lctc_pipeline_core
+from lctc_pipeline_core import (WRITE_FAILED, WRITE_UNCHANGED, WRITE_WRITTEN, ExtractionEngine, RateController,
+                                StagedPipeline, aprocess_urls_keep_order, caption_result_matches,
+                                close_shared_results_stores, extract_video_id)
+
+
+def fast_rate():
+    return RateController(rate=1000, max_rate=1000, burst=1000, cooldown=0.01, server_cooldown=0.01)
+
+
+class FakeFetch:
+    """fetch_func giả: trễ ngẫu nhiên để kết quả về không theo thứ tự; đếm số lần gọi mỗi URL."""
+
+    def __init__(self, fail=(), throttle_once=()):
+        self.calls = {}
+        self.fail = set(fail)
+        self.throttle_once = set(throttle_once)
+        self.lock = threading.Lock()
+
+    def __call__(self, url):
+        time.sleep(random.random() * 0.01)
+        vid = extract_video_id(url)
+        with self.lock:
+            n = self.calls[vid] = self.calls.get(vid, 0) + 1
+        if vid in self.throttle_once and n == 1:
+            return {'url': url, 'status': 'error', 'error': 'ERROR: HTTP Error 429: Too Many Requests'}
+        if vid in self.fail:
+            return {'url': url, 'status': 'error', 'error': 'Video unavailable'}
+        return {'url': url, 'video_id': vid, 'title': f"Video {vid}", 'status': 'success', 'subtitles': vid * 3}
+
+
+def url(i, form="https://youtu.be/{}"):
+    return form.format(f"{i:011d}")
+
+
+def make_engine(fetch, **kwargs):
+    return ExtractionEngine(fetch, concurrency=4, rate=fast_rate(), id_func=extract_video_id, **kwargs)
+
+
+def test_engine_keeps_input_order_and_fetches_each_video_once():
+    urls = [url(i) for i in range(20)]
+    urls += [url(3, "https://www.youtube.com/watch?v={}&t=5"), url(7, "https://m.youtube.com/shorts/{}")]
+    fetch = FakeFetch()
+    emitted = []
+    engine = make_engine(fetch, on_result=lambda i, u, r, cached: emitted.append((i, cached)))
+    results = engine.run(urls)
+    assert [r['url'] for r in results] == urls
+    assert all(n == 1 for n in fetch.calls.values()) and len(fetch.calls) == 20
+    assert results[20]['video_id'] == results[3]['video_id']
+    assert sorted(emitted) == [(i, i >= 20) for i in range(22)]
+
+
+def test_engine_cache_hits_skip_fetch_and_leave_cache_untouched():
+    cached = {'video_id': f"{1:011d}", 'title': 'cũ', 'url': 'https://youtu.be/cu', 'subtitles': 'x'}
+    index = {cached['video_id']: cached}
+    fetch = FakeFetch()
+    results = make_engine(fetch).run([url(0), url(1)], index)
+    assert list(fetch.calls) == [f"{0:011d}"]
+    assert results[1] == {'status': 'success', **cached, 'url': url(1)}
+    assert cached['url'] == 'https://youtu.be/cu'
+
+
+def test_engine_refetches_cached_results_for_another_caption_spec():
+    vi = {'video_id': f"{0:011d}", 'subtitles': 'vi', 'subtitle_lang': 'vi', 'subtitle_langs': 'vi,en'}
+    en = {'video_id': f"{1:011d}", 'subtitles': 'en', 'subtitle_lang': 'en', 'subtitle_langs': 'en'}
+    index = {r['video_id']: r for r in (vi, en)}
+    fetch = FakeFetch()
+    accept = lambda r: caption_result_matches(r, 'vi,en')  # noqa: E731
+    results = make_engine(fetch, accept_cached=accept).run([url(0), url(1)], index)
+    assert list(fetch.calls) == [f"{1:011d}"]
+    assert results[0]['subtitles'] == 'vi' and results[1]['subtitles'] == f"{1:011d}" * 3
+
+
+def test_caption_result_matches_requested_languages():
+    legacy = {'subtitles': 'x'}
+    assert caption_result_matches(legacy) and not caption_result_matches(legacy, 'en')
+    assert not caption_result_matches(legacy, all_langs=True)
+    fallback = {'subtitle_lang': 'en', 'subtitle_langs': 'vi,en'}
+    assert caption_result_matches(fallback, 'vi,en') and caption_result_matches(fallback, 'en')
+    assert not caption_result_matches(fallback, 'vi')
+    assert not caption_result_matches({**fallback, 'status': 'error'}, 'vi,en')
+    every = {'subtitle_lang': 'vi', 'subtitle_langs': 'vi,en', 'extra_subtitles': {'en': 'y'}}
+    assert caption_result_matches(every, 'en,vi', all_langs=True)
+    assert not caption_result_matches(every, 'vi,ja', all_langs=True)
+    assert not caption_result_matches({'subtitle_lang': 'vi'}, 'vi', all_langs=True)
+
+
+def test_engine_retries_throttled_video_and_reports_errors():
+    fetch = FakeFetch(fail={f"{2:011d}"}, throttle_once={f"{1:011d}"})
+    results = make_engine(fetch).run([url(0), url(1), url(2)])
+    assert [r['status'] for r in results] == ['success', 'success', 'error']
+    assert fetch.calls[f"{1:011d}"] == 2 and fetch.calls[f"{2:011d}"] == 1
+
+
+def test_engine_without_keep_results_returns_summaries():
+    results = make_engine(FakeFetch(), keep_results=False).run([url(0)])
+    assert results[0]['title'] == f"Video {0:011d}" and 'subtitles' not in results[0]
+
+
+@pytest.mark.parametrize('queue_size', [1, 2])
+def test_staged_pipeline_writes_every_result_once_after_its_folder(queue_size):
+    n = 30
+    urls = [url(i) for i in range(n)] + [url(5, "https://www.youtube.com/watch?v={}")]
+    todo = [i for i in range(len(urls)) if i not in (0, 1)]  # 0, 1: đã tải ở lượt trước
+    backlog = [(0, {'url': urls[0], 'status': 'success', 'video_id': 'b0'}),
+               (1, {'url': urls[1], 'status': 'error', 'error': 'boom'})]
+    ready, written, statuses = set(), [], {}
+    lock = threading.Lock()
+
+    def scaffold(on_folder):
+        for i in reversed(range(len(urls))):  # thư mục dựng theo thứ tự ngược với kết quả
+            time.sleep(0.001)
+            with lock:
+                ready.add(i)
+            on_folder(i, f"/x/{i}", True)
+
+    def write(idx, r):
+        with lock:
+            assert idx in ready
+            written.append(idx)
+        if idx == 7:
+            raise OSError('đĩa đầy')
+        return idx % 2 == 0
+
+    def on_written(idx, status, err):
+        statuses[idx] = status
+
+    fetch = FakeFetch()
+    engine = make_engine(fetch, keep_results=False)
+    pipeline = StagedPipeline(engine, write, scaffold, on_written, queue_size=queue_size, write_workers=2)
+    results = pipeline.run(urls, todo, {}, backlog)
+
+    assert [r['url'] for r in results] == [urls[i] for i in todo]
+    assert sorted(written) == list(range(len(urls)))
+    assert fetch.calls[f"{5:011d}"] == 1
+    assert statuses[7] == WRITE_FAILED
+    assert pipeline.summary == {
+        WRITE_WRITTEN: sum(1 for i in range(len(urls)) if i % 2 == 0),
+        WRITE_UNCHANGED: sum(1 for i in range(len(urls)) if i % 2 and i != 7),
+        WRITE_FAILED: 1, 'missing': 0}
+
+
+def test_staged_pipeline_backpressure_does_not_hold_engine_callback_lock():
+    engine = make_engine(FakeFetch(), keep_results=False, on_result=lambda *a: None)
+    lock_free = []
+
+    def write(idx, r):
+        time.sleep(0.01)  # writer chậm => hàng đợi (1 chỗ) đầy, worker chờ trong put
+        got = engine._cb_lock.acquire(timeout=1)
+        if got:
+            engine._cb_lock.release()
+        lock_free.append(got)
+        return True
+
+    urls = [url(i) for i in range(12)]
+    StagedPipeline(engine, write, queue_size=1, write_workers=1).run(urls, list(range(len(urls))))
+    assert len(lock_free) == len(urls) and all(lock_free)
+    assert engine.after_result is None
+
+
+def test_staged_pipeline_reports_missing_folders():
+    urls = [url(i) for i in range(4)]
+
+    def scaffold(on_folder):
+        on_folder(0, '/x/0', True)
+        raise OSError('không tạo được thư mục')
+
+    statuses = {}
+    pipeline = StagedPipeline(make_engine(FakeFetch()), lambda idx, r: True, scaffold,
+                              lambda idx, status, err: statuses.__setitem__(idx, status), queue_size=1)
+    pipeline.run(urls, list(range(4)))
+    assert statuses == {0: WRITE_WRITTEN, 1: 'missing', 2: 'missing', 3: 'missing'}
+    assert isinstance(pipeline.scaffold_error, OSError)
+
+
+class FakeSession:
+    """YDLSession giả: video trong `throttle_once` bị 429 ở lần trích xuất đầu."""
+
+    def __init__(self, calls, throttle_once=()):
+        self.calls = calls
+        self.throttle_once = throttle_once
+
+    def extract_metadata(self, url, captions_only=True):
+        vid = extract_video_id(url)
+        self.calls.append(vid)
+        if vid in self.throttle_once and self.calls.count(vid) == 1:
+            raise RuntimeError('ERROR: HTTP Error 429: Too Many Requests')
+        return {'id': vid, 'title': f"Video {vid}", 'duration': 1}, None
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def results_path(tmp_path):
+    yield str(tmp_path / 'youtube_results.json')
+    close_shared_results_stores()
+
+
+def test_aprocess_urls_retries_throttled_videos_and_stores_successes(results_path, monkeypatch):
+    monkeypatch.setattr(lctc_pipeline_core, 'fetch_caption_texts', lambda info, langs, all_langs: [])
+    calls = []
+    urls = [url(0), url(1), url(0, "https://www.youtube.com/watch?v={}")]
+    run = lambda: asyncio.run(aprocess_urls_keep_order(  # noqa: E731
+        urls, results_path=results_path, rate=fast_rate(), langs='vi',
+        session_factory=lambda: FakeSession(calls, throttle_once={f"{1:011d}"})))
+    results = run()
+    assert [r['status'] for r in results] == ['success'] * 3 and results[2]['url'] == urls[2]
+    assert sorted(calls) == [f"{0:011d}", f"{1:011d}", f"{1:011d}"]
+    assert [r['url'] for r in run()] == urls and len(calls) == 3  # lượt sau: cache hit từ kho
+
+
+def test_aprocess_urls_downloads_captions_off_the_event_loop_concurrently(results_path, monkeypatch):
+    active, peak, threads = [0], [0], set()
+    lock = threading.Lock()
+
+    def slow_captions(info, langs, all_langs):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            threads.add(threading.current_thread().name)
+        time.sleep(0.2)
+        with lock:
+            active[0] -= 1
+        return []
+
+    async def main():
+        ticks = []
+
+        async def heartbeat():
+            while True:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.005)
+
+        beat = asyncio.ensure_future(heartbeat())
+        results = await aprocess_urls_keep_order(
+            [url(i) for i in range(4)], concurrency=4, results_path=results_path, rate=fast_rate(),
+            session_factory=lambda: FakeSession([]))
+        beat.cancel()
+        return results, ticks
+
+    monkeypatch.setattr(lctc_pipeline_core, 'fetch_caption_texts', slow_captions)
+    results, ticks = asyncio.run(main())
+    assert all(r['status'] == 'success' for r in results)
+    assert peak[0] > 1 and all(name.startswith('lctc-async-captions') for name in threads)
+    assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.1  # loop không bị chặn khi tải phụ đề
@@ -0,0 +1,80 @@
+import pytest
+
+from lctc_pipeline_core import HTTPStatusError, RateController, classify_error
+
+
+@pytest.mark.parametrize('err, kind', [
+    (None, None),
+    ('ERROR: [youtube] abc: HTTP Error 429: Too Many Requests', 'throttle'),
+    ('Too Many Requests', 'throttle'),
+    (HTTPStatusError(503, 'u'), 'server'),
+    ('ERROR: HTTP Error 502: Bad Gateway', 'server'),
+    (HTTPStatusError(404, 'u'), None),
+    ('Video có 4290 lượt xem', None),
+])
+def test_classify_error(err, kind):
+    assert classify_error(err) == kind
+
+
+def controller(**kwargs):
+    opts = dict(rate=1.0, min_rate=0.1, max_rate=1.1, burst=2, increase=0.05, decrease=0.5,
+                cooldown=10, max_cooldown=25, server_decrease=0.75, server_cooldown=3)
+    opts.update(kwargs)
+    return RateController(**opts)
+
+
+def test_success_increases_additively_up_to_max_rate():
+    rc = controller()
+    rc.report(None)
+    assert rc.rate == pytest.approx(1.05)
+    for _ in range(5):
+        rc.report(None)
+    assert rc.rate == pytest.approx(1.1)
+
+
+def test_throttle_backs_off_multiplicatively_with_growing_cooldown():
+    rc = controller()
+    cooldowns = []
+    for _ in range(4):
+        assert rc.report('HTTP Error 429') == 'throttle'
+        cooldowns.append(rc.cooldown_remaining())
+    assert rc.rate == pytest.approx(0.1)  # 1 -> .5 -> .25 -> .125 -> chạm min_rate
+    assert [round(c) for c in cooldowns] == [10, 20, 25, 25]  # gấp đôi mỗi lần, tối đa max_cooldown
+    assert rc.snapshot()['strikes'] == 4
+    rc.report(None)
+    assert rc.snapshot()['strikes'] == 0
+
+
+def test_retry_after_header_extends_cooldown():
+    rc = controller()
+    rc.report(HTTPStatusError(429, 'u', {'Retry-After': '120'}))
+    assert rc.cooldown_remaining() == pytest.approx(120, abs=1)
+    rc = controller()
+    rc.report(HTTPStatusError(429, 'u', {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}))
+    assert rc.cooldown_remaining() == pytest.approx(10, abs=1)
+
+
+def test_server_errors_back_off_gently():
+    rc = controller()
+    assert rc.report(HTTPStatusError(500, 'u')) == 'server'
+    assert rc.rate == pytest.approx(0.75)
+    assert rc.cooldown_remaining() == pytest.approx(3, abs=1)
+    assert rc.snapshot()['strikes'] == 0
+
+
+def test_token_bucket_allows_burst_then_waits():
+    rc = controller(rate=0.5, burst=3)
+    assert rc._reserve() == (0.0, '')  # token ban đầu
+    delay, reason = rc._reserve()
+    assert reason == 'rate' and 0 < delay <= 2
+    rc.on_throttle()
+    assert rc._reserve()[1] == 'cooldown'
+
+
+def test_acquire_stops_when_cancelled_during_cooldown():
+    rc = controller()
+    rc.on_throttle()
+    waits = []
+    stop = iter([False, True])
+    assert rc.acquire(should_stop=lambda: next(stop), on_wait=lambda d, r: waits.append(r)) is False
+    assert waits == ['cooldown']
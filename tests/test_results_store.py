@@ -0,0 +1,123 @@
+import json
+import os
+
+import pytest
+
+from lctc_pipeline_core import (JsonlResultsStore, ResultsIndex, ResultsStore, SqliteResultsStore,
+                                open_results_store)
+
+
+def result(vid, title='t', **extra):
+    return {'video_id': vid, 'url': f"https://www.youtube.com/watch?v={vid}", 'title': title,
+            'status': 'success', 'subtitles': f"phụ đề {vid}", **extra}
+
+
+@pytest.fixture(params=['jsonl', 'sqlite'])
+def backend(request):
+    return request.param
+
+
+def test_results_store_is_abstract():
+    with pytest.raises(TypeError):
+        ResultsStore('x')
+
+
+def test_round_trip_keeps_order_and_survives_reopen(tmp_path, backend):
+    legacy = str(tmp_path / 'youtube_results.json')
+    items = [result('aaaaaaaaaaa'), result('bbbbbbbbbbb'), result('ccccccccccc')]
+    with open_results_store(legacy, backend) as store:
+        assert store.merge(items) == 3
+        assert store.merge([result('aaaaaaaaaaa', title='khác')]) == 0  # không ghi đè bản cũ
+        assert 'bbbbbbbbbbb' in store and 'zzzzzzzzzzz' not in store
+        assert store['bbbbbbbbbbb'] == items[1]
+    with open_results_store(legacy, backend) as store:
+        assert len(store) == 3
+        assert store.keys() == ['aaaaaaaaaaa', 'bbbbbbbbbbb', 'ccccccccccc']
+        assert list(store.values()) == items
+        assert store.get('zzzzzzzzzzz') is None
+        with pytest.raises(KeyError):
+            store['zzzzzzzzzzz']
+
+
+def test_replace_keeps_position(tmp_path, backend):
+    legacy = str(tmp_path / 'youtube_results.json')
+    with open_results_store(legacy, backend) as store:
+        store.merge([result('aaaaaaaaaaa'), result('bbbbbbbbbbb')])
+        assert store.add(result('aaaaaaaaaaa', title='mới'), replace=True)
+        assert store.keys() == ['aaaaaaaaaaa', 'bbbbbbbbbbb']
+        assert store['aaaaaaaaaaa']['title'] == 'mới'
+    with open_results_store(legacy, backend) as store:
+        assert store['aaaaaaaaaaa']['title'] == 'mới'
+        assert len(store) == 2
+
+
+def test_jsonl_compact_drops_replaced_records(tmp_path):
+    path = str(tmp_path / 'youtube_results.jsonl')
+    with JsonlResultsStore(path) as store:
+        store.merge([result('aaaaaaaaaaa'), result('bbbbbbbbbbb')])
+        for i in range(3):
+            store.add(result('aaaaaaaaaaa', title=f"v{i}"), replace=True)
+        assert store.garbage == 3
+        size = os.path.getsize(path)
+        store.compact()
+        assert store.garbage == 0
+        assert os.path.getsize(path) < size
+        assert store['aaaaaaaaaaa']['title'] == 'v2'
+        store.add(result('ccccccccccc'))  # ghi tiếp sau khi compact
+    with JsonlResultsStore(path) as store:
+        assert store.keys() == ['aaaaaaaaaaa', 'bbbbbbbbbbb', 'ccccccccccc']
+        assert store['aaaaaaaaaaa']['title'] == 'v2'
+
+
+def test_jsonl_ignores_truncated_last_record(tmp_path):
+    path = str(tmp_path / 'youtube_results.jsonl')
+    with JsonlResultsStore(path) as store:
+        store.merge([result('aaaaaaaaaaa')])
+    os.remove(path + '.idx')
+    with open(path, 'ab') as f:
+        f.write(b'{"k": "bbbbbbbbbbb", "v": {"tit')  # crash giữa lúc ghi
+    with JsonlResultsStore(path) as store:
+        assert store.keys() == ['aaaaaaaaaaa']
+        store.add(result('ccccccccccc'))
+    with JsonlResultsStore(path) as store:
+        assert store.keys() == ['aaaaaaaaaaa', 'ccccccccccc']
+
+
+def test_legacy_json_import_and_export(tmp_path, backend):
+    legacy = tmp_path / 'youtube_results.json'
+    old = [result('aaaaaaaaaaa'), result('bbbbbbbbbbb'), result('aaaaaaaaaaa', title='trùng')]
+    legacy.write_text(json.dumps(old, ensure_ascii=False, indent=2), encoding='utf-8')
+    with open_results_store(str(legacy), backend) as store:
+        assert store.keys() == ['aaaaaaaaaaa', 'bbbbbbbbbbb']
+        assert store['aaaaaaaaaaa']['title'] == 't'  # trùng khóa: giữ bản đầu tiên
+        store.add(result('ccccccccccc'))
+        index = ResultsIndex(store)
+        out = tmp_path / 'export.json'
+        assert index.export_legacy_json(str(out)) == 3
+    assert json.loads(legacy.read_text(encoding='utf-8')) == old  # file cũ giữ nguyên
+    assert json.loads(out.read_text(encoding='utf-8')) == [old[0], old[1], result('ccccccccccc')]
+
+
+def test_legacy_import_happens_only_once(tmp_path):
+    legacy = tmp_path / 'youtube_results.json'
+    legacy.write_text(json.dumps([result('aaaaaaaaaaa')]), encoding='utf-8')
+    with open_results_store(str(legacy), 'jsonl') as store:
+        assert len(store) == 1
+    legacy.write_text(json.dumps([result('bbbbbbbbbbb')]), encoding='utf-8')
+    with open_results_store(str(legacy), 'jsonl') as store:
+        assert store.keys() == ['aaaaaaaaaaa']
+
+
+def test_index_sees_writes_from_another_handle(tmp_path):
+    path = str(tmp_path / 'youtube_results.jsonl')
+    with JsonlResultsStore(path) as store:
+        index = ResultsIndex(store, max_bodies=1)
+        index.merge([result('aaaaaaaaaaa'), result('bbbbbbbbbbb')])
+        assert index['aaaaaaaaaaa']['title'] == 't'  # ngoài LRU: đọc lại từ kho
+        with JsonlResultsStore(path) as other:
+            other.add(result('ccccccccccc'))
+        assert index.refresh()
+        assert 'ccccccccccc' in index
+        index.compact()
+        assert index.keys() == ['aaaaaaaaaaa', 'bbbbbbbbbbb', 'ccccccccccc']
+
@@ -0,0 +1,77 @@
+import os
+
+from lctc_pipeline_core import JsonlResultsStore, RunJournal, find_run_journal
+
+PARAMS = {'prefix': 'LCTC', 'start': 1, 'pad_width': 2}
+URLS = [f"https://youtu.be/{c * 11}" for c in 'abcd']
+
+
+def result(i, **extra):
+    vid = URLS[i][-11:]
+    return {'url': URLS[i], 'video_id': vid, 'title': f"Video {i}", 'status': 'success',
+            'subtitles': f"phụ đề {i}", **extra}
+
+
+def test_resume_after_truncated_last_line(tmp_path):
+    dest = str(tmp_path)
+    with RunJournal(dest, PARAMS, URLS) as journal:
+        journal.mark_stage('folders')
+        journal.record_result(0, result(0))
+        journal.record_result(1, result(1))
+        journal.mark_assigned(0)
+        path = journal.path
+    with open(path, 'ab') as f:
+        f.write(b'{"t": "result", "i": 2, "r": {"url": "htt')  # crash giữa lúc ghi
+
+    assert find_run_journal(dest, PARAMS, URLS) == path
+    with RunJournal(dest, PARAMS, URLS) as journal:
+        assert journal.resumed
+        assert journal.stage_done('folders') and not journal.stage_done('fetched')
+        assert journal.pending() == [2, 3]
+        assert journal.assigned == {0}
+        assert journal.results[1] == result(1)
+        assert 'subtitles' not in journal.results[0]  # đã gán: chỉ giữ bản rút gọn
+        journal.record_result(2, result(2))
+    with open(path, 'rb') as f:
+        assert all(line.endswith(b'\n') for line in f)  # phần cụt đã được cắt trước khi ghi tiếp
+    with RunJournal(dest, PARAMS, URLS) as journal:
+        assert journal.pending() == [3]
+        assert journal.results[2] == result(2)
+
+
+def test_other_run_or_no_resume_starts_over(tmp_path):
+    dest = str(tmp_path)
+    with RunJournal(dest, PARAMS, URLS) as journal:
+        journal.record_result(0, result(0))
+    with RunJournal(dest, dict(PARAMS, start=5), URLS) as journal:
+        assert not journal.resumed and journal.pending() == [0, 1, 2, 3]
+    with RunJournal(dest, PARAMS, URLS, resume=False) as journal:
+        assert not journal.resumed and journal.pending() == [0, 1, 2, 3]
+
+
+def test_stored_results_are_journaled_by_reference(tmp_path):
+    dest = str(tmp_path)
+    with JsonlResultsStore(str(tmp_path / 'youtube_results.jsonl')) as store:
+        store.merge([result(0), result(1)])
+        with RunJournal(dest, PARAMS, URLS, store=store) as journal:
+            journal.record_result(0, result(0), stored_key=URLS[0][-11:])
+            journal.record_result(1, result(1), stored_key=URLS[1][-11:])
+            journal.record_result(2, result(2), stored_key='khong-co-trong-kho')
+            journal.record_result(3, {'url': URLS[3], 'status': 'error', 'error': 'HTTP Error 429'})
+            journal.mark_assigned(0)
+            path = journal.path
+        with open(path, encoding='utf-8') as f:
+            assert 'phụ đề' not in f.read()
+
+        with RunJournal(dest, PARAMS, URLS, store=store) as journal:
+            assert journal.results[0] == {'url': URLS[0], 'status': 'success'}
+            assert journal.results[1] == result(1)  # nội dung lấy lại từ kho
+            assert journal.results[3]['error'] == 'HTTP Error 429'
+            assert journal.pending() == [2]  # tham chiếu không còn trong kho: tải lại
+
+
+def test_finish_removes_journal(tmp_path):
+    journal = RunJournal(str(tmp_path), PARAMS, URLS)
+    journal.finish()
+    assert not os.path.exists(journal.path)
+    assert find_run_journal(str(tmp_path), PARAMS, URLS) is None
@@ -0,0 +1,48 @@
+import os
+
+from lctc_pipeline_core import scaffold_folders
+
+SUBFOLDERS = ('VIDEO', 'AUDIO')
+
+
+def files_for(name):
+    return [f"{name}.docx", 'MO TA.docx']
+
+
+def scaffold(dest, names, **kwargs):
+    made = []
+
+    def make_file(path):
+        made.append(os.path.relpath(path, dest))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('mới')
+
+    return scaffold_folders(str(dest), names, SUBFOLDERS, files_for, make_file, workers=4, **kwargs), made
+
+
+def test_scaffold_creates_every_folder_and_reports_each_once(tmp_path):
+    names = [f"LCTC-{i}" for i in range(1, 21)]
+    done = []
+    counts, made = scaffold(tmp_path, names, on_folder=lambda i, path, created: done.append((i, path, created)))
+    assert counts == (20, 20, 0)
+    assert sorted(done) == [(i, str(tmp_path / n), True) for i, n in enumerate(names)]
+    assert len(made) == 40
+    for n in names:
+        assert sorted(os.listdir(tmp_path / n)) == sorted([*SUBFOLDERS, *files_for(n)])
+
+
+def test_scaffold_only_fills_in_what_is_missing(tmp_path):
+    (tmp_path / 'LCTC-1' / 'VIDEO').mkdir(parents=True)
+    (tmp_path / 'LCTC-1' / 'LCTC-1.docx').write_text('đã sửa', encoding='utf-8')
+    counts, made = scaffold(tmp_path, ['LCTC-1', 'LCTC-2'])
+    assert counts == (2, 1, 1)
+    assert (tmp_path / 'LCTC-1' / 'LCTC-1.docx').read_text(encoding='utf-8') == 'đã sửa'
+    assert sorted(made) == [os.path.join('LCTC-1', 'MO TA.docx'), os.path.join('LCTC-2', 'LCTC-2.docx'),
+                            os.path.join('LCTC-2', 'MO TA.docx')]
+    assert (tmp_path / 'LCTC-1' / 'AUDIO').is_dir()
+    assert scaffold(tmp_path, ['LCTC-1', 'LCTC-2']) == ((2, 0, 2), [])
+
+
+def test_scaffold_stops_when_cancelled(tmp_path):
+    counts, made = scaffold(tmp_path, ['LCTC-1', 'LCTC-2'], should_stop=lambda: True)
+    assert counts == (2, 0, 0) and made == [] and os.listdir(tmp_path) == []
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from lctc_pipeline_core import TemplateFile
+
+DATA = b'PK\x03\x04 template' * 100
+
+
+@pytest.fixture
+def template(tmp_path):
+    path = tmp_path / 'template.docx'
+    path.write_bytes(DATA)
+    tpl = TemplateFile(str(path), hardlink=False)
+    yield tpl
+    tpl.close()
+
+
+def fail(*args):
+    raise OSError('không hỗ trợ')
+
+
+def test_falls_back_to_buffered_write_and_remembers_unsupported_methods(template, tmp_path, monkeypatch):
+    monkeypatch.setattr(template, '_clone', fail)
+    monkeypatch.setattr(template, '_copy_range', fail)
+    for i in range(3):
+        assert template.instantiate(str(tmp_path / f"{i}.docx")) == 'write'
+        assert (tmp_path / f"{i}.docx").read_bytes() == DATA
+    assert template._unsupported == {'reflink', 'copy_file_range'}
+    assert template.stats == {'write': 3}
+    monkeypatch.undo()
+    template.refresh()  # lượt mới: thử lại các cách nhanh
+    assert not template._unsupported
+
+
+@pytest.mark.skipif(not hasattr(os, 'copy_file_range'), reason="cần os.copy_file_range")
+def test_copy_file_range_is_used_when_reflink_fails(template, tmp_path, monkeypatch):
+    monkeypatch.setattr(template, '_clone', fail)
+    assert template.instantiate(str(tmp_path / 'a.docx')) in ('copy_file_range', 'write')
+    assert (tmp_path / 'a.docx').read_bytes() == DATA
+
+
+def test_overwrite_never_writes_through_a_hardlink(template, tmp_path):
+    template.hardlink = True
+    dst = tmp_path / 'a.docx'
+    assert template.instantiate(str(dst)) == 'hardlink'
+    assert os.path.samefile(dst, template.path)
+    template.hardlink = False
+    assert template.instantiate(str(dst)) != 'hardlink'  # dst đang là hardlink của template: tách ra trước khi ghi
+    assert not os.path.samefile(dst, template.path)
+    assert dst.read_bytes() == DATA and open(template.path, 'rb').read() == DATA
+
+
+def test_refresh_reloads_changed_template_and_missing_template_gives_empty_files(template, tmp_path):
+    with open(template.path, 'wb') as f:
+        f.write(b'PK new')
+    os.utime(template.path, ns=(1, 1))
+    assert template.refresh() and template.data == b'PK new'
+    os.remove(template.path)
+    assert not template.refresh() and not template.exists
+    assert template.instantiate(str(tmp_path / 'b.docx')) == 'empty'
+    assert (tmp_path / 'b.docx').read_bytes() == b''
@@ -0,0 +1,67 @@
+import threading
+
+from lctc_pipeline_core import LogSink, ProgressBus, UrlList, extract_video_id
+
+
+def test_log_sink_keeps_only_the_newest_lines_and_groups_by_tag(tmp_path):
+    sink = LogSink(max_lines=3, path=str(tmp_path / 'lctc.log'))
+    for i in range(5):
+        sink.put(f"dòng {i}", 'green' if i < 4 else 'red')
+    assert sink.drain() == [("dòng 2\ndòng 3\n", 'green'), ("dòng 4\n", 'red')]
+    assert sink.drain() == []
+    sink.close()
+    with open(tmp_path / 'lctc.log', encoding='utf-8') as f:
+        assert [line.split(' ', 2)[-1] for line in f.read().splitlines()] == [f"dòng {i}" for i in range(5)]
+
+
+def test_log_sink_accepts_lines_from_many_threads():
+    sink = LogSink(max_lines=10_000, path=None)
+    threads = [threading.Thread(target=lambda n=n: [sink.put(f"{n}-{i}") for i in range(200)]) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    (text, tag), = sink.drain()
+    assert tag is None and len(text.splitlines()) == 800
+
+
+def test_progress_bus_coalesces_to_the_latest_event():
+    bus = ProgressBus()
+    assert bus.poll() is None
+    for i in range(1, 1001):
+        bus.publish('fetch', i, 1000, f"video {i}")
+    bus.publish('folders', 5, 10)
+    assert bus.poll() == ('folders', 5, 10, '')
+    assert bus.poll() is None  # không có gì mới kể từ lần poll trước
+    assert bus.latest('fetch') == ('fetch', 1000, 1000, 'video 1000')
+    bus.publish('fetch', 1, 1)
+    assert bus.poll() == ('fetch', 1, 1, '')
+    bus.clear()
+    assert bus.poll() is None and bus.latest('fetch') is None
+
+
+def test_progress_bus_publish_from_many_threads():
+    bus = ProgressBus()
+    stages = ('folders', 'fetch', 'assign')
+    threads = [threading.Thread(target=lambda s=s: [bus.publish(s, i, 500) for i in range(1, 501)]) for s in stages]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for s in stages:
+        assert bus.latest(s) == (s, 500, 500, '')
+    assert bus.poll()[1:3] == (500, 500)
+
+
+def test_url_list_dedupes_by_video_id_and_keeps_first_order():
+    urls = UrlList(extract_video_id)
+    first = ['https://youtu.be/aaaaaaaaaaa', 'https://www.youtube.com/watch?v=bbbbbbbbbbb']
+    assert urls.extend(first) == first
+    added = urls.extend(['https://m.youtube.com/watch?v=aaaaaaaaaaa&t=5', 'https://youtu.be/ccccccccccc',
+                         'https://youtu.be/ccccccccccc?si=x', 'không phải url', 'không phải url'])
+    assert added == ['https://youtu.be/ccccccccccc', 'không phải url']  # chỉ các dòng mới cần chèn vào widget
+    assert list(urls) == first + added and len(urls) == 4
+    assert 'https://www.youtube.com/shorts/bbbbbbbbbbb' in urls
+    assert urls.index('https://youtu.be/ccccccccccc?si=y') == 2 and urls[0] == first[0]
+    urls.clear()
+    assert len(urls) == 0 and urls.add(first[0])
@@ -0,0 +1,38 @@
+import pytest
+
+from lctc_pipeline_core import VideoRef, extract_video_id, parse_video_url
+
+VID = 'dQw4w9WgXcQ'
+WATCH = f"https://www.youtube.com/watch?v={VID}"
+
+
+@pytest.mark.parametrize('url', [
+    f"https://www.youtube.com/watch?v={VID}",
+    f"http://youtube.com/watch?v={VID}&t=42s",
+    f"https://www.youtube.com/watch?feature=share&v={VID}",  # v không phải tham số đầu
+    f"https://m.youtube.com/watch?v={VID}",
+    f"https://music.youtube.com/watch?v={VID}&list=RD123",
+    f"https://www.youtube.com/shorts/{VID}",
+    f"https://www.youtube.com/live/{VID}?si=abc",
+    f"https://www.youtube.com/embed/{VID}",
+    f"https://www.youtube-nocookie.com/embed/{VID}?start=10",
+    f"https://youtu.be/{VID}?si=xyz",
+    f"youtu.be/{VID}",
+    f"  {WATCH}  ",
+])
+def test_parse_video_url_normalizes_variants(url):
+    assert parse_video_url(url) == VideoRef(VID, WATCH, url)
+    assert extract_video_id(url) == VID
+
+
+@pytest.mark.parametrize('url', [
+    '',
+    'không phải url',
+    'https://www.youtube.com/watch?v=short',
+    f"https://www.youtube.com/watch?v={VID}X",  # id dài hơn 11 ký tự
+    'https://www.youtube.com/playlist?list=PL123abc',
+    'https://www.youtube.com/@kenh/videos',
+    f"https://example.com/watch?v={VID}",
+])
+def test_parse_video_url_rejects_non_video(url):
+    assert parse_video_url(url) is None
@@ -0,0 +1,33 @@
+import os
+
+from lctc_pipeline_core import write_bytes_if_changed, write_text_if_changed
+
+
+def test_write_text_if_changed_is_idempotent(tmp_path):
+    path = str(tmp_path / 'sub.txt')
+    assert write_text_if_changed(path, 'Xin chào\ncác bạn')
+    os.utime(path, ns=(1, 1))
+    assert not write_text_if_changed(path, 'Xin chào\ncác bạn')
+    assert os.stat(path).st_mtime_ns == 1  # không đổi => không ghi lại
+    with open(path, encoding='utf-8') as f:
+        assert f.read() == 'Xin chào\ncác bạn'
+    assert write_text_if_changed(path, 'Xin chào\ncác bạn!')
+    assert os.listdir(tmp_path) == ['sub.txt']  # không còn file tạm
+
+
+def test_write_bytes_if_changed_compares_content_not_just_size(tmp_path):
+    path = str(tmp_path / 'info.txt')
+    assert write_bytes_if_changed(path, b'abc')
+    assert write_bytes_if_changed(path, b'abd')
+    assert not write_bytes_if_changed(path, b'abd')
+    with open(path, 'rb') as f:
+        assert f.read() == b'abd'
+
+
+def test_write_replaces_instead_of_writing_through_hardlinks(tmp_path):
+    original = tmp_path / 'template.txt'
+    original.write_bytes(b'template')
+    link = tmp_path / 'sub.txt'
+    os.link(original, link)
+    assert write_bytes_if_changed(str(link), b'new')
+    assert original.read_bytes() == b'template' and link.read_bytes() == b'new'